@@ -5,19 +5,45 @@ FastAPI HTTP 服务 - GPU 加速视频渲染
 """
 
 import os
+import time
+import asyncio
+import tarfile
+import tempfile
 from pathlib import Path
 from typing import List, Optional
 from datetime import datetime
 from fastapi import FastAPI, HTTPException, Request, BackgroundTasks
-from fastapi.responses import PlainTextResponse, JSONResponse
+from starlette.background import BackgroundTask
+from fastapi.responses import FileResponse, PlainTextResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.exceptions import RequestValidationError
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field, validator
 import logging
 
 from src.api_renderer import ApiVlogRenderer
+from src.cancellation import CancelRegistry, CancelToken, RenderCancelled
+from src.config import TemplateConfig
 from src.incremental_renderer import IncrementalRenderer
+from src.cost_estimator import CostModel
+from src.gl_engine import RenderEngine
+from src.session_actor import SessionActorPool
+from src.load_controller import LoadController
+from src.media_probe import check_renderable, probe_media
+from src.memory_budget import MEMORY_EXCEEDED, MemoryBudget, MemoryUnavailable
+from src.mezzanine import MezzanineCache
+from src.output_store import LocalOutputStore, get_output_store
+from src.segment_cache import SegmentCache
 from src.session_manager import SessionManager
+from src.session_store import SessionLeased
+from src.shaders import use_software_gl
+from src.transition_catalog import TransitionCatalog
+from src.upload_manager import (
+    IMAGE_EXTENSIONS,
+    VIDEO_EXTENSIONS,
+    UploadManager,
+)
+from src.workspace import Workspace
 
 # 配置日志
 logging.basicConfig(
@@ -25,15 +51,37 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# AUTOVLOG_SOFTWARE_GL=1：使用 Mesa 软件 GL（无 GPU 环境，如压测和 CI）
+if os.getenv("AUTOVLOG_SOFTWARE_GL") == "1":
+    use_software_gl()
+
 # 创建 FastAPI 应用
 app = FastAPI(title="GPU Video Renderer API", version="1.0.0")
 
+# 渲染截止时间（秒，0 表示不限），请求中的 timeout 优先
+RENDER_TIMEOUT = float(os.getenv("AUTOVLOG_RENDER_TIMEOUT", "0")) or None
+# 检查客户端是否断开的间隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.25
+
 # 输出目录配置
 OUTPUT_DIR = Path("outputs")
 OUTPUT_DIR.mkdir(exist_ok=True)
 
-# 挂载静态文件服务
-app.mount("/videos", StaticFiles(directory=str(OUTPUT_DIR)), name="videos")
+# 输出存储（AUTOVLOG_OUTPUT_STORE=s3 时写入对象存储，多节点共享）
+output_store = get_output_store(OUTPUT_DIR)
+
+# 挂载静态文件服务（本地输出存储）
+if isinstance(output_store, LocalOutputStore):
+    app.mount("/videos", StaticFiles(directory=str(OUTPUT_DIR)), name="videos")
+
+# 流式上传的视频按全局渲染参数预解码（一次性渲染与增量追加均可复用）
+_global_config = TemplateConfig.load_global_config()
+UploadManager.configure_prewarm(
+    _global_config["width"],
+    _global_config["height"],
+    _global_config["fps"],
+    _global_config["video_duration"] + _global_config["transition_duration"],
+)
 
 
 # 自定义异常处理器：修复包含二进制数据和异常对象的验证错误
@@ -85,6 +133,80 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     )
 
 
+def validate_image_file(v):
+    """校验图片路径，上传句柄解析为本地路径（图片需上传完成）"""
+    upload_id = UploadManager.parse_handle(v)
+    if upload_id is not None:
+        try:
+            info = UploadManager.get(upload_id)
+        except FileNotFoundError as e:
+            raise ValueError(str(e))
+        if info.status != "completed":
+            raise ValueError(f"图片尚未上传完成: {v}")
+        v = info.path
+    if not os.path.exists(v):
+        raise ValueError(f"图片文件不存在: {v}")
+    if not v.lower().endswith(IMAGE_EXTENSIONS):
+        raise ValueError(f"不支持的图片格式: {v}")
+    return v
+
+
+def validate_video_file(v):
+    """校验视频路径，上传句柄解析为本地路径（视频可在上传过程中使用）"""
+    upload_id = UploadManager.parse_handle(v)
+    if upload_id is not None:
+        try:
+            info = UploadManager.get(upload_id)
+        except FileNotFoundError as e:
+            raise ValueError(str(e))
+        if info.status == "error":
+            raise ValueError(f"视频上传失败: {info.error}")
+        if info.status != "completed":
+            # 上传中的文件无法完整探测，由渲染时的解码器处理
+            return info.path
+        v = info.path
+    if not os.path.exists(v):
+        raise ValueError(f"视频文件不存在: {v}")
+    if not v.lower().endswith(VIDEO_EXTENSIONS):
+        raise ValueError(f"不支持的视频格式: {v}")
+    return v
+
+
+def require_renderable(image_path: Optional[str] = None, video_paths=()):
+    """
+    探测素材，拒绝无法解析或超出限制的文件（在占用渲染资源前返回 400）
+
+    ffprobe 是阻塞的子进程调用，不在请求体校验中执行（校验运行在事件循环上）；
+    异步接口通过 run_in_threadpool 调用。只探测容器，关键帧间隔由渲染时补充。
+    """
+    try:
+        if image_path:
+            check_renderable(probe_media(image_path, keyframes=False), require_video=False)
+        for path in video_paths:
+            if UploadManager.is_receiving(path):
+                # 上传中的文件无法完整探测，由渲染时的解码器处理
+                continue
+            check_renderable(probe_media(path, keyframes=False))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def validate_render_profile(v):
+    """校验渲染档位是否在 config.yaml 的 profiles 中定义"""
+    if v is not None and v not in TemplateConfig.list_available_profiles():
+        raise ValueError(f"渲染档位不存在: {v}")
+    return v
+
+
+def validate_rendition_names(v):
+    """校验附加输出规格是否在 config.yaml 的 renditions 中定义"""
+    available = TemplateConfig.list_available_renditions()
+    for name in v or []:
+        if name not in available:
+            raise ValueError(f"输出规格不存在: {name}")
+    return v
+
+
 class RenderRequest(BaseModel):
     """渲染请求模型"""
 
@@ -93,45 +215,132 @@ class RenderRequest(BaseModel):
     video_paths: List[str] = Field(
         ..., min_items=1, max_items=5, description="视频路径列表（1-5个）"
     )
+    profile: Optional[str] = Field(
+        None, description="渲染档位（可选，如 draft 低分辨率预览）"
+    )
+    renditions: Optional[List[str]] = Field(
+        None, description="附加输出规格（可选，如 720p/preview），与主输出一次渲染生成"
+    )
+    interactive: bool = Field(
+        True, description="交互任务（用户在等待结果），高负载时不降低分辨率"
+    )
+    job_id: Optional[str] = Field(
+        None, description="任务ID（可选，用于 /api/render/cancel/{job_id} 取消）"
+    )
+    timeout: Optional[float] = Field(
+        None, gt=0, description="截止时间（秒，可选），超时后取消渲染"
+    )
+
+    @validator("profile")
+    def validate_profile(cls, v):
+        return validate_render_profile(v)
+
+    @validator("renditions")
+    def validate_renditions(cls, v):
+        return validate_rendition_names(v)
 
     @validator("image_path")
     def validate_image_path(cls, v):
-        if not os.path.exists(v):
-            raise ValueError(f"图片文件不存在: {v}")
-        if not v.lower().endswith((".jpg", ".jpeg", ".png", ".bmp")):
-            raise ValueError(f"不支持的图片格式: {v}")
-        return v
+        return validate_image_file(v)
 
     @validator("video_paths")
     def validate_video_paths(cls, v):
-        for path in v:
-            if not os.path.exists(path):
-                raise ValueError(f"视频文件不存在: {path}")
-            if not path.lower().endswith((".mp4", ".avi", ".mov", ".mkv")):
-                raise ValueError(f"不支持的视频格式: {path}")
-        return v
+        return [validate_video_file(path) for path in v]
+
+
+def decide_degradation(template: str, profile: Optional[str], interactive: bool = True):
+    """根据当前负载为任务选择降级等级"""
+    config = TemplateConfig(template, profile)
+    return LoadController.decide(
+        config.transitions,
+        config.global_config["width"],
+        config.global_config["height"],
+        interactive,
+    )
+
+
+def new_cancel_token(job_id: Optional[str], timeout: Optional[float]) -> CancelToken:
+    """创建任务的取消令牌（未指定截止时间时使用 AUTOVLOG_RENDER_TIMEOUT）"""
+    return CancelToken(timeout or RENDER_TIMEOUT, job_id)
+
+
+async def run_cancellable(http_request: Request, token: CancelToken, func, *args):
+    """
+    在线程池中执行渲染，客户端断开或超过截止时间时取消
+
+    取消后继续等待渲染线程完成清理（终止编码器、关闭解码器、删除临时文件）。
+    """
+    with CancelRegistry.scope(token):
+        task = asyncio.ensure_future(run_in_threadpool(func, *args))
+        while not task.done():
+            await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if task.done() or token.cancelled:
+                continue
+            if await http_request.is_disconnected():
+                logger.warning(f"客户端断开，取消渲染 {token.job_id or ''}")
+                token.cancel("客户端断开")
+        return task.result()
+
+
+def cancelled_error(token: CancelToken) -> HTTPException:
+    """取消对应的响应（超时 504，超过单任务内存上限 503，断开或显式取消 499）"""
+    logger.warning(f"渲染已取消 {token.job_id or ''}: {token.reason}")
+    if token.timed_out:
+        status_code = 504
+    elif token.reason.startswith(MEMORY_EXCEEDED):
+        status_code = 503
+    else:
+        status_code = 499
+    return HTTPException(status_code=status_code, detail=f"渲染已取消: {token.reason}")
+
+
+def memory_error(e: MemoryUnavailable) -> HTTPException:
+    """内存额度不足（排队超时）"""
+    logger.warning(str(e))
+    return HTTPException(status_code=503, detail=str(e))
+
+
+def lease_error(e: SessionLeased) -> HTTPException:
+    """会话正由其它节点渲染（租约到期后可重试）"""
+    logger.warning(str(e))
+    retry_after = max(1, int(e.lease.expires - time.time()))
+    return HTTPException(
+        status_code=409, detail=str(e), headers={"Retry-After": str(retry_after)}
+    )
 
 
 @app.post("/api/render", response_class=PlainTextResponse)
-def render_video(request: RenderRequest):
+async def render_video(request: RenderRequest, http_request: Request):
     """
     渲染视频接口
 
     - **template**: 模板名称 (classic/modern/elegant)
     - **image_path**: 图片路径（容器内绝对路径，如 /app/examples/cover.jpg）
     - **video_paths**: 视频路径列表（1-5个容器内绝对路径）
+    - **profile**: 渲染档位（可选，如 draft 低分辨率快速预览）
+    - **renditions**: 附加输出规格（可选），指定时返回 JSON：主视频URL + 各规格URL
+    - **interactive**: 是否为交互任务（默认 true），非交互任务在高负载时可能降低分辨率
 
-    返回视频URL字符串（同步阻塞，需等待10-60秒）
+    返回视频URL字符串（同步阻塞，需等待10-60秒）。
+    高负载降级时响应头 X-Render-Degradation 为降级等级，JSON 响应中包含 degradation 字段。
     """
-    # 按时间命名文件：年月日时分.mp4
-    now = datetime.now()
-    output_filename = (
-        f"{now.year}{now.month:02d}{now.day:02d}{now.hour:02d}{now.minute:02d}.mp4"
+    await run_in_threadpool(require_renderable, request.image_path, request.video_paths)
+    token = new_cancel_token(request.job_id, request.timeout)
+    return await run_cancellable(
+        http_request, token, _render_video, request, token
     )
-    output_path = OUTPUT_DIR / output_filename
 
-    # 获取基础URL
-    base_url = os.getenv("API_BASE_URL", "http://localhost:8001")
+
+def _render_video(request: RenderRequest, token: CancelToken):
+    # 根据当前负载选择降级等级（非交互任务可能降为低分辨率档位）
+    decision = decide_degradation(request.template, request.profile, request.interactive)
+    profile = request.profile or decision.profile
+
+    # 按时间命名文件：年月日时分.mp4（预览档位追加后缀）
+    now = datetime.now()
+    suffix = f"_{profile}" if profile else ""
+    output_filename = f"{now.year}{now.month:02d}{now.day:02d}{now.hour:02d}{now.minute:02d}{suffix}.mp4"
+    output_path = OUTPUT_DIR / output_filename
 
     try:
         logger.info(f"开始渲染: {output_filename} | 模板: {request.template}")
@@ -142,20 +351,243 @@ def render_video(request: RenderRequest):
             image_path=request.image_path,
             video_paths=request.video_paths,
             output_file=str(output_path),
+            profile=profile,
+            renditions=request.renditions,
+            output_store=output_store,
+        )
+        renderer.apply_degradation(decision)
+        renderer.cancel_token = token
+        try:
+            # 内存额度不足时排队（不计入负载统计）
+            with MemoryBudget.reserve(
+                renderer.estimate_memory_mb(), token=token
+            ), LoadController.track() as job:
+                renderer.render()
+                job["media_seconds"] = renderer.rendered_frames / renderer.FPS
+                job["stages"] = renderer.stage_times
+        finally:
+            # 及时释放 GL 上下文（取消时立即归还 GPU 资源）
+            renderer.cleanup()
+
+        video_url = renderer.output_url
+        logger.info(
+            f"渲染完成: {output_filename} | 纹理上传: {renderer.textures.stats.to_dict()} "
+            f"| 内存峰值: {renderer.memory.peak_mb:.0f}MB "
+            f"| 分块缓存: {renderer.segment_stats.hits}/{renderer.segment_stats.pieces}"
         )
-        renderer.render()
 
-        video_url = f"{base_url}/videos/{output_filename}"
-        logger.info(f"渲染完成: {output_filename}")
+        headers = (
+            {"X-Render-Degradation": decision.name} if decision.degraded else None
+        )
+        if request.renditions:
+            return JSONResponse(
+                content={
+                    "video_url": video_url,
+                    "renditions": renderer.rendition_outputs,
+                    "preview": renderer.preview_outputs,
+                    "degradation": decision.to_dict() if decision.degraded else None,
+                    "uploads": renderer.textures.stats.to_dict(),
+                    "memory": renderer.memory.report(),
+                    "cache": renderer.segment_stats.to_dict(),
+                },
+                headers=headers,
+            )
 
         # 直接返回URL字符串
-        return video_url
+        return PlainTextResponse(video_url, headers=headers)
 
+    except RenderCancelled:
+        raise cancelled_error(token)
+    except MemoryUnavailable as e:
+        raise memory_error(e)
     except Exception as e:
         logger.error(f"渲染失败 {output_filename}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"渲染失败: {str(e)}")
 
 
+def dry_run_response(renderer, decision, dry_run=None) -> dict:
+    """应用降级决策后空跑估算（dry_run 默认为 renderer.dry_run，素材错误返回 400）"""
+    renderer.apply_degradation(decision)
+    try:
+        estimate = (dry_run or renderer.dry_run)()
+    except (FileNotFoundError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"估算失败: {str(e)}")
+    return {
+        **estimate,
+        "degradation": decision.to_dict() if decision.degraded else None,
+    }
+
+
+@app.post("/api/render/estimate")
+def estimate_render(request: RenderRequest):
+    """
+    空跑估算一次性渲染（不渲染、不占用内存预算）
+
+    返回执行计划（各区间帧数及是否命中分块缓存）、各阶段耗时（毫秒）、排队等待，
+    以及完成时间 eta_seconds（p10 / p50 / p90 秒）。降级等级按当前负载选择，与实际渲染一致。
+    """
+    require_renderable(request.image_path, request.video_paths)
+    decision = decide_degradation(request.template, request.profile, request.interactive)
+    renderer = ApiVlogRenderer(
+        template_name=request.template,
+        image_path=request.image_path,
+        video_paths=request.video_paths,
+        profile=request.profile or decision.profile,
+        renditions=request.renditions,
+        output_store=output_store,
+    )
+    return dry_run_response(renderer, decision)
+
+
+@app.on_event("shutdown")
+def shutdown_session_actors():
+    """服务关闭时将常驻会话的最后一帧落盘并释放 GPU 资源"""
+    SessionActorPool.shutdown()
+
+
+# ==================== 流式上传 API ====================
+
+
+class UploadCreateRequest(BaseModel):
+    """创建上传请求"""
+
+    filename: str = Field(..., description="文件名（用于识别格式，如 v1.mp4）")
+
+
+@app.post("/api/upload")
+def create_upload(request: UploadCreateRequest):
+    """
+    创建上传句柄
+
+    返回的 `handle`（upload:<id>）可以立即用于 init/append/render 请求，
+    视频在上传过程中即可开始解码；图片需上传完成后使用。
+
+    返回：
+    ```json
+    {
+        "upload_id": "uuid",
+        "handle": "upload:uuid",
+        "upload_url": "/api/upload/uuid"
+    }
+    ```
+    """
+    try:
+        info = UploadManager.create_upload(request.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "upload_id": info.upload_id,
+        "handle": f"upload:{info.upload_id}",
+        "upload_url": f"/api/upload/{info.upload_id}",
+    }
+
+
+@app.put("/api/upload/{upload_id}")
+async def stream_upload(upload_id: str, request: Request):
+    """
+    流式上传文件内容（请求体为原始字节，支持 chunked 传输）
+
+    收到容器头部后立即探测，并在后台启动解码器读取增长中的文件。
+    """
+    try:
+        UploadManager.get(upload_id)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                # 文件写入是阻塞调用，不在事件循环上执行
+                await run_in_threadpool(UploadManager.write_chunk, upload_id, chunk)
+        info = await run_in_threadpool(UploadManager.complete_upload, upload_id)
+    except Exception as e:
+        logger.error(f"上传失败 {upload_id}: {str(e)}", exc_info=True)
+        UploadManager.fail_upload(upload_id, str(e))
+        raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
+
+    return info.to_dict()
+
+
+@app.get("/api/probe")
+def probe_file(path: str):
+    """探测素材信息（时长、分辨率、帧率、旋转、编码、关键帧间隔），结果缓存"""
+    try:
+        path = UploadManager.resolve(path)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"文件不存在: {path}")
+    try:
+        return probe_media(path).to_dict()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/load")
+def get_load_status():
+    """查询当前负载、近期任务耗时、降级等级配置、内存预算、分块缓存、片段缓存、共享渲染引擎、耗时模型和工作目录"""
+    return {
+        **LoadController.status(),
+        "memory": MemoryBudget.status(),
+        "segment_cache": SegmentCache.stats() if SegmentCache.enabled() else None,
+        "mezzanine": MezzanineCache.stats() if MezzanineCache.enabled() else None,
+        "gl_engine": RenderEngine.status(),
+        "cost_model": CostModel.status(),
+        "workspace": Workspace.status(),
+    }
+
+
+@app.get("/api/transitions")
+def list_transitions(
+    template: Optional[str] = None,
+    profile: Optional[str] = None,
+    backend: Optional[str] = None,
+):
+    """
+    查询转场实测开销（profile_transitions.py 生成的转场目录）
+
+    - **template**: 只列出该模板使用的转场（可选）
+    - **profile**: 按渲染档位的分辨率换算（可选）
+    - **backend**: GL 实现名称（可选，默认优先硬件实现）
+    """
+    template = template or TemplateConfig.list_available_templates()[0]
+    try:
+        config = TemplateConfig(template, profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    width = config.global_config["width"]
+    height = config.global_config["height"]
+    rows = TransitionCatalog.describe(width, height, backend)
+    used = [Path(path).stem for path in config.transitions]
+    return {
+        "backend": backend or TransitionCatalog.default_backend(),
+        "backends": TransitionCatalog.backends(),
+        "width": width,
+        "height": height,
+        "template": template,
+        "transitions": [row for row in rows if row["name"] in used],
+        "all": rows,
+    }
+
+
+@app.get("/api/upload/{upload_id}")
+def get_upload_status(upload_id: str):
+    """查询上传状态（已接收字节数、探测结果）"""
+    try:
+        return UploadManager.get(upload_id).to_dict()
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.delete("/api/upload/{upload_id}")
+def delete_upload(upload_id: str):
+    """删除上传文件（素材使用完毕后调用）"""
+    UploadManager.cleanup_upload(upload_id)
+    return {"upload_id": upload_id, "status": "deleted"}
+
+
 # ==================== 增量渲染 API ====================
 
 
@@ -164,14 +596,30 @@ class InitRequest(BaseModel):
 
     template: str = Field(..., description="模板名称 (classic/modern/elegant)")
     image_path: str = Field(..., description="图片路径（本机目录路径）")
+    profile: Optional[str] = Field(
+        None, description="渲染档位（可选，整个会话沿用）"
+    )
+    renditions: Optional[List[str]] = Field(
+        None, description="附加输出规格（可选，整个会话沿用）"
+    )
+    job_id: Optional[str] = Field(
+        None, description="任务ID（可选，用于取消初始化）"
+    )
+    timeout: Optional[float] = Field(
+        None, gt=0, description="截止时间（秒，可选），超时后取消渲染"
+    )
 
     @validator("image_path")
     def validate_image_path(cls, v):
-        if not os.path.exists(v):
-            raise ValueError(f"图片文件不存在: {v}")
-        if not v.lower().endswith((".jpg", ".jpeg", ".png", ".bmp")):
-            raise ValueError(f"不支持的图片格式: {v}")
-        return v
+        return validate_image_file(v)
+
+    @validator("profile")
+    def validate_profile(cls, v):
+        return validate_render_profile(v)
+
+    @validator("renditions")
+    def validate_renditions(cls, v):
+        return validate_rendition_names(v)
 
 
 class AppendRequest(BaseModel):
@@ -179,14 +627,13 @@ class AppendRequest(BaseModel):
 
     session_id: str = Field(..., description="会话ID")
     video_path: str = Field(..., description="视频路径（本机目录路径）")
+    timeout: Optional[float] = Field(
+        None, gt=0, description="截止时间（秒，可选），超时后取消渲染"
+    )
 
     @validator("video_path")
     def validate_video_path(cls, v):
-        if not os.path.exists(v):
-            raise ValueError(f"视频文件不存在: {v}")
-        if not v.lower().endswith((".mp4", ".avi", ".mov", ".mkv")):
-            raise ValueError(f"不支持的视频格式: {v}")
-        return v
+        return validate_video_file(v)
 
 
 class FinalizeRequest(BaseModel):
@@ -197,7 +644,7 @@ class FinalizeRequest(BaseModel):
 
 
 @app.post("/api/render/init")
-def render_init(request: InitRequest):
+async def render_init(request: InitRequest, http_request: Request):
     """
     初始化渲染会话 - 渲染首张图片
 
@@ -214,33 +661,87 @@ def render_init(request: InitRequest):
     }
     ```
     """
+    await run_in_threadpool(require_renderable, request.image_path)
+    token = new_cancel_token(request.job_id, request.timeout)
+    return await run_cancellable(
+        http_request, token, _render_init, request, token
+    )
+
+
+def _render_init(request: InitRequest, token: CancelToken):
     try:
         logger.info(f"🎬 初始化渲染会话 | 模板: {request.template}")
 
         # 创建会话
-        session_id = SessionManager.create_session(request.template)
+        session_id = SessionManager.create_session(
+            request.template, request.profile, request.renditions
+        )
 
-        # 创建渲染器并渲染初始图片
-        renderer = IncrementalRenderer(session_id, request.template)
-        segment_index = renderer.render_init(request.image_path)
-        renderer.cleanup()
+        # 在会话常驻线程中渲染初始图片（GPU 状态保留给后续 append）
+        actor = SessionActorPool.get(
+            session_id, request.template, request.profile, request.renditions
+        )
+        decision = decide_degradation(request.template, request.profile)
+        try:
+            with MemoryBudget.reserve(
+                actor.estimate_memory_mb(), token=token
+            ), LoadController.track() as job:
+                segment_index = actor.call(
+                    "render_init",
+                    request.image_path,
+                    degradation=decision,
+                    cancel_token=token,
+                )
+                job["media_seconds"] = actor.renderer.IMAGE_DURATION
+        except Exception as e:
+            SessionActorPool.evict(session_id, persist=False)
+            if isinstance(e, (RenderCancelled, MemoryUnavailable)):
+                # 客户端拿不到会话ID，取消的会话直接删除
+                SessionManager.cleanup_session(session_id, keep_final_video=False)
+            raise
 
         logger.info(f"✅ 会话 {session_id} 初始化完成")
+        segment_info = SessionManager.get_metadata(session_id).segments[segment_index]
 
         return {
             "session_id": session_id,
             "segment_index": segment_index,
+            "degradation": decision.to_dict() if decision.degraded else None,
+            "memory": segment_info.get("memory"),
+            "cache": segment_info.get("cache"),
             "status": "initialized",
             "message": "初始图片段落渲染完成",
         }
 
+    except RenderCancelled:
+        raise cancelled_error(token)
+    except MemoryUnavailable as e:
+        raise memory_error(e)
+    except SessionLeased as e:
+        raise lease_error(e)
     except Exception as e:
         logger.error(f"初始化失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"初始化失败: {str(e)}")
 
 
+@app.post("/api/render/init/estimate")
+def estimate_render_init(request: InitRequest):
+    """空跑估算初始化渲染会话（图片段落），返回格式同 /api/render/estimate"""
+    require_renderable(request.image_path)
+    decision = decide_degradation(request.template, request.profile)
+    renderer = ApiVlogRenderer(
+        template_name=request.template,
+        image_path=request.image_path,
+        video_paths=[],
+        profile=request.profile,
+        renditions=request.renditions,
+        output_store=output_store,
+    )
+    return dry_run_response(renderer, decision)
+
+
 @app.post("/api/render/append")
-def render_append(request: AppendRequest):
+async def render_append(request: AppendRequest, http_request: Request):
     """
     追加视频段落
 
@@ -258,6 +759,14 @@ def render_append(request: AppendRequest):
     }
     ```
     """
+    await run_in_threadpool(require_renderable, video_paths=[request.video_path])
+    token = new_cancel_token(request.session_id, request.timeout)
+    return await run_cancellable(
+        http_request, token, _render_append, request, token
+    )
+
+
+def _render_append(request: AppendRequest, token: CancelToken):
     try:
         # 验证会话
         if not SessionManager.session_exists(request.session_id):
@@ -270,10 +779,30 @@ def render_append(request: AppendRequest):
         # 获取模板名称
         metadata = SessionManager.get_metadata(request.session_id)
 
-        # 创建渲染器并追加视频
-        renderer = IncrementalRenderer(request.session_id, metadata.template_name)
-        segment_index = renderer.render_append(request.video_path)
-        renderer.cleanup()
+        # 复用会话常驻线程中的渲染器追加视频（被驱逐的会话会自动恢复）
+        actor = SessionActorPool.get(
+            request.session_id,
+            metadata.template_name,
+            metadata.profile,
+            metadata.renditions,
+        )
+        decision = decide_degradation(metadata.template_name, metadata.profile)
+        try:
+            with MemoryBudget.reserve(
+                actor.estimate_memory_mb(), token=token
+            ), LoadController.track() as job:
+                segment_index = actor.call(
+                    "render_append",
+                    request.video_path,
+                    degradation=decision,
+                    cancel_token=token,
+                )
+                job["media_seconds"] = actor.renderer.VIDEO_DURATION
+        except (MemoryUnavailable, SessionLeased):
+            raise
+        except Exception:
+            SessionActorPool.evict(request.session_id)
+            raise
 
         # 获取使用的转场
         updated_metadata = SessionManager.get_metadata(request.session_id)
@@ -285,15 +814,60 @@ def render_append(request: AppendRequest):
             "session_id": request.session_id,
             "segment_index": segment_index,
             "transition_used": segment_info.get("transition_shader"),
+            "degradation": segment_info.get("degradation"),
+            "memory": segment_info.get("memory"),
+            "cache": segment_info.get("cache"),
             "status": "rendering",
             "message": "视频段落追加完成",
         }
 
+    except RenderCancelled:
+        raise cancelled_error(token)
+    except MemoryUnavailable as e:
+        raise memory_error(e)
+    except SessionLeased as e:
+        raise lease_error(e)
     except Exception as e:
         logger.error(f"追加失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"追加失败: {str(e)}")
 
 
+@app.post("/api/render/append/estimate")
+def estimate_render_append(request: AppendRequest):
+    """空跑估算追加视频段落（会话的转场顺序、档位和输出规格），返回格式同 /api/render/estimate"""
+    require_renderable(video_paths=[request.video_path])
+    if not SessionManager.session_exists(request.session_id):
+        raise HTTPException(status_code=404, detail=f"会话不存在: {request.session_id}")
+    metadata = SessionManager.get_metadata(request.session_id)
+    decision = decide_degradation(metadata.template_name, metadata.profile)
+    renderer = IncrementalRenderer(
+        request.session_id,
+        metadata.template_name,
+        metadata.profile,
+        metadata.renditions,
+    )
+    return dry_run_response(
+        renderer, decision, lambda: renderer.dry_run_append(request.video_path)
+    )
+
+
+@app.post("/api/render/cancel/{job_id}")
+def cancel_render(job_id: str):
+    """
+    取消进行中的渲染
+
+    - /api/render 和 /api/render/init 使用请求中的 job_id
+    - /api/render/append 使用会话ID（同时取消该会话排队中的追加请求）
+
+    渲染线程在下一帧检测到取消，终止编码器和解码器并删除未完成的文件，
+    原请求返回 499。
+    """
+    if not CancelRegistry.cancel(job_id, "显式取消"):
+        raise HTTPException(status_code=404, detail=f"没有进行中的任务: {job_id}")
+    logger.info(f"🛑 取消任务: {job_id}")
+    return {"job_id": job_id, "status": "cancelling"}
+
+
 @app.post("/api/render/finalize")
 def render_finalize(request: FinalizeRequest, background_tasks: BackgroundTasks):
     """
@@ -334,25 +908,27 @@ def render_finalize(request: FinalizeRequest, background_tasks: BackgroundTasks)
             output_filename = f"final_{now.year}{now.month:02d}{now.day:02d}{now.hour:02d}{now.minute:02d}.mp4"
             output_path = OUTPUT_DIR / output_filename
 
-        # 创建渲染器并完成合成
-        renderer = IncrementalRenderer(request.session_id, metadata.template_name)
-        final_video_path, thumbnail_path = renderer.finalize(str(output_path))
-        renderer.cleanup()
+        # 在会话线程中完成合成，之后释放常驻资源
+        actor = SessionActorPool.get(
+            request.session_id,
+            metadata.template_name,
+            metadata.profile,
+            metadata.renditions,
+        )
+        try:
+            video_url, img_url = actor.call(
+                "finalize", str(output_path), output_store
+            )
+            rendition_outputs = dict(actor.renderer.rendition_outputs)
+            preview_outputs = dict(actor.renderer.preview_outputs)
+        finally:
+            SessionActorPool.evict(request.session_id, persist=False)
 
         # 后台清理会话文件（保留最终视频）
         background_tasks.add_task(
             SessionManager.cleanup_session, request.session_id, True
         )
 
-        # 生成视频URL
-        base_url = os.getenv("API_BASE_URL", "http://localhost:8001")
-        video_url = f"{base_url}/videos/{Path(final_video_path).name}"
-        
-        # 生成封面URL（如果存在）
-        img_url = None
-        if thumbnail_path:
-            img_url = f"{base_url}/videos/{Path(thumbnail_path).name}"
-
         logger.info(f"✅ 会话 {request.session_id} 合成完成: {video_url}")
         if img_url:
             logger.info(f"   📸 封面: {img_url}")
@@ -361,11 +937,15 @@ def render_finalize(request: FinalizeRequest, background_tasks: BackgroundTasks)
             "session_id": request.session_id,
             "video_url": video_url,
             "img_url": img_url,
+            "renditions": rendition_outputs,
+            "preview": preview_outputs,
             "total_segments": len(metadata.segments),
             "status": "completed",
             "message": "视频合成完成",
         }
 
+    except SessionLeased as e:
+        raise lease_error(e)
     except Exception as e:
         logger.error(f"合成失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"合成失败: {str(e)}")
@@ -407,3 +987,71 @@ def get_render_status(session_id: str):
     except Exception as e:
         logger.error(f"查询状态失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"查询状态失败: {str(e)}")
+
+
+@app.get("/api/render/session/{session_id}/export")
+def export_session(session_id: str, move: bool = False):
+    """
+    导出会话（tar 包：元数据、最后一帧、段落文件），用于迁移到其它节点
+
+    - **move**: 导出后删除本地会话（迁移）
+
+    本节点的常驻会话先驱逐（最后一帧落盘）；导出期间持有会话租约。
+    使用共享会话存储时任何节点都可以直接继续会话，无需导出。
+    """
+    if not SessionManager.session_exists(session_id):
+        raise HTTPException(status_code=404, detail=f"会话不存在: {session_id}")
+
+    SessionActorPool.evict(session_id)
+    fd, archive_path = tempfile.mkstemp(suffix=".tar")
+    os.close(fd)
+    try:
+        SessionManager.export_session(session_id, archive_path)
+        if move:
+            SessionManager.cleanup_session(session_id, keep_final_video=False)
+    except SessionLeased as e:
+        os.remove(archive_path)
+        raise lease_error(e)
+    except Exception as e:
+        os.remove(archive_path)
+        logger.error(f"导出失败: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
+
+    return FileResponse(
+        archive_path,
+        media_type="application/x-tar",
+        filename=f"session_{session_id}.tar",
+        background=BackgroundTask(os.remove, archive_path),
+    )
+
+
+@app.post("/api/render/session/import")
+async def import_session(request: Request):
+    """
+    导入会话（请求体为 /api/render/session/{session_id}/export 生成的 tar 包）
+
+    导入后可在本节点继续 append / finalize。
+    """
+    fd, archive_path = tempfile.mkstemp(suffix=".tar")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in request.stream():
+                # 文件写入是阻塞调用，不在事件循环上执行
+                await run_in_threadpool(f.write, chunk)
+        session_id = await run_in_threadpool(SessionManager.import_session, archive_path)
+    except FileExistsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except (ValueError, tarfile.TarError) as e:
+        raise HTTPException(status_code=400, detail=f"会话包无效: {str(e)}")
+    finally:
+        os.remove(archive_path)
+
+    metadata = await run_in_threadpool(SessionManager.get_metadata, session_id)
+    logger.info(f"📦 会话导入完成: {session_id}")
+    return {
+        "session_id": session_id,
+        "template": metadata.template_name,
+        "status": metadata.status,
+        "total_segments": len(metadata.segments),
+        "total_frames": metadata.total_frames,
+    }
@@ -0,0 +1,56 @@
+"""
+批量渲染工具
+
+读取 JSONL 任务文件，在工作进程池中渲染，结果逐行写入 JSONL。
+
+用法：
+    python batch_render.py jobs.jsonl --output-dir outputs/batch --workers 2
+
+任务文件格式（每行一个任务）：
+    {"id": "v1", "template": "classic", "image_path": "examples/images/00001.jpg",
+     "video_paths": ["examples/videos/video1.mp4"], "renditions": ["720p"]}
+    {"id": "v2", "mode": "incremental", "template": "classic", ...}
+"""
+
+import argparse
+from pathlib import Path
+
+from src.batch_runner import load_jobs, run_batch
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="批量渲染 JSONL 任务文件")
+    parser.add_argument("jobs", type=Path, help="任务文件（JSONL）")
+    parser.add_argument("--output-dir", type=Path, default=Path("outputs/batch"), help="输出目录")
+    parser.add_argument("--results", type=Path, help="结果文件（默认 <输出目录>/results.jsonl）")
+    parser.add_argument("--workers", type=int, default=2, help="工作进程数（每个进程一个 GL 上下文）")
+    parser.add_argument("--software", action="store_true", help="使用软件 GL（llvmpipe）")
+    parser.add_argument("--cpu-encoder", action="store_true", help="使用 CPU 编码器（libx264）")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        jobs = load_jobs(args.jobs)
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"❌ {e}")
+    if not jobs:
+        raise SystemExit("❌ 任务文件为空")
+
+    results_path = args.results or args.output_dir / "results.jsonl"
+    results = run_batch(
+        jobs,
+        args.output_dir,
+        results_path,
+        workers=max(1, args.workers),
+        software=args.software,
+        cpu_encoder=args.cpu_encoder,
+    )
+    print(f"💾 结果: {results_path}")
+    if any(result.status != "ok" for result in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
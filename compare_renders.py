@@ -0,0 +1,179 @@
+"""
+渲染等价性检查工具
+
+用两条可配置的渲染管线渲染同一时间线，逐帧计算 PSNR/SSIM，
+列出最差的帧及其时间线位置，任一帧低于阈值时以非零状态退出。
+
+用法：
+    python compare_renders.py --template classic \\
+        --image examples/images/00001.jpg --videos examples/videos/video1.mp4 \\
+        --candidate src.fast_renderer:FastRenderer --software --cpu-encoder
+
+    # 同一渲染器，对比不同参数（如关闭打字机效果）
+    python compare_renders.py ... --candidate-set typewriter=false
+
+管线参数：
+    --baseline / --candidate             渲染器类（module:Class，默认 ApiVlogRenderer）
+    --baseline-set / --candidate-set     渲染前设置的渲染器属性（key=value，可重复）
+    --baseline-encoder / --candidate-encoder  覆盖编码参数（key=value，可重复）
+"""
+
+import json
+import time
+import argparse
+import importlib
+import tempfile
+from pathlib import Path
+
+from src.equivalence import compare_videos
+from src.output_store import LocalOutputStore
+from src.shaders import load_transitions, use_software_gl
+from src.timeline import compile_plan
+from src.video import CPU_ENCODER_OPTIONS
+
+
+DEFAULT_RENDERER = "src.api_renderer:ApiVlogRenderer"
+
+
+def parse_value(value: str):
+    """解析命令行中的属性值"""
+    lowered = value.lower()
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def parse_pairs(pairs) -> dict:
+    result = {}
+    for pair in pairs or []:
+        key, sep, value = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"❌ 参数格式应为 key=value: {pair}")
+        result[key] = value
+    return result
+
+
+def load_class(spec: str):
+    module_name, _, class_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="对比两条渲染管线的输出（逐帧 PSNR/SSIM）")
+    parser.add_argument("--template", required=True, help="模板名称")
+    parser.add_argument("--image", required=True, help="图片路径")
+    parser.add_argument("--videos", nargs="+", required=True, help="视频路径")
+    parser.add_argument("--profile", help="渲染档位（两条管线相同）")
+    for side in ("baseline", "candidate"):
+        parser.add_argument(f"--{side}", default=DEFAULT_RENDERER, help="渲染器类 module:Class")
+        parser.add_argument(f"--{side}-set", action="append", help="渲染器属性 key=value")
+        parser.add_argument(f"--{side}-encoder", action="append", help="编码参数 key=value")
+    parser.add_argument("--software", action="store_true", help="使用软件 GL（llvmpipe）")
+    parser.add_argument("--cpu-encoder", action="store_true", help="使用无损 CPU 编码器（libx264）")
+    parser.add_argument("--psnr", type=float, default=40.0, help="PSNR 阈值（dB）")
+    parser.add_argument("--ssim", type=float, default=0.98, help="SSIM 阈值")
+    parser.add_argument("--worst", type=int, default=10, help="报告中列出的最差帧数")
+    parser.add_argument("--stride", type=int, default=1, help="每隔多少帧计算一次指标")
+    parser.add_argument("--report", type=Path, help="JSON 报告输出路径")
+    parser.add_argument("--workdir", type=Path, help="输出目录（默认临时目录）")
+    return parser.parse_args()
+
+
+def run_pipeline(label: str, args, workdir: Path):
+    """按管线配置渲染一次，返回 (渲染器, 输出路径, 耗时)"""
+    renderer_cls = load_class(getattr(args, label))
+    output = workdir / f"{label}.mp4"
+    renderer = renderer_cls(
+        template_name=args.template,
+        image_path=args.image,
+        video_paths=args.videos,
+        output_file=str(output),
+        profile=args.profile,
+        output_store=LocalOutputStore(workdir),
+    )
+    # 两条管线都完整渲染每一帧（--candidate-set segment_cache=true 可检查分块缓存路径）
+    renderer.segment_cache = False
+    if args.cpu_encoder:
+        renderer.ENCODER_OPTIONS = dict(CPU_ENCODER_OPTIONS)
+    renderer.ENCODER_OPTIONS = {
+        **renderer.ENCODER_OPTIONS,
+        **parse_pairs(getattr(args, f"{label}_encoder")),
+    }
+    for key, value in parse_pairs(getattr(args, f"{label}_set")).items():
+        setattr(renderer, key, parse_value(value))
+
+    print(f"\n━━━ {label}: {getattr(args, label)} ━━━")
+    start = time.perf_counter()
+    renderer.render()
+    return renderer, output, time.perf_counter() - start
+
+
+def main():
+    args = parse_args()
+    if args.software:
+        use_software_gl()
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="autovlog_compare_"))
+    workdir.mkdir(parents=True, exist_ok=True)
+
+    baseline, baseline_output, baseline_seconds = run_pipeline("baseline", args, workdir)
+    _, candidate_output, candidate_seconds = run_pipeline("candidate", args, workdir)
+
+    # 基准管线的执行计划，用于把差异帧定位到时间线区间
+    plan = compile_plan(
+        baseline.build_timeline(
+            load_transitions(baseline.config.transitions), args.image, args.videos
+        )
+    )
+
+    print("\n🔍 逐帧对比...")
+    report = compare_videos(
+        str(baseline_output),
+        str(candidate_output),
+        baseline.WIDTH,
+        baseline.HEIGHT,
+        baseline.FPS,
+        plan=plan,
+        psnr_threshold=args.psnr,
+        ssim_threshold=args.ssim,
+        worst_count=args.worst,
+        stride=args.stride,
+    )
+
+    print(f"\n📊 帧数: {report.baseline_frames} / {report.candidate_frames}")
+    print(f"   PSNR: 最低 {report.min_psnr:.2f}dB, 平均 {report.mean_psnr:.2f}dB")
+    print(f"   SSIM: 最低 {report.min_ssim:.4f}, 平均 {report.mean_ssim:.4f}")
+    print(f"   耗时: 基准 {baseline_seconds:.1f}秒, 候选 {candidate_seconds:.1f}秒")
+    print(f"\n   最差 {len(report.worst)} 帧:")
+    for m in report.worst:
+        where = f"{m.kind} 区间#{m.span}" if m.kind else "时间线外"
+        if m.transition and m.kind == "transition":
+            where += f" ({m.transition})"
+        if m.clip is not None:
+            where += f" 视频{m.clip + 1}"
+        print(
+            f"   #{m.frame:<6} {m.time:7.2f}s  PSNR {m.psnr:6.2f}dB  "
+            f"SSIM {m.ssim:.4f}  {where}"
+        )
+
+    if args.report:
+        data = report.to_dict()
+        data["seconds"] = {"baseline": baseline_seconds, "candidate": candidate_seconds}
+        args.report.write_text(json.dumps(data, indent=2, ensure_ascii=False))
+        print(f"\n💾 报告: {args.report}")
+
+    if not report.passed:
+        print("\n❌ 输出不一致:")
+        for failure in report.failures:
+            print(f"   - {failure}")
+        raise SystemExit(1)
+    print("\n✅ 输出一致")
+
+
+if __name__ == "__main__":
+    main()
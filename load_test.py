@@ -0,0 +1,165 @@
+"""
+HTTP 接口压测工具
+
+默认在本机以软件 GL + CPU 编码器启动 API 服务，生成合成素材，
+按比例回放一次性渲染（/api/render）和增量会话（init + append + finalize），
+输出各接口 p50/p95/p99 延迟、吞吐、错误率和服务进程资源占用。
+
+用法：
+    # 闭环：4 个并发，共 20 个场景，渲染:会话 = 1:3
+    python load_test.py --mix render=1,session=3 --concurrency 4 --requests 20
+
+    # 开环：每秒 0.2 个场景，持续 5 分钟
+    python load_test.py --rate 0.2 --duration 300 --report load.json
+
+    # 压测已运行的服务（GPU 环境）
+    python load_test.py --url http://localhost:8001 --concurrency 8 --requests 100
+"""
+
+import json
+import argparse
+import tempfile
+from pathlib import Path
+
+import requests
+
+from src.config import TemplateConfig
+from src.loadgen import (
+    SCENARIOS,
+    LoadTest,
+    LoadTestConfig,
+    ResourceSampler,
+    generate_media,
+    start_server,
+    wait_ready,
+)
+
+
+def parse_mix(value: str) -> dict:
+    """解析场景比例，如 render=1,session=3"""
+    mix = {}
+    for item in value.split(","):
+        name, sep, weight = item.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"未知场景: {name}（可选 {', '.join(SCENARIOS)}）")
+        mix[name] = float(weight) if sep else 1.0
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("场景权重不能全为 0")
+    return mix
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="HTTP 接口压测")
+    parser.add_argument("--url", help="压测已运行的服务（不指定时在本机启动）")
+    parser.add_argument("--port", type=int, default=8011, help="本机启动服务的端口")
+    parser.add_argument("--gpu", action="store_true", help="本机服务使用 GPU（默认软件 GL + CPU 编码器）")
+    parser.add_argument("--template", default="classic", help="模板名称")
+    parser.add_argument("--profile", help="渲染档位")
+    parser.add_argument("--mix", type=parse_mix, default="render=1,session=1", help="场景比例")
+    parser.add_argument("--concurrency", type=int, default=2, help="并发场景数（开环时为最大并发）")
+    parser.add_argument("--rate", type=float, help="开环到达率（场景/秒），不指定时为闭环")
+    parser.add_argument("--requests", type=int, help="场景总数（默认 10，指定 --duration 时不限）")
+    parser.add_argument("--duration", type=float, help="最长运行时间（秒）")
+    parser.add_argument("--clips", type=int, default=4, help="合成视频数量")
+    parser.add_argument("--clips-per-render", type=int, default=2, help="每次渲染的视频数")
+    parser.add_argument("--appends", type=int, default=2, help="每个会话追加的视频数")
+    parser.add_argument("--media-size", default="640x360", help="合成视频分辨率")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子（场景和素材选择可复现）")
+    parser.add_argument("--report", type=Path, help="JSON 报告输出路径")
+    parser.add_argument("--workdir", type=Path, help="素材和日志目录（默认临时目录）")
+    args = parser.parse_args()
+    if args.requests is None and args.duration is None:
+        args.requests = 10
+    return args
+
+
+def print_report(report):
+    print(f"\n📊 耗时 {report.elapsed:.1f}秒，完成场景 {report.scenarios} 个，"
+          f"吞吐 {report.throughput_per_min:.2f} 场景/分钟")
+    print(f"\n   {'接口':<28}{'次数':>6}{'错误率':>8}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for name, stats in report.endpoints.items():
+        cells = [
+            f"{stats[key]:.2f}s" if stats[key] is not None else "-"
+            for key in ("p50", "p95", "p99")
+        ]
+        print(
+            f"   {name:<28}{stats['count']:>6}{stats['error_rate']:>8.1%}"
+            f"{cells[0]:>9}{cells[1]:>9}{cells[2]:>9}"
+        )
+    if report.resources:
+        r = report.resources
+        print(
+            f"\n   服务进程: CPU 平均 {r['cpu_percent_avg']}% / 峰值 {r['cpu_percent_max']}%，"
+            f"内存 平均 {r['rss_mb_avg']}MB / 峰值 {r['rss_mb_max']}MB，"
+            f"进程数峰值 {r['processes_max']}"
+        )
+    if report.server_load:
+        print(f"   服务端 p90 实时率: {report.server_load.get('p90_realtime_factor')}")
+    for error in report.errors:
+        print(f"   ❌ {error}")
+
+
+def main():
+    args = parse_args()
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="autovlog_load_"))
+    workdir.mkdir(parents=True, exist_ok=True)
+
+    width, height = (int(v) for v in args.media_size.split("x"))
+    global_config = TemplateConfig.load_global_config()
+    clip_seconds = global_config["video_duration"] + global_config["transition_duration"] + 1
+    media = generate_media(workdir / "media", args.clips, clip_seconds, width, height)
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        server = start_server(args.port, workdir / "server.log", software=not args.gpu)
+        base_url = f"http://127.0.0.1:{args.port}"
+    sampler = None
+    try:
+        wait_ready(base_url, server)
+        if server is not None:
+            sampler = ResourceSampler(server.pid)
+            sampler.start()
+
+        test = LoadTest(
+            base_url,
+            media,
+            LoadTestConfig(
+                template=args.template,
+                mix=args.mix,
+                concurrency=max(1, args.concurrency),
+                rate=args.rate,
+                requests=args.requests,
+                duration=args.duration,
+                clips_per_render=args.clips_per_render,
+                appends=args.appends,
+                profile=args.profile,
+                seed=args.seed,
+            ),
+        )
+        elapsed = test.run()
+        resources = sampler.stop() if sampler else {}
+        sampler = None
+        try:
+            server_load = requests.get(f"{base_url}/api/load", timeout=5).json()
+        except (requests.RequestException, ValueError):
+            server_load = None
+        report = test.report(elapsed, resources, server_load)
+    finally:
+        if sampler is not None:
+            sampler.stop()
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    print_report(report)
+    if args.report:
+        args.report.write_text(json.dumps(report.to_dict(), indent=2, ensure_ascii=False))
+        print(f"\n💾 报告: {args.report}")
+    if any(stats["errors"] for stats in report.endpoints.values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+转场开销测量工具
+
+在目标分辨率下编译并绘制每个转场，用 GL 计时查询测量每帧耗时，结果写入转场目录
+（transitions/catalog.json），服务运行时通过 TransitionCatalog 查询。
+
+用法：
+    python profile_transitions.py                      # 全局分辨率，测量 transitions/ 下全部转场
+    python profile_transitions.py --profile draft      # 使用渲染档位的分辨率
+    python profile_transitions.py --software           # 软件 GL（llvmpipe）
+    python profile_transitions.py gridflip mosaic      # 只测量指定转场
+"""
+
+import argparse
+from pathlib import Path
+
+from src.config import TemplateConfig
+from src.shaders import use_software_gl
+from src.transition_catalog import (
+    CATALOG_PATH,
+    TRANSITIONS_DIR,
+    TransitionCatalog,
+    profile_transition,
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="测量转场着色器的 GPU 开销")
+    parser.add_argument("names", nargs="*", help="转场名称（默认全部）")
+    parser.add_argument("--profile", help="渲染档位（使用档位分辨率）")
+    parser.add_argument("--width", type=int, help="宽度（覆盖配置）")
+    parser.add_argument("--height", type=int, help="高度（覆盖配置）")
+    parser.add_argument("--steps", type=int, default=50, help="进度采样点数")
+    parser.add_argument("--repeats", type=int, default=3, help="每个采样点的绘制次数")
+    parser.add_argument("--software", action="store_true", help="使用软件 GL（Mesa llvmpipe）")
+    parser.add_argument("--catalog", type=Path, default=CATALOG_PATH, help="目录文件")
+    parser.add_argument("--dry-run", action="store_true", help="只打印结果，不写入目录")
+    return parser.parse_args()
+
+
+def resolve_resolution(args):
+    """目标分辨率：命令行 > 渲染档位 > 全局配置"""
+    global_config = TemplateConfig.load_global_config()
+    if args.profile:
+        if args.profile not in TemplateConfig.list_available_profiles():
+            raise SystemExit(f"❌ 渲染档位不存在: {args.profile}")
+        template = TemplateConfig.list_available_templates()[0]
+        global_config = TemplateConfig(template, args.profile).global_config
+    return (
+        args.width or global_config["width"],
+        args.height or global_config["height"],
+    )
+
+
+def create_context(software: bool):
+    """创建离屏 GL 上下文"""
+    if software:
+        use_software_gl()
+
+    import moderngl
+
+    return moderngl.create_context(standalone=True, backend="egl")
+
+
+def main():
+    args = parse_args()
+    width, height = resolve_resolution(args)
+
+    files = sorted(TRANSITIONS_DIR.glob("*.glsl"))
+    if args.names:
+        files = [f for f in files if f.stem in args.names]
+        missing = set(args.names) - {f.stem for f in files}
+        if missing:
+            raise SystemExit(f"❌ 找不到转场: {', '.join(sorted(missing))}")
+
+    ctx = create_context(args.software)
+    backend = ctx.info.get("GL_RENDERER", "unknown")
+    print(f"🔬 转场开销测量 - {backend} @ {width}x{height}")
+
+    results = []
+    for path in files:
+        try:
+            cost = profile_transition(
+                ctx,
+                path.stem,
+                path.read_text(encoding="utf-8"),
+                width,
+                height,
+                steps=args.steps,
+                repeats=args.repeats,
+            )
+        except Exception as e:
+            print(f"   ⚠️  {path.stem}: 测量失败 ({e})")
+            continue
+        results.append(cost)
+        print(
+            f"   ✓ {cost.name:<22} {cost.ms_per_frame:8.3f} ms/帧  "
+            f"p95 {cost.p95_ms:8.3f}  编译 {cost.compile_ms:7.1f} ms  [{cost.timing}]"
+        )
+    ctx.release()
+
+    if not results:
+        raise SystemExit("❌ 没有可用的测量结果")
+
+    print("\n📊 按开销排序:")
+    for cost in sorted(results, key=lambda c: c.ms_per_frame):
+        print(f"   {cost.name:<22} {cost.ms_per_frame:8.3f} ms/帧")
+
+    if not args.dry_run:
+        TransitionCatalog.record(results, args.catalog)
+        print(f"\n💾 已写入: {args.catalog}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,19 +8,58 @@ API 专用渲染器 - 支持图片和视频混合渲染
 - 视频使用统一边框
 """
 
+import time
+import shutil
+from collections import deque
+from concurrent.futures import Future
+import hashlib
 import numpy as np
 import moderngl
 from pathlib import Path
 from PIL import Image
 
+from src.cancellation import CancelToken, RenderCancelled
 from src.config import TemplateConfig
+from src.cost_estimator import CostModel, estimate_render
+from src.gl_engine import GL_PIPELINE_DEPTH, SHARED_GL, RenderEngine, ScratchSet
+from src.media_probe import probe_media
+from src.memory_budget import JobMemory, estimate_in_process_mb, estimate_job_mb
+from src.mezzanine import MezzanineCache
+from src.output_store import LocalOutputStore, OutputStore
+from src.preloader import ClipPreloader
+from src.preview import PreviewCapture, PreviewConfig
 from src.renderers import BorderRenderer, SubtitleRenderer
+from src.segment_cache import (
+    LAST_FRAME_FILE,
+    PREVIEW_FILE,
+    Piece,
+    PieceStats,
+    SegmentCache,
+    assemble_pieces,
+    cache_key,
+    content_hash,
+    video_files,
+)
 from src.shaders import (
+    create_blend_shader,
     create_transition_shader,
     create_overlay_shader,
     load_transitions,
 )
-from src.video import VideoReader, create_encoder, merge_audio
+from src.textures import TextureResidency
+from src.timeline import ExecutionPlan, Timeline, compile_plan
+from src.upload_manager import UploadManager
+from src.video import (
+    USE_CPU_ENCODER,
+    Rendition,
+    VideoReader,
+    abort_encoder,
+    create_encoder,
+    kill_process,
+    merge_audio,
+    rendition_path,
+)
+from src.workspace import Workspace, intermediate_mb
 
 
 class ApiVlogRenderer:
@@ -32,12 +71,20 @@ class ApiVlogRenderer:
         image_path: str,
         video_paths: list,
         output_file: str = None,
+        profile: str = None,
+        renditions: list = None,
+        output_store: OutputStore = None,
     ):
-        self.config = TemplateConfig(template_name)
+        self.config = TemplateConfig(template_name, profile)
         self.image_path = image_path
         self.video_paths = video_paths
         self.output_file = output_file or f"output_api_{template_name}.mp4"
-        self.temp_file = f"temp_api_{template_name}_silent.mp4"
+        # 未指定输出存储时写入 output_file 所在目录
+        self.output_store = output_store or LocalOutputStore(
+            Path(self.output_file).parent
+        )
+        self.output_url = None
+        self.temp_file = None  # 无声中间文件（渲染期间位于本任务的工作目录中）
 
         # 从配置文件加载渲染参数
         self.WIDTH = self.config.global_config["width"]
@@ -53,23 +100,123 @@ class ApiVlogRenderer:
         self.VIDEO_FRAMES = int(self.VIDEO_DURATION * self.FPS)
         self.TRANS_FRAMES = int(self.TRANSITION_DURATION * self.FPS)
         self.SOLO_FRAMES = self.VIDEO_FRAMES - self.TRANS_FRAMES
+        self.ENCODER_OPTIONS = self.config.encoder_options
+        self.renditions = [
+            Rendition(**item) for item in self.config.get_renditions(renditions)
+        ]
+        self.rendition_outputs = {}  # 规格名 -> 访问地址
+        self.textures = TextureResidency()
+        self.segment_cache = SegmentCache.enabled()  # 按分块渲染并复用缓存
+        self.preview_config = PreviewConfig.load(self.config.config_path)
+        self.engine = None  # 共享渲染引擎中的任务句柄（AUTOVLOG_SHARED_GL=1）
+        self._init_runtime_state()
 
         print(f"🎬 API渲染 - 模板: {self.config.name}")
+        if profile:
+            print(f"   档位: {profile} ({self.WIDTH}x{self.HEIGHT} @ {self.FPS}fps)")
         print(f"   图片: {image_path}")
         print(f"   视频数量: {len(video_paths)}")
 
+    def _init_runtime_state(self):
+        """降级策略和阶段耗时统计"""
+        self.degradation = None
+        self.transition_substitutes = {}
+        self.typewriter = True
+        self.stage_times = {"decode": 0.0, "encode": 0.0, "stall": 0.0}
+        self.clip_stalls = []  # 每个片段边界的解码器等待时间
+        self.cancel_token = CancelToken()
+        self.rendered_frames = 0
+        self.last_written_frame = None
+        self.frame_cursor = 0  # 下一帧在本次渲染中的帧序号
+        self.preview = None  # PreviewCapture（渲染期间）
+        self.preview_outputs = {}  # 预览名 -> 访问地址
+        self.segment_stats = PieceStats()
+        self.render_estimate = None  # 实际渲染部分（不含复用的分块）的基准估算
+        self.memory = self.job_memory()
+        self.textures.reset_stats()
+
+    def apply_degradation(self, decision):
+        """应用负载降级决策（编码参数、转场替换、打字机效果）
+
+        渲染档位（分辨率）需要在创建渲染器之前通过 profile 参数应用。
+        """
+        self.degradation = decision
+        self.ENCODER_OPTIONS = {**self.config.encoder_options, **decision.encoder}
+        self.transition_substitutes = dict(decision.substitutes)
+        self.typewriter = decision.typewriter
+        if decision.degraded:
+            print(f"   📉 降级: {decision.name} {decision.to_dict()}")
+
     def setup_gpu(self):
-        """初始化 GPU 上下文和纹理"""
+        """初始化 GPU 上下文和工作纹理（共享引擎时使用引擎的上下文和同分辨率任务共用的工作纹理）"""
         print("🚀 初始化 GPU 环境...")
-        self.ctx = moderngl.create_context(standalone=True, backend="egl")
-        self.tex0 = self.ctx.texture((self.WIDTH, self.HEIGHT), 3)
-        self.tex1 = self.ctx.texture((self.WIDTH, self.HEIGHT), 3)
-        self.fbo = self.ctx.simple_framebuffer((self.WIDTH, self.HEIGHT), components=3)
-        self.fbo.use()
-        self.fbo.clear(0.0, 0.0, 0.0, 1.0)
+        if SHARED_GL:
+            self.engine = RenderEngine.shared().attach(self)
+            self.ctx = self.engine.ctx
+            scratch = self.engine.scratch
+        else:
+            self.ctx = moderngl.create_context(standalone=True, backend="egl")
+            scratch = ScratchSet(self.ctx, self.WIDTH, self.HEIGHT)
+        self.tex0, self.tex1, self.fbo = scratch.tex0, scratch.tex1, scratch.fbo
+        self.temp_tex = scratch.temp_tex
+        self.subtitle_tex, self.subtitle_fbo = scratch.subtitle_tex, scratch.subtitle_fbo
+        self._transition_programs = scratch.programs
+
+    def gpu_submit(self, fn, *args) -> Future:
+        """提交 GL 工作：共享引擎时在引擎线程中排队执行，否则在当前线程直接执行"""
+        if self.engine is not None:
+            return self.engine.submit(fn, *args)
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def gpu(self, fn, *args):
+        """执行 GL 工作并等待结果"""
+        return self.gpu_submit(fn, *args).result()
+
+    def _shared_resource(self, key, create):
+        """GL 资源：共享引擎时按 key 在任务之间共享（在 GL 工作中调用）"""
+        if self.engine is None:
+            return create()
+        return self.engine.resource(key, create)
+
+    def _ensure_gpu(self):
+        """初始化 GPU 环境（已初始化时复用上下文、转场程序和边框纹理）"""
+        if not hasattr(self, "ctx"):
+            self.setup_gpu()
+            self.setup_overlays()
+
+    def cleanup(self):
+        """清理 GPU 资源"""
+        if self.preview is not None:
+            self.preview.close()
+            self.preview = None
+        if hasattr(self, "ctx"):
+            if self.engine is not None:
+                # 上下文和共享资源归引擎所有
+                self.engine.detach()
+                self.engine = None
+            else:
+                self.ctx.release()
+            del self.ctx
+            self.textures.invalidate()
+
+    def prepare_job(self, image_path: str, video_paths: list, output_file: str):
+        """复用已初始化的渲染器渲染新任务（GPU 上下文、着色器和边框纹理保留）"""
+        self.image_path = image_path
+        self.video_paths = video_paths
+        self.output_file = output_file
+        self.output_url = None
+        self.rendition_outputs = {}
+        self._init_runtime_state()
 
     def setup_overlays(self):
         """初始化边框渲染系统（图片和视频使用不同边框）"""
+        self.load_overlays()
+        self.gpu(self._setup_overlay_gl)
+
+    def load_overlays(self):
+        """加载边框和字幕渲染器（不涉及 GL，空跑估算时也用于计算分块缓存键）"""
         print("📝 初始化叠加层...")
 
         # 图片边框（使用模板配置的图片边框）
@@ -79,8 +226,6 @@ class ApiVlogRenderer:
         self.image_border_renderer = BorderRenderer(
             image_border_path, self.WIDTH, self.HEIGHT
         )
-        self.image_border_tex = self.ctx.texture((self.WIDTH, self.HEIGHT), 4)
-        self.image_border_tex.write(self.image_border_renderer.get_texture_data())
 
         # 视频边框（使用模板配置的视频边框，如果不存在则回退到图片边框）
         video_border_path = self.config.border.get("video_path")
@@ -91,36 +236,54 @@ class ApiVlogRenderer:
         self.video_border_renderer = BorderRenderer(
             video_border_path, self.WIDTH, self.HEIGHT
         )
-        self.video_border_tex = self.ctx.texture((self.WIDTH, self.HEIGHT), 4)
-        self.video_border_tex.write(self.video_border_renderer.get_texture_data())
-
-        # 边框 FBO 和 Shader
-        self.border_fbo = self.ctx.simple_framebuffer(
-            (self.WIDTH, self.HEIGHT), components=3
-        )
-        self.border_prog = create_overlay_shader(self.ctx, "border")
-        self.border_vao = self._create_vao(self.border_prog)
-        self.border_prog["video_tex"].value = 0
-        self.border_prog["overlay_tex"].value = 1
-
-        # 临时纹理
-        self.temp_tex = self.ctx.texture((self.WIDTH, self.HEIGHT), 3)
 
         # 字幕系统初始化
         self.subtitle_renderer = SubtitleRenderer(
-            self.config.font["path"], self.config.font["size"], self.WIDTH, self.HEIGHT
+            self.config.font["path"],
+            self.config.font["size"],
+            self.WIDTH,
+            self.HEIGHT,
+            bottom_margin=self.config.subtitle.get("bottom_margin", 100),
         )
-        self.subtitle_tex = self.ctx.texture((self.WIDTH, self.HEIGHT), 4)  # RGBA纹理
-        self.subtitle_fbo = self.ctx.simple_framebuffer(
-            (self.WIDTH, self.HEIGHT), components=3
+
+    def _setup_overlay_gl(self):
+        """创建边框纹理和叠加着色器（共享引擎时按边框内容和着色器在任务之间共享）"""
+        # 叠加 Shader：边框只在非透明分块上绘制，通过 GL 混合直接叠加到主 FBO
+        self.blend_prog, self.blend_vao = self._shared_resource(
+            "blend", lambda: self._create_overlay_program(create_blend_shader(self.ctx))
+        )
+        self.image_border_tex, self.image_border_vao = self._border_resources(
+            self.image_border_renderer
+        )
+        self.video_border_tex, self.video_border_vao = self._border_resources(
+            self.video_border_renderer
+        )
+        self.subtitle_prog, self.subtitle_vao = self._shared_resource(
+            "subtitle",
+            lambda: self._create_overlay_program(
+                create_overlay_shader(self.ctx, "subtitle"), video_tex=0
+            ),
         )
-        self.subtitle_prog = create_overlay_shader(self.ctx, "subtitle")
-        self.subtitle_vao = self._create_vao(self.subtitle_prog)
-        self.subtitle_prog["video_tex"].value = 0
-        self.subtitle_prog["overlay_tex"].value = 1
 
-        # 用于存储边框后的临时帧
-        self.border_temp_tex = self.ctx.texture((self.WIDTH, self.HEIGHT), 3)
+    def _create_overlay_program(self, program, video_tex=None):
+        program["overlay_tex"].value = 1
+        if video_tex is not None:
+            program["video_tex"].value = video_tex
+        return program, self._create_vao(program)
+
+    def _border_resources(self, border_renderer):
+        """边框纹理和只覆盖非透明分块的顶点数组"""
+
+        def create():
+            texture = self.ctx.texture((self.WIDTH, self.HEIGHT), 4)
+            self.textures.write(texture, border_renderer.get_texture_data())
+            return texture, self._create_rects_vao(
+                self.blend_prog, border_renderer.overlay_rects()
+            )
+
+        return self._shared_resource(
+            ("border", border_renderer.snapshot, self.WIDTH, self.HEIGHT), create
+        )
 
     def _create_vao(self, program):
         """创建顶点数组对象（全屏四边形）"""
@@ -156,296 +319,815 @@ class ApiVlogRenderer:
         vbo = self.ctx.buffer(vertices)
         return self.ctx.vertex_array(program, [(vbo, "2f 2f", "in_vert", "in_text")])
 
+    def _create_rects_vao(self, program, rects):
+        """
+        创建只覆盖指定矩形的顶点数组对象（没有矩形时返回 None）
+
+        矩形为像素坐标（行从上到下），与全屏四边形的纹理映射一致：
+        纹理坐标 (x / W, y / H)，顶点坐标为其线性映射到 [-1, 1]。
+        """
+        if not rects:
+            return None
+        vertices = []
+        for x0, y0, x1, y1 in rects:
+            u0, v0 = x0 / self.WIDTH, y0 / self.HEIGHT
+            u1, v1 = x1 / self.WIDTH, y1 / self.HEIGHT
+            for u, v in ((u0, v0), (u1, v0), (u0, v1), (u0, v1), (u1, v0), (u1, v1)):
+                vertices.extend((u * 2 - 1, v * 2 - 1, u, v))
+        vbo = self.ctx.buffer(np.array(vertices, dtype="f4"))
+        return self.ctx.vertex_array(program, [(vbo, "2f 2f", "in_vert", "in_text")])
+
     def render_frame_with_border(self, use_image_border=False, subtitle_text=None):
         """
-        渲染一帧并叠加边框和字幕
+        在主 FBO 上叠加边框和字幕并读出一帧
+
+        叠加层通过 GL 混合（SRC_ALPHA, ONE_MINUS_SRC_ALPHA）直接画到主 FBO，
+        结果与叠加 shader 的 video * (1 - a) + overlay * a 相同；
+        边框只绘制非透明分块，当前帧无需回读再上传。
 
         Args:
             use_image_border: True=使用图片边框，False=使用视频边框
             subtitle_text: 字幕文本，None表示不显示字幕
         """
-        # 选择边框纹理
-        border_tex = (
-            self.image_border_tex if use_image_border else self.video_border_tex
-        )
-
-        # 步骤1: 边框叠加
-        self.temp_tex.write(self.fbo.read(components=3))
-        self.border_fbo.use()
-        self.temp_tex.use(0)
-        border_tex.use(1)
-        self.border_vao.render()
-
-        # 步骤2: 字幕叠加（如果有字幕）
-        if subtitle_text:
-            # 渲染字幕文字到纹理
-            subtitle_data = self.subtitle_renderer.render_text(
-                subtitle_text,
-                color=tuple(self.config.font["color"]),
-                outline_color=tuple(self.config.font["outline_color"]),
-                outline_width=self.config.font["outline_width"],
-            )
-            self.subtitle_tex.write(subtitle_data)
-
-            # 将边框结果叠加字幕
-            self.border_temp_tex.write(self.border_fbo.read(components=3))
-            self.subtitle_fbo.use()
-            self.border_temp_tex.use(0)
-            self.subtitle_tex.use(1)
-            self.subtitle_vao.render()
-
-            final_frame = self.subtitle_fbo.read(components=3)
+        # 选择边框纹理和绘制区域
+        if use_image_border:
+            border_tex, border_vao = self.image_border_tex, self.image_border_vao
         else:
-            final_frame = self.border_fbo.read(components=3)
+            border_tex, border_vao = self.video_border_tex, self.video_border_vao
 
-        # 恢复主 FBO 状态
         self.fbo.use()
+        self.ctx.enable(moderngl.BLEND)
+        self.ctx.blend_func = moderngl.SRC_ALPHA, moderngl.ONE_MINUS_SRC_ALPHA
+        try:
+            # 步骤1: 边框叠加（全透明边框不绘制）
+            if border_vao is not None:
+                border_tex.use(1)
+                border_vao.render()
+
+            # 步骤2: 字幕叠加（如果有字幕）
+            if subtitle_text:
+                subtitle_data = self.subtitle_renderer.render_text(
+                    subtitle_text,
+                    color=tuple(self.config.font["color"]),
+                    outline_color=tuple(self.config.font["outline_color"]),
+                    outline_width=self.config.font["outline_width"],
+                )
+                self.textures.write(self.subtitle_tex, subtitle_data)
+                self.subtitle_tex.use(1)
+                self.blend_vao.render()
+        finally:
+            self.ctx.disable(moderngl.BLEND)
+
+        final_frame = self.fbo.read(components=3)
+
+        # 恢复纹理绑定
         self.tex0.use(0)
         self.tex1.use(1)
 
         return final_frame
 
-    def render(self):
-        """主渲染循环"""
-        self.setup_gpu()
-        self.setup_overlays()
+    def get_subtitle_text(self):
+        """生成完整字幕文本（带日期）"""
+        from datetime import datetime
 
-        # 加载转场效果
-        transitions = load_transitions(self.config.transitions)
+        now = datetime.now()
+        subtitle_template = self.config.subtitle.get("template", "")
+        return subtitle_template.format(year=now.year, month=now.month, day=now.day)
 
-        # 创建编码器
-        encoder = create_encoder(self.WIDTH, self.HEIGHT, self.FPS, self.temp_file)
-        print("📂 开始渲染...")
+    def get_subtitle_frames(self):
+        """字幕（打字机效果）持续帧数"""
+        subtitle_duration = self.config.subtitle.get("duration", 6.0)
+        return int(subtitle_duration * self.FPS)
 
-        # 初始化着色器
-        prog = create_transition_shader(self.ctx, transitions[0]["source"])
-        vao = self._create_vao(prog)
-        self.tex0.use(0)
-        self.tex1.use(1)
-        prog["tex0"].value = 0
-        prog["tex1"].value = 1
-        if "ratio" in prog:
-            prog["ratio"].value = self.WIDTH / self.HEIGHT
+    def build_timeline(
+        self,
+        transitions,
+        image_path=None,
+        video_paths=(),
+        transition_offset=0,
+        still_from=False,
+    ):
+        """根据模板配置构建声明式时间线"""
+        return Timeline(
+            image_path=image_path,
+            clip_paths=list(video_paths),
+            transitions=[
+                self.transition_substitutes.get(t["name"], t["name"])
+                for t in transitions
+            ],
+            fps=self.FPS,
+            image_frames=self.IMAGE_FRAMES,
+            video_frames=self.VIDEO_FRAMES,
+            trans_frames=self.TRANS_FRAMES,
+            subtitle_frames=self.get_subtitle_frames() if image_path else 0,
+            transition_offset=transition_offset,
+            still_from=still_from,
+        )
 
-        total_frames = 0
+    def estimate_plan(self, plan) -> dict:
+        """估算执行计划耗时（转场开销使用转场目录实测值，按近期实测耗时校准）"""
+        return CostModel.predict(CostModel.base_estimate(plan, self.WIDTH, self.HEIGHT))
 
-        # ========== 第一部分：渲染图片 (8秒，使用图片边框 + 字幕) ==========
-        print(f"   🖼️  图片: {self.IMAGE_FRAMES} 帧 ({self.IMAGE_DURATION}秒)")
+    def record_cost(self, seconds: float, stages_before: dict = None):
+        """记录本次渲染的实测耗时，校准耗时估算（stages_before 为开始时的阶段耗时）"""
+        stages_before = stages_before or {}
+        estimate = self.render_estimate or CostModel.base_estimate(
+            ExecutionPlan(spans=[], clips=[], fps=self.FPS), self.WIDTH, self.HEIGHT
+        )
+        CostModel.record(
+            estimate,
+            {
+                name: value - stages_before.get(name, 0.0)
+                for name, value in self.stage_times.items()
+            },
+            seconds,
+        )
 
-        # 使用BorderRenderer将图片复合到边框上
-        position_config = self.config.config.get("image_position", {})
-        composited_img_data = self.image_border_renderer.composite_image_on_border(
-            self.image_path, position_config
+    def dry_run(self) -> dict:
+        """空跑：编译执行计划、查询分块缓存并估算耗时（不创建 GL 上下文、解码器和编码器）"""
+        transitions = load_transitions(self.config.transitions)
+        plan = compile_plan(
+            self.build_timeline(transitions, self.image_path, self.video_paths)
         )
+        return self.dry_run_plan(plan, transitions, image_path=self.image_path)
+
+    def dry_run_plan(self, plan, transitions, image_path=None, still_frame=None) -> dict:
+        """估算执行计划（分块缓存只查询，不取出条目）"""
+        pieces = None
+        if self.segment_cache:
+            if not hasattr(self, "image_border_renderer"):
+                self.load_overlays()
+            image_key = None
+            if image_path:
+                image_key = self.image_border_renderer.composite_key(
+                    image_path, self.config.config.get("image_position", {})
+                )
+            pieces = self.plan_pieces(
+                plan,
+                transitions,
+                Path(),
+                image_key=image_key,
+                still_frame=still_frame,
+                probe=True,
+            )
+        return estimate_render(
+            plan, self.WIDTH, self.HEIGHT, pieces, self.estimate_memory_mb()
+        )
+
+    def _get_transition_program(self, transitions, name):
+        """获取（并缓存）转场着色器程序"""
+        transition = next(t for t in transitions if t["name"] == name)
+        return self.gpu(self._transition_program, transition["source"])
+
+    def _transition_program(self, source):
+        # 按源码缓存（共享引擎时同一分辨率的任务共用）
+        cache = self._transition_programs
+        if source not in cache:
+            prog = create_transition_shader(self.ctx, source)
+            vao = self._create_vao(prog)
+            prog["tex0"].value = 0
+            prog["tex1"].value = 1
+            if "ratio" in prog:
+                prog["ratio"].value = self.WIDTH / self.HEIGHT
+            cache[source] = (prog, vao)
+        return cache[source]
+
+    def report_uploads(self):
+        """输出本任务的纹理上传统计"""
+        stats = self.textures.stats
         print(
-            f"   ✓ 图片已复合到边框 (位置: x={position_config.get('x')}, y={position_config.get('y')}, "
-            f"区域: {position_config.get('width')}x{position_config.get('height')})"
+            f"   📤 纹理上传: {stats.uploads} 次 {stats.upload_bytes / 1e6:.1f}MB，"
+            f"跳过 {stats.skipped} 次 {stats.skipped_bytes / 1e6:.1f}MB"
         )
 
-        # 生成字幕文本
-        from datetime import datetime
+    def report_memory(self):
+        """输出本任务的内存高水位"""
+        report = self.memory.report()
+        stages = ", ".join(f"{name} {mb:.0f}MB" for name, mb in report["stages"].items())
+        print(
+            f"   🧮 内存峰值: {report['peak_mb']:.0f}MB "
+            f"(ffmpeg {report['peak_children_mb']:.0f}MB; {stages})"
+        )
 
-        now = datetime.now()
-        subtitle_template = self.config.subtitle.get("template", "")
-        full_subtitle_text = subtitle_template.format(
-            year=now.year, month=now.month, day=now.day
+    def job_memory(self) -> JobMemory:
+        """本次渲染的内存统计（子进程按 pid 统计，进程内部分按估算）"""
+        return JobMemory(in_process_mb=estimate_in_process_mb(self.WIDTH, self.HEIGHT))
+
+    def estimate_memory_mb(self) -> float:
+        """估算本任务内存（MB），用于内存预算准入"""
+        return estimate_job_mb(self.WIDTH, self.HEIGHT, len(self.renditions))
+
+    def _encode(self, encoder, outputs, render_frames):
+        """
+        执行渲染并关闭编码器
+
+        取消或失败时立即终止编码器（关闭管道会让 ffmpeg 把已写入的帧编码完），
+        删除未完成的输出文件；解码器由 execute_plan 关闭。
+        """
+        token = self.cancel_token
+        self.memory.attach(encoder.pid)
+        try:
+            with token.on_cancel(lambda: kill_process(encoder)), self.memory.track(
+                token
+            ), self.memory.stage("render"):
+                result = render_frames()
+                token.raise_if_cancelled()
+                encoder.stdin.close()
+                encoder.wait()
+            token.raise_if_cancelled()
+            return result
+        except BaseException as e:
+            abort_encoder(encoder)
+            for path in outputs:
+                Path(path).unlink(missing_ok=True)
+            if token.cancelled and not isinstance(e, RenderCancelled):
+                raise RenderCancelled(token.reason) from e
+            raise
+
+    def _write_frame(self, encoder, frame):
+        """将一帧送入编码器（每帧检查取消）"""
+        self.cancel_token.raise_if_cancelled()
+        start = time.perf_counter()
+        encoder.stdin.write(frame)
+        self.stage_times["encode"] += time.perf_counter() - start
+        self.last_written_frame = frame
+        if self.preview is not None:
+            self.preview.capture(self.frame_cursor, frame)
+        self.frame_cursor += 1
+
+    def _read_frame(self, read):
+        """读取一帧（统计解码耗时）"""
+        start = time.perf_counter()
+        frame = read()
+        self.stage_times["decode"] += time.perf_counter() - start
+        return frame
+
+    def _write_frames(self, encoder, futures):
+        """
+        按顺序把 GL 工作的结果写入编码器，返回最后一帧
+
+        共享引擎时最多提前提交 GL_PIPELINE_DEPTH 帧（futures 为生成器，
+        取下一项时才读取和提交下一帧），引擎绘制时本任务继续解码和编码。
+        """
+        depth = GL_PIPELINE_DEPTH if self.engine is not None else 0
+        pending = deque()
+        final_frame = None
+        for future in futures:
+            pending.append(future)
+            while len(pending) > depth:
+                final_frame = pending.popleft().result()
+                self._write_frame(encoder, final_frame)
+        return final_frame
+
+    def _render_subtitle_frame(self, image_data, subtitle_text):
+        """在复合图片上叠加字幕"""
+        return self._submit_subtitle_frame(image_data, subtitle_text).result()
+
+    def _submit_subtitle_frame(self, image_data, subtitle_text) -> Future:
+        subtitle_data = self.subtitle_renderer.render_text(
+            subtitle_text,
+            color=tuple(self.config.font["color"]),
+            outline_color=tuple(self.config.font["outline_color"]),
+            outline_width=self.config.font["outline_width"],
         )
-        typewriter_speed = self.config.subtitle.get("typewriter_speed", 3)
-        subtitle_duration = self.config.subtitle.get("duration", 6.0)
-        subtitle_frames = int(subtitle_duration * self.FPS)
+        return self.gpu_submit(self._composite_subtitle_frame, image_data, subtitle_data)
 
-        print(f"   📝 字幕: {full_subtitle_text}")
+    def _composite_subtitle_frame(self, image_data, subtitle_data):
+        """GL 工作：上传复合图片和字幕，叠加后读出一帧"""
+        self.textures.write(self.subtitle_tex, subtitle_data)
 
-        # 渲染图片帧（图片已经包含边框，只需添加字幕）
-        for frame_idx in range(self.IMAGE_FRAMES):
-            # 直接将复合后的图片写入纹理
-            self.tex0.write(composited_img_data)
+        self.textures.write(self.temp_tex, image_data)
+        self.subtitle_fbo.use()
+        self.temp_tex.use(0)
+        self.subtitle_tex.use(1)
+        self.subtitle_vao.render()
+        final_frame = self.subtitle_fbo.read(components=3)
 
-            # 计算字幕文本（打字机效果）
-            subtitle_text = None
-            if frame_idx < subtitle_frames:
-                chars_to_show = (frame_idx // typewriter_speed) + 1
-                subtitle_text = full_subtitle_text[:chars_to_show]
+        # 恢复主FBO
+        self.fbo.use()
+        return final_frame
 
-            # 只需叠加字幕（不再需要边框）
-            if subtitle_text:
-                # 渲染字幕到纹理
-                subtitle_data = self.subtitle_renderer.render_text(
-                    subtitle_text,
-                    color=tuple(self.config.font["color"]),
-                    outline_color=tuple(self.config.font["outline_color"]),
-                    outline_width=self.config.font["outline_width"],
-                )
-                self.subtitle_tex.write(subtitle_data)
+    def _render_image_span(self, span, encoder, image_data, subtitle_text):
+        """渲染图片区间（图片已包含边框，只需添加字幕）"""
+        if span.static:
+            for _ in range(span.frames):
+                self._write_frame(encoder, image_data)
+            return image_data
 
-                # 叠加字幕
-                self.temp_tex.write(composited_img_data)
-                self.subtitle_fbo.use()
-                self.temp_tex.use(0)
-                self.subtitle_tex.use(1)
-                self.subtitle_vao.render()
-                final_frame = self.subtitle_fbo.read(components=3)
+        if not self.typewriter:
+            # 降级：字幕直接完整显示，只渲染一次
+            final_frame = self._render_subtitle_frame(image_data, subtitle_text)
+            for _ in range(span.frames):
+                self._write_frame(encoder, final_frame)
+            return final_frame
 
-                # 恢复主FBO
-                self.fbo.use()
-            else:
-                final_frame = composited_img_data
+        typewriter_speed = self.config.subtitle.get("typewriter_speed", 3)
+        final_frame = self._write_frames(
+            encoder,
+            (
+                self._submit_subtitle_frame(
+                    image_data, subtitle_text[: (frame_idx // typewriter_speed) + 1]
+                )
+                for frame_idx in range(span.start, span.end)
+            ),
+        )
+        return image_data if final_frame is None else final_frame
+
+    def _render_video_span(self, span, encoder, prog, vao, from_frame, to_reader):
+        """渲染转场或视频主体区间（叠加视频边框）"""
+
+        def frames():
+            # 解码在本任务线程中进行，GL 工作提交给 gpu_submit
+            for j in range(span.frames):
+                if span.kind == "transition":
+                    frame0 = self._read_frame(from_frame)
+                    frame1 = self._read_frame(to_reader.read_frame)
+                    progress = (j + 1) / span.frames
+                else:
+                    # progress=0 时转场着色器直接输出 tex0
+                    frame0 = self._read_frame(to_reader.read_frame)
+                    frame1, progress = None, 0.0
+                yield self.gpu_submit(
+                    self._composite_video_frame, prog, vao, frame0, frame1, progress
+                )
 
-            encoder.stdin.write(final_frame)
-            total_frames += 1
+        return self._write_frames(encoder, frames())
 
-        # ========== 第二部分：图片到视频的转场 ==========
-        print(f"   ✨ 转场: 图片→视频1", flush=True)
+    def _composite_video_frame(self, prog, vao, frame0, frame1, progress):
+        """GL 工作：上传片段帧，绘制转场（或片段主体）并叠加视频边框"""
+        self.textures.write(self.tex0, frame0)
+        if frame1 is not None:
+            self.textures.write(self.tex1, frame1)
+        prog["progress"].value = progress
 
-        # 加载第一个视频用于转场
-        first_video_path = self.video_paths[0]
-        first_vid = VideoReader(
-            first_video_path,
+        self.fbo.use()
+        self.tex0.use(0)
+        self.tex1.use(1)
+        vao.render()
+        return self.render_frame_with_border(use_image_border=False)
+
+    def open_reader(self, clip):
+        """打开视频片段解码器（优先复用流式上传时已预热的解码器）"""
+        reader = None
+        if not clip.start_frame:
+            reader = UploadManager.claim_reader(
+                clip.path, self.WIDTH, self.HEIGHT, self.FPS, clip.trim_duration
+            )
+        if reader is None:
+            reader = self._open_video_reader(clip)
+        if reader.process is not None:
+            self.memory.attach(reader.process.pid)
+        return reader
+
+    def _open_video_reader(self, clip):
+        """打开视频片段：已上传完成的片段优先从中间格式缓存读取"""
+        if UploadManager.is_receiving(clip.path) or not MezzanineCache.enabled():
+            return self._start_decoder(clip)
+        return MezzanineCache.open(
+            clip.path,
             self.WIDTH,
             self.HEIGHT,
             self.FPS,
             self.FRAME_SIZE,
-            self.VIDEO_DURATION,
+            clip.start_frame,
+            clip.read_frames,
+            lambda: self._start_decoder(clip),
         )
 
-        # 选择转场效果
-        transition = transitions[0]
-        print(f"      使用转场: {transition['name']}", flush=True)
+    def _start_decoder(self, clip):
+        """启动视频片段解码器"""
+        receiving = UploadManager.is_receiving(clip.path)
+        media_info = None
+        if not receiving:
+            try:
+                # 解码器只需要容器信息，不统计关键帧
+                media_info = probe_media(clip.path, keyframes=False)
+            except ValueError as e:
+                print(f"   ⚠️  {e}")
+        return VideoReader(
+            clip.path,
+            self.WIDTH,
+            self.HEIGHT,
+            self.FPS,
+            self.FRAME_SIZE,
+            clip.trim_duration,
+            follow=receiving,
+            media_info=media_info,
+            start_frame=clip.start_frame,
+        )
 
-        # 创建转场着色器
-        prog = create_transition_shader(self.ctx, transition["source"])
-        vao = self._create_vao(prog)
-        self.tex0.use(0)
-        self.tex1.use(1)
-        prog["tex0"].value = 0
-        prog["tex1"].value = 1
-        if "ratio" in prog:
-            prog["ratio"].value = self.WIDTH / self.HEIGHT
-
-        # 渲染转场帧
-        for j in range(self.TRANS_FRAMES):
-            # tex0: 图片（复合后的），tex1: 第一个视频的帧
-            self.tex0.write(composited_img_data)
-            self.tex1.write(first_vid.read_frame())
-            prog["progress"].value = (j + 1) / self.TRANS_FRAMES
-
-            self.fbo.use()
-            self.tex0.use(0)
-            self.tex1.use(1)
-            vao.render()
-
-            # 转场帧使用视频边框
-            final_frame = self.render_frame_with_border(use_image_border=False)
-            encoder.stdin.write(final_frame)
-            total_frames += 1
-
-        # ========== 第三部分：渲染视频序列 (每个16秒，使用视频边框) ==========
-        current_vid = first_vid  # 使用已经加载的第一个视频
-
-        for i, video_path in enumerate(self.video_paths):
-            is_last = i == len(self.video_paths) - 1
-
-            # 处理当前视频的加载
-            if i == 0:
-                # 第一个视频已经在转场时加载，已读取TRANS_FRAMES帧
-                frames_to_play = (
-                    self.SOLO_FRAMES
-                    if not is_last
-                    else (self.VIDEO_FRAMES - self.TRANS_FRAMES)
-                )
+    def execute_plan(
+        self,
+        plan,
+        transitions,
+        encoder,
+        image_data=None,
+        still_frame=None,
+        encoder_for=None,
+    ):
+        """
+        按执行计划渲染所有区间
+
+        Args:
+            plan: compile_plan 生成的执行计划
+            transitions: load_transitions 加载的转场列表
+            encoder: 编码器进程
+            image_data: 复合边框后的图片数据（图片区间 / 图片转场 from 侧）
+            still_frame: 上一段最后一帧（增量模式转场 from 侧）
+            encoder_for: 按区间选择编码器的函数（分块编码时代替 encoder）
+
+        Returns:
+            最后一帧数据
+        """
+        # 后续片段的解码器在后台提前打开，片段边界无需等待 ffmpeg 启动
+        self.render_estimate = CostModel.base_estimate(plan, self.WIDTH, self.HEIGHT)
+        preloader = ClipPreloader(plan, self.open_reader, self.FRAME_SIZE)
+        reader_for = preloader.get
+        subtitle_text = self.get_subtitle_text()
+        clip_prog = None
+        final_frame = None
+
+        try:
+            for span in plan.spans:
+                self.frame_cursor = span.start
+                if encoder_for is not None:
+                    encoder = encoder_for(span)
+                if span.kind == "image":
+                    if not span.static:
+                        print(f"   📝 字幕: {subtitle_text}")
+                    final_frame = self._render_image_span(
+                        span, encoder, image_data, subtitle_text
+                    )
+                elif span.kind == "transition":
+                    print(
+                        f"   ✨ 转场 → 视频{span.clip + 1}: {span.transition} "
+                        f"({span.frames}帧)",
+                        flush=True,
+                    )
+                    clip_prog = self._get_transition_program(
+                        transitions, span.transition
+                    )
+                    if span.from_kind == "clip":
+                        from_frame = reader_for(span.from_clip).read_frame
+                    elif span.from_kind == "image":
+                        from_frame = lambda: image_data
+                    else:
+                        from_frame = lambda: still_frame
+                    final_frame = self._render_video_span(
+                        span, encoder, *clip_prog, from_frame, reader_for(span.clip)
+                    )
+                else:
+                    print(
+                        f"   📹 视频 {span.clip + 1}/{len(plan.clips)}: {span.frames} 帧"
+                    )
+                    if clip_prog is None:
+                        clip_prog = self._get_transition_program(
+                            transitions, transitions[0]["name"]
+                        )
+                    final_frame = self._render_video_span(
+                        span, encoder, *clip_prog, None, reader_for(span.clip)
+                    )
+
+                for index in span.release_clips:
+                    preloader.release(index)
+        finally:
+            preloader.close()
+
+        self.stage_times["stall"] += preloader.stall_seconds
+        self.clip_stalls.extend(preloader.stall_report())
+        self.rendered_frames += plan.total_frames
+        return final_frame
+
+    def plan_pieces(
+        self, plan, transitions, workdir, image_key=None, still_frame=None, probe=False
+    ):
+        """
+        将执行计划划分为独立编码的分块，并从缓存中取出已有的分块
+
+        - 图片区间（字幕 + 静态尾部）合为一个分块，其余每个区间一个分块
+        - 键包含分辨率、帧率、编码参数、输出规格，以及分块读取的片段内容和帧范围、
+          边框快照、转场着色器源码；from 侧为图片时包含复合图片键，为上一段最后一帧时包含帧哈希
+        - 读取仍在上传的片段的分块不缓存
+
+        Args:
+            workdir: 本任务的分块目录
+            image_key: 复合图片的内容键（BorderRenderer.composite_key）
+            still_frame: 上一段最后一帧（增量模式转场 from 侧）
+            probe: 只查询缓存是否命中，不取出条目（空跑估算）
+        """
+        base = [
+            self.WIDTH,
+            self.HEIGHT,
+            self.FPS,
+            "cpu" if USE_CPU_ENCODER else self.ENCODER_OPTIONS,
+            [
+                [r.name, r.width, r.height, r.bitrate, r.vcodec, r.options]
+                for r in self.renditions
+            ],
+        ]
+        shader_hashes = {
+            t["name"]: hashlib.sha1(t["source"].encode()).hexdigest() for t in transitions
+        }
+        clip_hashes = {
+            clip.index: None
+            if UploadManager.is_receiving(clip.path)
+            else content_hash(clip.path)
+            for clip in plan.clips
+        }
+        reads = plan.clip_reads()
+
+        groups = []
+        for span in plan.spans:
+            if span.kind == "image" and groups and groups[-1][0] == "image":
+                groups[-1][1].append(span)
+            else:
+                groups.append((span.kind, [span]))
+
+        pieces = []
+        for kind, spans in groups:
+            span = spans[0]
+            if kind == "image":
+                parts = [
+                    image_key,
+                    self.image_border_renderer.snapshot,
+                    self.get_subtitle_text(),
+                    self.config.font,
+                    self.config.subtitle,
+                    self.typewriter,
+                    [[s.frames, s.static, s.subtitle_frames] for s in spans],
+                ]
+                cacheable = image_key is not None
+            else:
+                ranges = [
+                    [clip_hashes[clip], start, frames]
+                    for clip, start, frames in reads[span.index]
+                ]
+                parts = [ranges, self.video_border_renderer.snapshot]
+                cacheable = all(item[0] is not None for item in ranges)
+                if kind == "transition":
+                    parts += [span.transition, shader_hashes[span.transition]]
+                    if span.from_kind == "image":
+                        parts.append(image_key)
+                        cacheable = cacheable and image_key is not None
+                    elif span.from_kind == "still":
+                        if still_frame is None:
+                            cacheable = False
+                        else:
+                            parts.append(hashlib.sha1(still_frame).hexdigest())
+
+            directory = workdir / f"piece_{len(pieces)}"
+            piece = Piece(
+                kind, spans, cache_key(base, kind, parts) if cacheable else None, directory
+            )
+            if probe:
+                piece.cached = SegmentCache.contains(piece.key, self.renditions)
             else:
-                # 加载后续视频
-                trim_duration = (
-                    self.VIDEO_DURATION
-                    if not is_last
-                    else ((self.TRANS_FRAMES + self.VIDEO_FRAMES) / self.FPS + 1.0)
+                piece.cached = SegmentCache.fetch(piece.key, directory, self.renditions)
+            pieces.append(piece)
+        return pieces
+
+    def render_segments(
+        self,
+        plan,
+        transitions,
+        outputs,
+        image_data=None,
+        image_key=None,
+        still_frame=None,
+    ):
+        """
+        按分块渲染：命中缓存的分块直接复用，其余分块各用一个编码器渲染并写入缓存，
+        最后按顺序拼接到 outputs（流复制）
+
+        Args:
+            outputs: 输出文件 [主输出, 各规格...]（与 self.renditions 对应）
+
+        Returns:
+            最后一帧数据
+        """
+        token = self.cancel_token
+        workdir = SegmentCache.workdir()
+        current = {"piece": None, "encoder": None}
+
+        def finish():
+            """关闭当前分块的编码器并提交到缓存"""
+            piece, encoder = current["piece"], current["encoder"]
+            current["piece"] = current["encoder"] = None
+            encoder.stdin.close()
+            encoder.wait()
+            token.raise_if_cancelled()
+            if encoder.returncode:
+                raise RuntimeError(f"分块编码失败 (exit {encoder.returncode})")
+            (piece.directory / LAST_FRAME_FILE).write_bytes(self.last_written_frame)
+            if self.preview is not None:
+                # 预览采样随分块缓存，复用时无需解码
+                (piece.directory / PREVIEW_FILE).write_bytes(
+                    self.preview.dumps(piece.spans[0].start, piece.frames)
                 )
-                current_vid = VideoReader(
-                    video_path,
+            SegmentCache.store(piece.key, piece.directory)
+
+        def encoder_for(span):
+            piece = piece_of[span.index]
+            if piece is not current["piece"]:
+                if current["piece"] is not None:
+                    finish()
+                piece.directory.mkdir(parents=True, exist_ok=True)
+                main, *extra = video_files(piece.directory, self.renditions)
+                encoder = create_encoder(
                     self.WIDTH,
                     self.HEIGHT,
                     self.FPS,
-                    self.FRAME_SIZE,
-                    trim_duration,
-                )
-                frames_to_play = self.SOLO_FRAMES if not is_last else self.VIDEO_FRAMES
-
-            print(f"   📹 视频 {i+1}/{len(self.video_paths)}: {frames_to_play} 帧")
-
-            # 主体播放
-            for frame_idx in range(frames_to_play):
-                # 渲染视频帧
-                self.tex0.write(current_vid.read_frame())
-                prog["progress"].value = 0.0
-                self.fbo.use()
-                vao.render()
-
-                # 叠加视频边框
-                final_frame = self.render_frame_with_border(use_image_border=False)
-                encoder.stdin.write(final_frame)
-                total_frames += 1
-
-            # 视频间转场
-            if not is_last:
-                # 加载下一个视频
-                next_video_path = self.video_paths[i + 1]
-                is_next_last = (i + 1) == len(self.video_paths) - 1
-                trim_duration = (
-                    self.VIDEO_DURATION
-                    if not is_next_last
-                    else ((self.TRANS_FRAMES + self.VIDEO_FRAMES) / self.FPS + 1.0)
+                    str(main),
+                    self.ENCODER_OPTIONS,
+                    [(r, str(path)) for r, path in zip(self.renditions, extra)],
                 )
+                self.memory.attach(encoder.pid)
+                current.update(piece=piece, encoder=encoder)
+                # 创建编码器期间被取消时，取消回调没有终止新编码器
+                token.raise_if_cancelled()
+            return current["encoder"]
+
+        def kill_current():
+            if current["encoder"] is not None:
+                kill_process(current["encoder"])
+
+        try:
+            pieces = self.plan_pieces(
+                plan, transitions, workdir, image_key=image_key, still_frame=still_frame
+            )
+            self.segment_stats = PieceStats()
+            for piece in pieces:
+                self.segment_stats.add(piece)
+                if piece.cached and self.preview is not None:
+                    self._load_piece_preview(piece)
+            self.report_segments()
+
+            missing = [piece for piece in pieces if not piece.cached]
+            piece_of = {span.index: piece for piece in missing for span in piece.spans}
+            if missing:
+                with token.on_cancel(kill_current), self.memory.track(
+                    token
+                ), self.memory.stage("render"):
+                    self.execute_plan(
+                        plan.subset(piece_of),
+                        transitions,
+                        None,
+                        image_data=image_data,
+                        still_frame=still_frame,
+                        encoder_for=encoder_for,
+                    )
+                    finish()
+                token.raise_if_cancelled()
+            # 复用的帧同样计入输出帧数
+            self.rendered_frames += sum(p.frames for p in pieces if p.cached)
+
+            with self.memory.stage("concat"):
+                for path, rendition in zip(outputs, [None] + list(self.renditions)):
+                    assemble_pieces(pieces, path, self.FPS, rendition)
+            return pieces[-1].last_frame()
+        except BaseException as e:
+            if current["encoder"] is not None:
+                abort_encoder(current["encoder"])
+            for path in outputs:
+                Path(path).unlink(missing_ok=True)
+            if token.cancelled and not isinstance(e, RenderCancelled):
+                raise RenderCancelled(token.reason) from e
+            raise
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _load_piece_preview(self, piece):
+        """复用分块的预览采样：优先使用缓存中的采样结果，否则从分块码流中解码"""
+        start = piece.spans[0].start
+        path = piece.directory / PREVIEW_FILE
+        if path.exists() and self.preview.loads(path.read_bytes(), start, piece.frames):
+            return
+        self.preview.decode(video_files(piece.directory)[0], start, piece.frames)
+
+    def start_preview(self, offset: int = 0):
+        """开始预览采样（offset 为本次渲染在成品时间线中的起点）"""
+        self.preview = None
+        if self.preview_config.enabled:
+            self.preview = PreviewCapture(
+                self.WIDTH, self.HEIGHT, self.FPS, self.preview_config, offset
+            )
+
+    def publish_preview(self, preview, output_key: str, total_frames: int, store):
+        """生成封面、雪碧图和动态预览并写入输出存储，返回 {预览名: 访问地址}"""
+        with Workspace.open("preview") as workspace:
+            files = preview.write(workspace.path, Path(output_key).stem, total_frames)
+            outputs = {name: store.put_file(path, path.name) for name, path in files.items()}
+        if outputs:
+            print(f"   🖼️  预览: {', '.join(outputs)}")
+        return outputs
+
+    def report_segments(self):
+        """输出本次渲染的分块缓存命中情况"""
+        stats = self.segment_stats
+        kinds = ", ".join(
+            f"{kind} {hits}/{total}" for kind, (hits, total) in stats.kinds.items()
+        )
+        print(
+            f"   ♻️  分块缓存: 命中 {stats.hits}/{stats.pieces} ({kinds})，"
+            f"复用 {stats.frames_reused} 帧，渲染 {stats.frames_rendered} 帧"
+        )
+
+    def render(self):
+        """主渲染循环"""
+        start = time.perf_counter()
+        # 加载转场效果并编译执行计划
+        transitions = load_transitions(self.config.transitions)
+        plan = compile_plan(
+            self.build_timeline(transitions, self.image_path, self.video_paths)
+        )
+        plan.describe()
+        print(f"   ⏱️  预计耗时: {self.estimate_plan(plan)['total_ms'] / 1000:.1f}秒")
+
+        self.cancel_token.raise_if_cancelled()
+        self._ensure_gpu()
+        self.start_preview()
+
+        # 使用BorderRenderer将图片复合到边框上
+        print(f"   🖼️  图片: {self.IMAGE_FRAMES} 帧 ({self.IMAGE_DURATION}秒)")
+        position_config = self.config.config.get("image_position", {})
+        with self.memory.stage("composite"):
+            composited_img_data = self.image_border_renderer.composite_image_on_border(
+                self.image_path, position_config
+            )
+        print(
+            f"   ✓ 图片已复合到边框 (位置: x={position_config.get('x')}, y={position_config.get('y')}, "
+            f"区域: {position_config.get('width')}x{position_config.get('height')})"
+        )
 
-                next_vid = VideoReader(
-                    next_video_path,
+        # 中间文件写入本任务独占的工作目录（默认 tmpfs），结束或失败时删除
+        with Workspace.open(
+            "render",
+            intermediate_mb(
+                self.ENCODER_OPTIONS,
+                self.renditions,
+                plan.duration,
+                self.WIDTH,
+                self.HEIGHT,
+                self.FPS,
+            ),
+        ) as workspace:
+            self.temp_file = workspace.file("silent.mp4")
+            outputs = [(r, rendition_path(self.temp_file, r.name)) for r in self.renditions]
+            if self.segment_cache:
+                # 按分块渲染，复用缓存中的片段主体和转场
+                print("📂 开始渲染...")
+                self.render_segments(
+                    plan,
+                    transitions,
+                    [self.temp_file] + [path for _, path in outputs],
+                    image_data=composited_img_data,
+                    image_key=self.image_border_renderer.composite_key(
+                        self.image_path, position_config
+                    ),
+                )
+            else:
+                # 创建编码器
+                encoder = create_encoder(
                     self.WIDTH,
                     self.HEIGHT,
                     self.FPS,
-                    self.FRAME_SIZE,
-                    trim_duration,
+                    self.temp_file,
+                    self.ENCODER_OPTIONS,
+                    outputs,
+                )
+                print("📂 开始渲染...")
+                self._encode(
+                    encoder,
+                    [self.temp_file] + [path for _, path in outputs],
+                    lambda: self.execute_plan(
+                        plan, transitions, encoder, image_data=composited_img_data
+                    ),
                 )
 
-                # 转场效果（图片→视频1用了transitions[0]，视频1→视频2用transitions[1]，依此类推）
-                transition = transitions[(i + 1) % len(transitions)]
-                print(f"   ✨ 转场 {i+1}→{i+2}: {transition['name']}")
-
-                # 切换着色器
-                prog = create_transition_shader(self.ctx, transition["source"])
-                vao = self._create_vao(prog)
-                self.tex0.use(0)
-                self.tex1.use(1)
-                prog["tex0"].value = 0
-                prog["tex1"].value = 1
-                if "ratio" in prog:
-                    prog["ratio"].value = self.WIDTH / self.HEIGHT
-
-                # 渲染转场帧
-                for j in range(self.TRANS_FRAMES):
-                    self.tex0.write(current_vid.read_frame())
-                    self.tex1.write(next_vid.read_frame())
-                    prog["progress"].value = (j + 1) / self.TRANS_FRAMES
-
-                    self.fbo.use()
-                    self.tex0.use(0)
-                    self.tex1.use(1)
-                    vao.render()
-
-                    # 转场帧使用视频边框
-                    final_frame = self.render_frame_with_border(use_image_border=False)
-                    encoder.stdin.write(final_frame)
-                    total_frames += 1
-
-                current_vid.close()
-                current_vid = next_vid
-            else:
-                # 最后一个视频，关闭
-                current_vid.close()
-
-        encoder.stdin.close()
-        encoder.wait()
-
-        print(f"📊 总帧数: {total_frames} ({total_frames/self.FPS:.1f}秒)")
+            total_frames = plan.total_frames
+            print(f"📊 总帧数: {total_frames} ({total_frames/self.FPS:.1f}秒)")
+            print(f"   ⏱️  片段边界等待: {self.stage_times['stall'] * 1000:.0f}ms")
+            self.report_uploads()
 
-        # 合并音频
-        merge_audio(self.temp_file, self.config.bgm["path"], self.output_file)
-        print(f"✅ 完成: {self.output_file}")
+            # 合并音频并写入输出存储（每个输出规格分别封装）
+            output_key = Path(self.output_file).name
+            with self.memory.stage("mux"):
+                self.output_url = merge_audio(
+                    self.temp_file, self.config.bgm["path"], output_key, self.output_store
+                )
+                for rendition in self.renditions:
+                    self.rendition_outputs[rendition.name] = merge_audio(
+                        rendition_path(self.temp_file, rendition.name),
+                        self.config.bgm["path"],
+                        rendition_path(output_key, rendition.name),
+                        self.output_store,
+                    )
+        if self.preview is not None:
+            # 采样在渲染期间已完成，这里只拼接和压缩
+            with self.memory.stage("preview"):
+                self.preview_outputs = self.publish_preview(
+                    self.preview, output_key, total_frames, self.output_store
+                )
+        self.report_memory()
+        self.record_cost(time.perf_counter() - start)
+        print(f"✅ 完成: {self.output_url}")
@@ -0,0 +1,325 @@
+"""
+批量渲染 - 读取 JSONL 任务文件，在进程池中并行渲染
+
+任务格式（每行一个 JSON 对象）：
+    {"id": "visitor-001", "template": "classic", "image_path": "...", "video_paths": ["..."],
+     "mode": "render", "profile": null, "renditions": ["720p"], "output": "visitor-001.mp4"}
+
+- mode: render（一次性渲染，默认）或 incremental（init + append + finalize 流程）
+- 每个工作进程按 (模板, 档位, 输出规格) 缓存渲染器：模板配置、GL 上下文、已编译的转场着色器
+  和边框纹理在任务之间复用；照片合成缓存和媒体探测缓存同样在进程内共享
+- 结果逐行写入 JSONL（状态、输出、耗时、实时率、各阶段耗时、内存高水位）
+- 工作进程数受内存预算（AUTOVLOG_MEMORY_BUDGET_MB）限制，单任务超过 AUTOVLOG_JOB_MEMORY_MB 时中止
+"""
+
+import os
+import json
+import time
+import multiprocessing
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, asdict, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from src.media_probe import check_renderable, probe_media
+from src.memory_budget import MemoryBudget, estimate_job_mb
+
+
+# 每个工作进程缓存的渲染器数量（每个渲染器持有一个 GL 上下文）
+MAX_CACHED_RENDERERS = 4
+
+
+@dataclass
+class BatchJob:
+    """批量任务"""
+    id: str
+    template: str
+    image_path: str
+    video_paths: List[str]
+    mode: str = "render"  # 'render', 'incremental'
+    profile: Optional[str] = None
+    renditions: List[str] = field(default_factory=list)
+    output: Optional[str] = None
+
+    @property
+    def renderer_key(self) -> tuple:
+        return (self.template, self.profile, tuple(self.renditions))
+
+
+@dataclass
+class BatchResult:
+    """任务结果"""
+    id: str
+    status: str  # 'ok', 'error'
+    mode: str
+    output: Optional[str] = None
+    renditions: Dict[str, str] = field(default_factory=dict)
+    preview: Dict[str, str] = field(default_factory=dict)  # 封面、雪碧图和动态预览
+    seconds: float = 0.0
+    frames: int = 0
+    realtime_factor: Optional[float] = None
+    stages: Dict[str, float] = field(default_factory=dict)
+    uploads: Dict[str, int] = field(default_factory=dict)
+    stalls: List[dict] = field(default_factory=list)  # 片段边界等待时间
+    memory: Dict[str, object] = field(default_factory=dict)  # 内存高水位（MB）
+    cache: Dict[str, object] = field(default_factory=dict)  # 分块缓存命中情况
+    reused_renderer: bool = False
+    worker: Optional[int] = None
+    error: Optional[str] = None
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def load_jobs(path: Path) -> List[BatchJob]:
+    """读取 JSONL 任务文件（空行和 # 注释行跳过）"""
+    jobs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                data = json.loads(line)
+                data.setdefault("id", f"job_{line_no}")
+                data["renditions"] = data.get("renditions") or []
+                job = BatchJob(**data)
+            except (ValueError, TypeError) as e:
+                raise ValueError(f"任务文件第 {line_no} 行格式错误: {e}")
+            if job.mode not in ("render", "incremental"):
+                raise ValueError(f"任务文件第 {line_no} 行 mode 无效: {job.mode}")
+            jobs.append(job)
+    return jobs
+
+
+# ==================== 工作进程 ====================
+
+_settings: dict = {}
+_renderers: "OrderedDict[tuple, object]" = OrderedDict()
+
+
+def _init_worker(settings: dict):
+    """工作进程初始化（软件 GL 必须在创建上下文之前设置）"""
+    _settings.update(settings)
+    os.chdir(settings["cwd"])
+    if settings.get("software"):
+        from src.shaders import use_software_gl
+
+        use_software_gl()
+
+
+def _encoder_options(renderer):
+    from src.video import CPU_ENCODER_OPTIONS
+
+    if _settings.get("cpu_encoder"):
+        return dict(CPU_ENCODER_OPTIONS)
+    return renderer.config.encoder_options
+
+
+def _validate_media(job: BatchJob):
+    """渲染前拒绝无法渲染的素材"""
+    check_renderable(probe_media(job.image_path, keyframes=False), require_video=False)
+    for path in job.video_paths:
+        check_renderable(probe_media(path))
+
+
+def _get_renderer(job: BatchJob, output_file: str, store):
+    """取出（或创建）与任务匹配的渲染器"""
+    from src.api_renderer import ApiVlogRenderer
+
+    key = job.renderer_key
+    renderer = _renderers.pop(key, None)
+    reused = renderer is not None
+    if reused:
+        renderer.prepare_job(job.image_path, job.video_paths, output_file)
+    else:
+        renderer = ApiVlogRenderer(
+            template_name=job.template,
+            image_path=job.image_path,
+            video_paths=job.video_paths,
+            output_file=output_file,
+            profile=job.profile,
+            renditions=job.renditions,
+            output_store=store,
+        )
+    _renderers[key] = renderer
+
+    # 超出缓存数量时释放最久未使用的渲染器
+    while len(_renderers) > MAX_CACHED_RENDERERS:
+        _, evicted = _renderers.popitem(last=False)
+        evicted.cleanup()
+    return renderer, reused
+
+
+def _run_render(job: BatchJob, output_dir: Path, store, result: BatchResult):
+    output_file = str(output_dir / (job.output or f"{job.id}.mp4"))
+    renderer, result.reused_renderer = _get_renderer(job, output_file, store)
+    renderer.ENCODER_OPTIONS = _encoder_options(renderer)
+    renderer.render()
+
+    result.output = renderer.output_url
+    result.renditions = dict(renderer.rendition_outputs)
+    result.preview = dict(renderer.preview_outputs)
+    result.frames = renderer.rendered_frames
+    result.stages = dict(renderer.stage_times)
+    result.uploads = renderer.textures.stats.to_dict()
+    result.stalls = list(renderer.clip_stalls)
+    result.memory = renderer.memory.report()
+    result.cache = renderer.segment_stats.to_dict()
+    return renderer.FPS
+
+
+def _run_incremental(job: BatchJob, output_dir: Path, store, result: BatchResult):
+    from src.incremental_renderer import IncrementalRenderer
+    from src.session_manager import SessionManager
+
+    session_id = SessionManager.create_session(job.template, job.profile, job.renditions)
+    renderer = IncrementalRenderer(session_id, job.template, job.profile, job.renditions)
+    renderer.ENCODER_OPTIONS = _encoder_options(renderer)
+    from src.segment_cache import PieceStats
+
+    uploads = Counter()
+    segments = []
+    cache = PieceStats()
+    try:
+        renderer.render_init(job.image_path)
+        uploads.update(renderer.textures.stats.to_dict())
+        segments.append(renderer.memory.report())
+        cache.merge(renderer.segment_stats)
+        for path in job.video_paths:
+            renderer.render_append(path)
+            uploads.update(renderer.textures.stats.to_dict())
+            segments.append(renderer.memory.report())
+            cache.merge(renderer.segment_stats)
+        result.output, _ = renderer.finalize(
+            str(output_dir / (job.output or f"{job.id}.mp4")), store
+        )
+    finally:
+        renderer.cleanup()
+        SessionManager.cleanup_session(session_id, keep_final_video=False)
+
+    result.renditions = dict(renderer.rendition_outputs)
+    result.preview = dict(renderer.preview_outputs)
+    result.frames = renderer.rendered_frames
+    result.stages = dict(renderer.stage_times)
+    result.uploads = dict(uploads)
+    result.memory = {
+        "peak_mb": max(report["peak_mb"] for report in segments),
+        "segments": segments,
+    }
+    result.cache = cache.to_dict()
+    return renderer.FPS
+
+
+def run_job(job: BatchJob) -> BatchResult:
+    """在工作进程中执行一个任务"""
+    from src.output_store import LocalOutputStore
+
+    output_dir = Path(_settings["output_dir"])
+    store = LocalOutputStore(output_dir)
+    result = BatchResult(id=job.id, status="ok", mode=job.mode, worker=os.getpid())
+    start = time.perf_counter()
+    try:
+        _validate_media(job)
+        if job.mode == "incremental":
+            fps = _run_incremental(job, output_dir, store, result)
+        else:
+            fps = _run_render(job, output_dir, store, result)
+        if result.frames:
+            result.realtime_factor = (time.perf_counter() - start) / (result.frames / fps)
+    except Exception as e:
+        result.status = "error"
+        result.error = f"{type(e).__name__}: {e}"
+        # 失败的渲染器状态不可信，不再复用
+        stale = _renderers.pop(job.renderer_key, None)
+        if stale is not None:
+            stale.cleanup()
+    result.seconds = round(time.perf_counter() - start, 3)
+    return result
+
+
+# ==================== 调度 ====================
+
+
+def _estimate_memory_mb(job: BatchJob) -> float:
+    """按模板档位的分辨率估算任务内存"""
+    from src.config import TemplateConfig
+
+    config = TemplateConfig(job.template, job.profile)
+    return estimate_job_mb(
+        config.global_config["width"],
+        config.global_config["height"],
+        len(job.renditions),
+    )
+
+
+def run_batch(
+    jobs: List[BatchJob],
+    output_dir: Path,
+    results_path: Path,
+    workers: int = 2,
+    software: bool = False,
+    cpu_encoder: bool = False,
+) -> List[BatchResult]:
+    """
+    在进程池中执行所有任务，结果按完成顺序写入 results_path
+
+    任务按渲染器配置分组提交，同一工作进程更容易连续拿到可复用渲染器的任务。
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    settings = {
+        "cwd": os.getcwd(),
+        "output_dir": str(output_dir.resolve()),
+        "software": software,
+        "cpu_encoder": cpu_encoder,
+    }
+    ordered = sorted(jobs, key=lambda job: (job.mode, repr(job.renderer_key)))
+
+    # 按内存预算限制并发：工作进程数 × 最大任务估算内存不超过预算
+    job_mb = max((_estimate_memory_mb(job) for job in jobs), default=0)
+    affordable = max(1, int(MemoryBudget.capacity() // job_mb)) if job_mb else workers
+    if affordable < workers:
+        print(
+            f"⚠️  内存预算 {MemoryBudget.capacity():.0f}MB 只够 {affordable} 个任务"
+            f"（单任务估算 {job_mb:.0f}MB），工作进程数 {workers} → {affordable}"
+        )
+        workers = affordable
+
+    # GL/CUDA 上下文不能跨 fork 继承，使用 spawn 启动工作进程
+    context = multiprocessing.get_context("spawn")
+    results = []
+    start = time.perf_counter()
+    print(f"📦 批量渲染: {len(jobs)} 个任务, {workers} 个工作进程")
+    with open(results_path, "w", encoding="utf-8") as out, ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(settings,),
+    ) as pool:
+        futures = {pool.submit(run_job, job): job for job in ordered}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # 工作进程异常退出（如驱动崩溃）
+                result = BatchResult(
+                    id=job.id, status="error", mode=job.mode, error=f"worker: {e}"
+                )
+            results.append(result)
+            out.write(json.dumps(result.to_dict(), ensure_ascii=False) + "\n")
+            out.flush()
+            mark = "✅" if result.status == "ok" else "❌"
+            print(
+                f"{mark} [{len(results)}/{len(jobs)}] {result.id} "
+                f"({result.seconds:.1f}秒){' ' + result.error if result.error else ''}"
+            )
+
+    elapsed = time.perf_counter() - start
+    ok = [r for r in results if r.status == "ok"]
+    print(
+        f"\n📊 完成 {len(ok)}/{len(jobs)}，总耗时 {elapsed:.1f}秒，"
+        f"复用渲染器 {sum(r.reused_renderer for r in ok)} 次"
+    )
+    return results
@@ -0,0 +1,123 @@
+"""
+协作式取消 - 客户端断开、显式取消或超过截止时间时中止渲染
+
+- CancelToken: 渲染循环每帧检查；取消时立即执行注册的回调（如终止编码器进程），
+  让阻塞在管道读写上的渲染线程尽快退出
+- CancelRegistry: 按任务 ID 登记进行中的任务，供取消接口查找
+- RenderCancelled: 渲染被取消时抛出，调用方负责清理（编码器、解码器、临时文件）
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+
+class RenderCancelled(Exception):
+    """渲染已取消"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancelToken:
+    """取消令牌（线程安全）"""
+
+    def __init__(self, timeout: Optional[float] = None, job_id: Optional[str] = None):
+        """
+        Args:
+            timeout: 截止时间（秒，从现在起），None 表示不限
+            job_id: 任务 ID（用于显式取消）
+        """
+        self.job_id = job_id
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.reason: Optional[str] = None
+        self.timed_out = False
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.timed_out = True
+            self.cancel("超过截止时间")
+            return True
+        return False
+
+    def cancel(self, reason: str = "已取消"):
+        """取消任务并执行回调（重复调用无效）"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"   ⚠️  取消回调失败: {e}")
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise RenderCancelled(self.reason)
+
+    @contextmanager
+    def on_cancel(self, callback: Callable):
+        """在代码块执行期间登记取消回调（已取消时立即执行）"""
+        with self._lock:
+            already = self._event.is_set()
+            if not already:
+                self._callbacks.append(callback)
+        if already:
+            callback()
+        try:
+            yield
+        finally:
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+
+
+class CancelRegistry:
+    """进行中任务的取消令牌（同一任务 ID 可对应多个令牌，如同一会话排队中的请求）"""
+
+    _tokens: Dict[str, List[CancelToken]] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    @contextmanager
+    def scope(token: CancelToken):
+        """任务执行期间登记令牌（没有任务 ID 时不登记）"""
+        if token.job_id is None:
+            yield token
+            return
+        with CancelRegistry._lock:
+            CancelRegistry._tokens.setdefault(token.job_id, []).append(token)
+        try:
+            yield token
+        finally:
+            with CancelRegistry._lock:
+                tokens = CancelRegistry._tokens.get(token.job_id, [])
+                if token in tokens:
+                    tokens.remove(token)
+                if not tokens:
+                    CancelRegistry._tokens.pop(token.job_id, None)
+
+    @staticmethod
+    def cancel(job_id: str, reason: str = "已取消") -> bool:
+        """取消任务，任务不存在时返回 False"""
+        with CancelRegistry._lock:
+            tokens = list(CancelRegistry._tokens.get(job_id, []))
+        for token in tokens:
+            token.cancel(reason)
+        return bool(tokens)
+
+    @staticmethod
+    def active() -> list:
+        with CancelRegistry._lock:
+            return list(CancelRegistry._tokens)
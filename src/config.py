@@ -2,6 +2,7 @@
 配置加载模块 - 负责加载和验证模板配置
 """
 
+import copy
 import yaml
 import os
 from pathlib import Path
@@ -11,11 +12,17 @@ from datetime import datetime
 class TemplateConfig:
     """模板配置类"""
 
-    def __init__(self, template_name: str):
+    def __init__(self, template_name: str, profile: str = None):
         self.template_name = template_name
+        self.profile_name = profile
         self.config_path = Path("config.yaml")
         self.config = self._load_config(template_name)
-        self.global_config = self._load_global_config()
+        self.base_global_config = self._load_global_config()
+        self.global_config = dict(self.base_global_config)
+        self.encoder_options = {}
+        self.scale = 1.0
+        if profile:
+            self._apply_profile(self._load_profile(profile))
         self._validate_config()
 
     def _load_config(self, template_name: str) -> dict:
@@ -39,7 +46,12 @@ class TemplateConfig:
 
     def _load_global_config(self) -> dict:
         """加载全局渲染参数配置"""
-        with open(self.config_path, "r", encoding="utf-8") as f:
+        return TemplateConfig.load_global_config(self.config_path)
+
+    @staticmethod
+    def load_global_config(config_path: Path = Path("config.yaml")) -> dict:
+        """读取全局渲染参数（不依赖具体模板）"""
+        with open(config_path, "r", encoding="utf-8") as f:
             all_configs = yaml.safe_load(f)
 
         # 返回全局配置，如果不存在则返回默认值
@@ -55,6 +67,51 @@ class TemplateConfig:
             },
         )
 
+    def _load_profile(self, profile: str) -> dict:
+        """加载渲染档位配置（如 draft 低分辨率预览）"""
+        with open(self.config_path, "r", encoding="utf-8") as f:
+            all_configs = yaml.safe_load(f)
+
+        profiles = all_configs.get("profiles") or {}
+        if profile not in profiles:
+            raise ValueError(
+                f"渲染档位 '{profile}' 不存在\n" f"可用档位: {list(profiles.keys())}"
+            )
+        return profiles[profile] or {}
+
+    def _apply_profile(self, profile_config: dict):
+        """应用渲染档位：覆盖全局参数，并按比例缩放模板中的像素坐标和字号"""
+        profile_config = dict(profile_config)
+        self.encoder_options = profile_config.pop("encoder", None) or {}
+        self.global_config.update(profile_config)
+
+        base = self.base_global_config
+        self.scale = min(
+            self.global_config["width"] / base["width"],
+            self.global_config["height"] / base["height"],
+        )
+        fps_ratio = self.global_config["fps"] / base["fps"]
+
+        self.config = copy.deepcopy(self.config)
+        if "image_position" in self.config:
+            self.config["image_position"] = {
+                key: int(round(value * self.scale))
+                for key, value in self.config["image_position"].items()
+            }
+
+        font = self.config["font"]
+        font["size"] = max(1, int(round(font["size"] * self.scale)))
+        font["outline_width"] = int(round(font.get("outline_width", 0) * self.scale))
+
+        subtitle = self.config["subtitle"]
+        subtitle["bottom_margin"] = int(
+            round(subtitle.get("bottom_margin", 100) * self.scale)
+        )
+        # 打字机速度以帧为单位，按帧率换算以保持相同的时长
+        subtitle["typewriter_speed"] = max(
+            1, int(round(subtitle.get("typewriter_speed", 3) * fps_ratio))
+        )
+
     def _validate_config(self):
         """验证配置文件完整性"""
         required_keys = ["border", "bgm", "transitions", "font", "subtitle"]
@@ -94,6 +151,56 @@ class TemplateConfig:
         except Exception:
             return []
 
+    def get_renditions(self, names: list) -> list:
+        """获取附加输出规格配置，跳过大于当前渲染分辨率的规格"""
+        with open(self.config_path, "r", encoding="utf-8") as f:
+            all_configs = yaml.safe_load(f)
+
+        available = all_configs.get("renditions") or {}
+        renditions = []
+        for name in names or []:
+            if name not in available:
+                raise ValueError(
+                    f"输出规格 '{name}' 不存在\n" f"可用规格: {list(available.keys())}"
+                )
+            rendition = dict(available[name], name=name)
+            if (
+                rendition["width"] > self.global_config["width"]
+                or rendition["height"] > self.global_config["height"]
+            ):
+                print(f"⚠️  跳过输出规格 {name}: 大于渲染分辨率")
+                continue
+            renditions.append(rendition)
+        return renditions
+
+    @staticmethod
+    def list_available_renditions() -> list:
+        """列出所有可用输出规格"""
+        config_path = Path("config.yaml")
+        if not config_path.exists():
+            return []
+
+        try:
+            with open(config_path, "r", encoding="utf-8") as f:
+                all_configs = yaml.safe_load(f)
+            return list((all_configs.get("renditions") or {}).keys())
+        except Exception:
+            return []
+
+    @staticmethod
+    def list_available_profiles() -> list:
+        """列出所有可用渲染档位"""
+        config_path = Path("config.yaml")
+        if not config_path.exists():
+            return []
+
+        try:
+            with open(config_path, "r", encoding="utf-8") as f:
+                all_configs = yaml.safe_load(f)
+            return list((all_configs.get("profiles") or {}).keys())
+        except Exception:
+            return []
+
     def get_subtitle_text(self) -> str:
         """生成字幕文本（带日期）"""
         now = datetime.now()
@@ -107,4 +214,6 @@ class TemplateConfig:
         raise AttributeError(f"配置项 '{name}' 不存在")
 
     def __repr__(self):
+        if self.profile_name:
+            return f"TemplateConfig('{self.template_name}', profile='{self.profile_name}')"
         return f"TemplateConfig('{self.template_name}')"
@@ -0,0 +1,255 @@
+"""
+渲染耗时估算 - 不渲染即可给出执行计划、各阶段耗时、缓存命中、排队等待和完成时间
+
+ExecutionPlan.estimate_cost 按默认单帧开销和转场目录实测值计算操作数和基准耗时，
+CostModel 用本进程近期完成的渲染校准：
+- 解码（含片段边界等待）、编码按实测阶段耗时 / 操作数得到单帧开销（按像素数换算到目标分辨率）
+- GL 工作（上传、转场、叠加、回读、字幕）和固定开销（合成、拼接、封装）按 实测 = 固定 + 系数 × 基准 拟合
+- 完成时间的误差范围取近期任务 实测 / 估算 比值的 p10 / p90
+
+estimate_render 对执行计划做空跑：分块缓存只查询不取出，命中的分块不计渲染开销；
+排队等待按内存预算和进行中任务的预计剩余时间估算。调度、降级和压测使用同一套数字。
+"""
+
+import os
+import threading
+from collections import deque
+from statistics import median
+from typing import Dict, List, Optional
+
+from src.timeline import DEFAULT_STAGE_COSTS
+from src.transition_catalog import TransitionCatalog
+
+
+# 校准使用的近期任务数
+COST_WINDOW = int(os.getenv("AUTOVLOG_COST_WINDOW", "50"))
+
+# 默认单帧开销对应的分辨率
+REFERENCE_PIXELS = 1920 * 1080
+
+# 尚未校准时的固定开销（毫秒）和误差范围（实测 / 估算 的 p10, p50, p90）
+DEFAULT_OVERHEAD_MS = 1500.0
+DEFAULT_ERROR_BAND = (0.7, 1.0, 1.6)
+
+# 计算误差范围需要的最少样本数
+MIN_SAMPLES = 5
+
+# 计入 GL 工作的阶段
+GL_STAGES = ("upload", "transition", "overlay", "readback", "subtitle")
+
+
+def _quantile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class CostModel:
+    """按近期实测耗时校准的渲染耗时模型（进程内）"""
+
+    _samples: deque = deque(maxlen=COST_WINDOW)
+    _lock = threading.Lock()
+
+    @staticmethod
+    def base_estimate(plan, width: int, height: int) -> dict:
+        """执行计划的基准估算：默认单帧开销按像素数换算，转场使用转场目录实测值"""
+        scale = width * height / REFERENCE_PIXELS
+        names = {span.transition for span in plan.spans if span.transition}
+        estimate = plan.estimate_cost(
+            stage_costs={key: cost * scale for key, cost in DEFAULT_STAGE_COSTS.items()},
+            transition_costs=TransitionCatalog.transition_costs(names, width, height),
+        )
+        estimate["pixel_scale"] = scale
+        estimate["gl_ms"] = sum(estimate["stages_ms"][key] for key in GL_STAGES)
+        return estimate
+
+    @staticmethod
+    def _calibration() -> dict:
+        """当前校准参数（样本不足时使用默认值）"""
+        with CostModel._lock:
+            samples = list(CostModel._samples)
+
+        def per_op(stage):
+            ops = sum(s["ops"][stage] for s in samples)
+            if not ops:
+                return DEFAULT_STAGE_COSTS[stage]
+            return sum(s["measured_ms"][stage] for s in samples) / ops
+
+        # GL 工作与固定开销：最小二乘拟合 实测 = 固定 + 系数 × 基准
+        xs = [s["gl_ms"] for s in samples]
+        ys = [s["measured_ms"]["rest"] for s in samples]
+        slope, overhead = 1.0, DEFAULT_OVERHEAD_MS
+        if len(samples) >= 3 and max(xs) > min(xs):
+            mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+            slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / sum(
+                (x - mean_x) ** 2 for x in xs
+            )
+            slope = max(slope, 0.1)
+            overhead = max(mean_y - slope * mean_x, 0.0)
+        elif samples:
+            overhead = median(max(y - x, 0.0) for x, y in zip(xs, ys))
+
+        calibration = {
+            "samples": len(samples),
+            "decode_ms": per_op("decode"),  # 1080p 单帧
+            "encode_ms": per_op("encode"),
+            "gl_scale": slope,
+            "overhead_ms": overhead,
+            "error_band": DEFAULT_ERROR_BAND,
+        }
+        # 误差范围：近期任务 实测 / 按当前参数的估算
+        ratios = []
+        for s in samples:
+            predicted = CostModel.predict(s["estimate"], calibration)["total_ms"] / 1000
+            if predicted > 0:
+                ratios.append(s["measured_s"] / predicted)
+        if len(ratios) >= MIN_SAMPLES:
+            calibration["error_band"] = (
+                _quantile(ratios, 0.1),
+                _quantile(ratios, 0.5),
+                _quantile(ratios, 0.9),
+            )
+        return calibration
+
+    @staticmethod
+    def predict(estimate: dict, calibration: Optional[dict] = None) -> dict:
+        """按校准参数换算基准估算，返回各阶段耗时（毫秒）"""
+        calibration = calibration or CostModel._calibration()
+        ops, scale = estimate["operations"], estimate["pixel_scale"]
+        stages = {
+            "decode": ops["decode"] * calibration["decode_ms"] * scale,
+            "render": estimate["gl_ms"] * calibration["gl_scale"],
+            "encode": ops["encode"] * calibration["encode_ms"] * scale,
+            "overhead": calibration["overhead_ms"],
+        }
+        return {"stages_ms": stages, "total_ms": sum(stages.values())}
+
+    @staticmethod
+    def eta(render_seconds: float, queue_seconds: float = 0.0) -> dict:
+        """完成时间（秒）：排队等待 + 渲染耗时 × 近期误差范围"""
+        low, mid, high = CostModel._calibration()["error_band"]
+        return {
+            "p10": round(queue_seconds + render_seconds * low, 2),
+            "p50": round(queue_seconds + render_seconds * mid, 2),
+            "p90": round(queue_seconds + render_seconds * high, 2),
+        }
+
+    @staticmethod
+    def record(estimate: dict, stage_times: Dict[str, float], seconds: float):
+        """
+        记录一次完成的渲染
+
+        Args:
+            estimate: 实际渲染部分（不含命中缓存的分块）的基准估算
+            stage_times: 本次渲染的 decode / encode / stall 耗时（秒）
+            seconds: 本次渲染总耗时（秒）
+        """
+        scale = estimate["pixel_scale"]
+        decode_ms = (stage_times.get("decode", 0.0) + stage_times.get("stall", 0.0)) * 1000
+        encode_ms = stage_times.get("encode", 0.0) * 1000
+        sample = {
+            "ops": {
+                "decode": estimate["operations"]["decode"],
+                "encode": estimate["operations"]["encode"],
+            },
+            # 解码、编码换算到默认分辨率
+            "measured_ms": {
+                "decode": decode_ms / scale,
+                "encode": encode_ms / scale,
+                "rest": max(seconds * 1000 - decode_ms - encode_ms, 0.0),
+            },
+            "gl_ms": estimate["gl_ms"],
+            "estimate": {
+                key: estimate[key] for key in ("operations", "pixel_scale", "gl_ms")
+            },
+            "measured_s": seconds,
+        }
+        with CostModel._lock:
+            CostModel._samples.append(sample)
+
+    @staticmethod
+    def status() -> dict:
+        """校准参数（/api/load）"""
+        calibration = CostModel._calibration()
+        return {
+            key: [round(v, 3) for v in value] if isinstance(value, tuple) else round(value, 3)
+            for key, value in calibration.items()
+        }
+
+
+def estimate_queue_wait(memory_mb: float) -> float:
+    """
+    估算排队等待（秒）：内存额度足够时为 0，否则按进行中任务的预计剩余时间，
+    等到释放的额度足够为止（每个进行中任务按平均额度释放）
+    """
+    from src.load_controller import LoadController
+    from src.memory_budget import MemoryBudget
+
+    status = MemoryBudget.status()
+    capacity, reserved = status["capacity_mb"], status["reserved_mb"]
+    deficit = reserved + min(memory_mb, capacity) - capacity
+    if deficit <= 0:
+        return 0.0
+    remaining = sorted(LoadController.remaining_seconds())
+    if not remaining:
+        return 0.0
+    freed_per_job = reserved / len(remaining)
+    for count, seconds in enumerate(remaining, start=1):
+        if count * freed_per_job >= deficit:
+            return round(seconds, 2)
+    return round(remaining[-1], 2)
+
+
+def estimate_render(
+    plan, width: int, height: int, pieces=None, memory_mb: float = 0.0
+) -> dict:
+    """
+    空跑估算一次渲染
+
+    Args:
+        plan: compile_plan 生成的执行计划
+        pieces: plan_pieces(probe=True) 的分块划分（None 表示不使用分块缓存）
+        memory_mb: 任务内存估算（排队等待）
+
+    Returns:
+        执行计划（各区间帧数、是否命中缓存）、缓存命中、各阶段耗时（毫秒）、排队等待和完成时间（秒）
+    """
+    cached = {
+        span.index for piece in pieces or [] if piece.cached for span in piece.spans
+    }
+    rendered = plan.subset(
+        [span.index for span in plan.spans if span.index not in cached]
+    )
+    base = CostModel.base_estimate(rendered, width, height)
+    predicted = CostModel.predict(base)
+    queue_seconds = estimate_queue_wait(memory_mb)
+    render_seconds = predicted["total_ms"] / 1000
+
+    spans = [
+        {
+            "index": span.index,
+            "kind": span.kind,
+            "frames": span.frames,
+            "static": span.static,
+            "transition": span.transition,
+            "clip": span.clip,
+            "cached": span.index in cached,
+        }
+        for span in plan.spans
+    ]
+    return {
+        "fps": plan.fps,
+        "duration": round(plan.duration, 3),
+        "frames": plan.frame_counts(),
+        "spans": spans,
+        "cache": {
+            "pieces": len(pieces) if pieces is not None else 0,
+            "hits": sum(1 for piece in pieces or [] if piece.cached),
+            "frames_reused": sum(span.frames for span in plan.spans if span.index in cached),
+        },
+        "operations": base["operations"],
+        "stages_ms": {key: round(ms, 1) for key, ms in predicted["stages_ms"].items()},
+        "render_seconds": round(render_seconds, 2),
+        "queue_seconds": queue_seconds,
+        "eta_seconds": CostModel.eta(render_seconds, queue_seconds),
+        "calibration_samples": CostModel.status()["samples"],
+    }
@@ -0,0 +1,222 @@
+"""
+渲染等价性检查 - 逐帧 PSNR/SSIM 对比
+
+用于验证新的快速路径（CPU 合成、融合着色器、YUV 管线、重复帧去重等）
+与当前 ApiVlogRenderer 的输出一致：
+- FrameStream: 将视频解码为 RGB 帧流，逐帧读取（不把整段视频读入内存）
+- psnr / ssim: NumPy 向量化实现
+- compare_videos: 同步步进两个输出，记录每帧指标，并定位到时间线区间
+"""
+
+from dataclasses import dataclass, asdict, field
+from typing import List, Optional
+
+import ffmpeg
+import numpy as np
+
+
+# SSIM 常数（8 位像素）
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+SSIM_WINDOW = 8
+
+# 亮度权重（BT.601）
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+class FrameStream:
+    """将视频解码为 RGB24 帧流"""
+
+    def __init__(self, path: str, width: int, height: int):
+        self.path = path
+        self.frame_size = width * height * 3
+        self.shape = (height, width, 3)
+        self.process = (
+            ffmpeg.input(path)
+            .video.output("pipe:", format="rawvideo", pix_fmt="rgb24", s=f"{width}x{height}")
+            .run_async(pipe_stdout=True, quiet=True)
+        )
+
+    def read(self) -> Optional[np.ndarray]:
+        """读取下一帧，结束时返回 None"""
+        data = self.process.stdout.read(self.frame_size)
+        if len(data) < self.frame_size:
+            return None
+        return np.frombuffer(data, dtype=np.uint8).reshape(self.shape)
+
+    def close(self):
+        self.process.stdout.close()
+        self.process.wait()
+
+
+def psnr(a: np.ndarray, b: np.ndarray) -> float:
+    """峰值信噪比（dB），完全一致时返回 inf"""
+    diff = a.astype(np.float32) - b.astype(np.float32)
+    mse = float(np.mean(diff * diff))
+    if mse == 0:
+        return float("inf")
+    return 10.0 * np.log10(255.0 ** 2 / mse)
+
+
+def _luma(frame: np.ndarray) -> np.ndarray:
+    return frame.astype(np.float32) @ LUMA_WEIGHTS
+
+
+def _box_mean(x: np.ndarray, k: int) -> np.ndarray:
+    """k×k 窗口均值（积分图实现，只保留完整窗口）"""
+    s = np.cumsum(np.cumsum(np.pad(x, ((1, 0), (1, 0))), axis=0), axis=1)
+    return (s[k:, k:] - s[:-k, k:] - s[k:, :-k] + s[:-k, :-k]) / (k * k)
+
+
+def ssim(a: np.ndarray, b: np.ndarray, window: int = SSIM_WINDOW) -> float:
+    """亮度通道平均结构相似度（均匀窗口）"""
+    x = _luma(a).astype(np.float64)
+    y = _luma(b).astype(np.float64)
+    mu_x = _box_mean(x, window)
+    mu_y = _box_mean(y, window)
+    var_x = _box_mean(x * x, window) - mu_x * mu_x
+    var_y = _box_mean(y * y, window) - mu_y * mu_y
+    cov = _box_mean(x * y, window) - mu_x * mu_y
+    ssim_map = ((2 * mu_x * mu_y + SSIM_C1) * (2 * cov + SSIM_C2)) / (
+        (mu_x * mu_x + mu_y * mu_y + SSIM_C1) * (var_x + var_y + SSIM_C2)
+    )
+    return float(ssim_map.mean())
+
+
+@dataclass
+class FrameMetrics:
+    """单帧对比结果"""
+    frame: int
+    time: float
+    psnr: float
+    ssim: float
+    span: Optional[int] = None  # 所在时间线区间
+    kind: Optional[str] = None
+    clip: Optional[int] = None
+    transition: Optional[str] = None
+
+
+@dataclass
+class EquivalenceReport:
+    """对比报告"""
+    baseline: str
+    candidate: str
+    baseline_frames: int
+    candidate_frames: int
+    min_psnr: float
+    mean_psnr: float
+    min_ssim: float
+    mean_ssim: float
+    psnr_threshold: float
+    ssim_threshold: float
+    worst: List[FrameMetrics] = field(default_factory=list)
+    failures: List[str] = field(default_factory=list)
+
+    @property
+    def passed(self) -> bool:
+        return not self.failures
+
+    def to_dict(self):
+        data = asdict(self)
+        data["passed"] = self.passed
+        return data
+
+
+def _locate(plan, frame: int) -> dict:
+    """帧在执行计划中的位置"""
+    if plan is None:
+        return {}
+    for span in plan.spans:
+        if span.start <= frame < span.end:
+            return {
+                "span": span.index,
+                "kind": span.kind,
+                "clip": span.clip,
+                "transition": span.transition,
+            }
+    return {}
+
+
+def compare_videos(
+    baseline: str,
+    candidate: str,
+    width: int,
+    height: int,
+    fps: float,
+    plan=None,
+    psnr_threshold: float = 40.0,
+    ssim_threshold: float = 0.98,
+    worst_count: int = 10,
+    stride: int = 1,
+) -> EquivalenceReport:
+    """
+    逐帧对比两个输出
+
+    Args:
+        baseline, candidate: 视频文件
+        plan: 执行计划（用于把差异帧定位到时间线区间）
+        psnr_threshold, ssim_threshold: 任一帧低于阈值即判定失败
+        worst_count: 报告中列出的最差帧数
+        stride: 每隔多少帧计算一次指标（长视频抽样），所有帧仍会被解码
+    """
+    streams = [FrameStream(baseline, width, height), FrameStream(candidate, width, height)]
+    metrics: List[FrameMetrics] = []
+    counts = [0, 0]
+    try:
+        while True:
+            frames = [stream.read() for stream in streams]
+            for i, frame in enumerate(frames):
+                if frame is not None:
+                    counts[i] += 1
+            if frames[0] is None or frames[1] is None:
+                # 较长的一方继续计数，用于报告帧数差异
+                for i, stream in enumerate(streams):
+                    if frames[i] is not None:
+                        while stream.read() is not None:
+                            counts[i] += 1
+                break
+
+            index = counts[0] - 1
+            if index % stride:
+                continue
+            metrics.append(
+                FrameMetrics(
+                    frame=index,
+                    time=round(index / fps, 3),
+                    psnr=psnr(frames[0], frames[1]),
+                    ssim=ssim(frames[0], frames[1]),
+                    **_locate(plan, index),
+                )
+            )
+    finally:
+        for stream in streams:
+            stream.close()
+
+    psnrs = np.array([m.psnr for m in metrics]) if metrics else np.array([0.0])
+    ssims = np.array([m.ssim for m in metrics]) if metrics else np.array([0.0])
+    finite = psnrs[np.isfinite(psnrs)]
+    report = EquivalenceReport(
+        baseline=baseline,
+        candidate=candidate,
+        baseline_frames=counts[0],
+        candidate_frames=counts[1],
+        min_psnr=float(psnrs.min()),
+        mean_psnr=float(finite.mean()) if finite.size else float("inf"),
+        min_ssim=float(ssims.min()),
+        mean_ssim=float(ssims.mean()),
+        psnr_threshold=psnr_threshold,
+        ssim_threshold=ssim_threshold,
+        worst=sorted(metrics, key=lambda m: (m.ssim, m.psnr))[:worst_count],
+    )
+
+    if counts[0] != counts[1]:
+        report.failures.append(f"帧数不一致: {counts[0]} vs {counts[1]}")
+    if not metrics:
+        report.failures.append("没有可对比的帧")
+    if report.min_psnr < psnr_threshold:
+        report.failures.append(
+            f"最低 PSNR {report.min_psnr:.2f}dB < {psnr_threshold}dB"
+        )
+    if report.min_ssim < ssim_threshold:
+        report.failures.append(f"最低 SSIM {report.min_ssim:.4f} < {ssim_threshold}")
+    return report
@@ -0,0 +1,244 @@
+"""
+共享渲染引擎 - 多个任务复用同一个 GL 上下文
+
+每个任务独占一个 EGL 上下文时，1080p 的工作纹理、FBO、着色器和边框纹理按任务重复创建，
+GPU 内存和上下文切换开销先于着色器算力限制了并发。RenderEngine 在专属线程中持有唯一的上下文：
+- 任务线程只做解码、字幕排版和编码，每帧的 GL 工作（纹理上传、绘制、回读）作为工作项提交到引擎，
+  结果通过 Future 按顺序返回给任务的编码器
+- 引擎按轮次执行：每轮从每个有待处理工作项的任务各取一项，各任务的绘制交错、连续地提交到同一上下文
+- 同一分辨率的任务共用一组工作纹理和 FBO（ScratchSet），转场程序按源码共享，边框纹理按内容共享
+- 工作项失败只影响提交它的任务；已取消任务的排队工作项直接丢弃
+
+- AUTOVLOG_SHARED_GL=1: 启用共享引擎（否则每个渲染器创建自己的上下文）
+- AUTOVLOG_GL_PIPELINE: 每个任务最多提前提交的帧数（默认 2），GL 工作与本任务的解码、编码重叠
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Dict, Optional
+
+import moderngl
+
+from src.cancellation import RenderCancelled
+
+
+SHARED_GL = os.getenv("AUTOVLOG_SHARED_GL") == "1"
+GL_PIPELINE_DEPTH = int(os.getenv("AUTOVLOG_GL_PIPELINE", "2"))
+
+
+class ScratchSet:
+    """一个分辨率的工作纹理和 FBO（内容由各任务的 TextureResidency 跟踪）"""
+
+    def __init__(self, ctx, width: int, height: int):
+        size = (width, height)
+        self.tex0 = ctx.texture(size, 3)
+        self.tex1 = ctx.texture(size, 3)
+        self.fbo = ctx.simple_framebuffer(size, components=3)
+        self.temp_tex = ctx.texture(size, 3)
+        self.subtitle_tex = ctx.texture(size, 4)  # RGBA纹理
+        self.subtitle_fbo = ctx.simple_framebuffer(size, components=3)
+        self.programs = {}  # 转场源码 -> (program, vao)，ratio 取决于分辨率
+        self.owner = None  # 最近使用工作纹理的任务
+        self.fbo.use()
+        self.fbo.clear(0.0, 0.0, 0.0, 1.0)
+
+
+class EngineJob:
+    """任务在引擎中的句柄"""
+
+    def __init__(self, engine: "RenderEngine", renderer, scratch: Optional[ScratchSet]):
+        self.engine = engine
+        self.renderer = renderer
+        self.scratch = scratch
+        self.ctx = engine.ctx
+        self.queue = deque()  # (fn, args, future)
+        self.items = 0
+        self.gl_seconds = 0.0
+
+    def submit(self, fn, *args) -> Future:
+        return self.engine.submit(self, fn, *args)
+
+    def resource(self, key, create):
+        return self.engine.resource(key, create)
+
+    def detach(self):
+        self.engine.detach(self)
+
+
+class RenderEngine:
+    """持有唯一 GL 上下文的渲染线程"""
+
+    _shared: Optional["RenderEngine"] = None
+    _shared_lock = threading.Lock()
+
+    @staticmethod
+    def shared() -> "RenderEngine":
+        """进程内共享的引擎（首次调用时创建上下文）"""
+        with RenderEngine._shared_lock:
+            if RenderEngine._shared is None:
+                RenderEngine._shared = RenderEngine()
+            return RenderEngine._shared
+
+    @staticmethod
+    def status() -> Optional[dict]:
+        """共享引擎的统计（未创建时返回 None）"""
+        engine = RenderEngine._shared
+        return engine.stats() if engine is not None else None
+
+    def __init__(self):
+        self.ctx = None
+        self.backend = None
+        self.items = 0
+        self.rounds = 0
+        self.busy_seconds = 0.0
+        self.started = time.time()
+        self._error = None
+        self._cond = threading.Condition()
+        self._scratch: Dict[tuple, ScratchSet] = {}
+        self._resources = {}  # 共享的边框纹理、叠加着色器等
+        self._system = EngineJob(self, None, None)  # 引擎自身的工作项（创建工作纹理等）
+        self._jobs: "OrderedDict[int, EngineJob]" = OrderedDict(
+            [(id(self._system), self._system)]
+        )
+
+        ready = threading.Event()
+        self._thread = threading.Thread(
+            target=self._loop, args=(ready,), name="gl-engine", daemon=True
+        )
+        self._thread.start()
+        ready.wait()
+        if self.ctx is None:
+            raise RuntimeError(f"共享渲染引擎初始化失败: {self._error}")
+
+    # ---------- 任务 ----------
+
+    def attach(self, renderer) -> EngineJob:
+        """登记任务（同一分辨率的任务共用工作纹理）"""
+        scratch = self._system.submit(
+            self._scratch_for, renderer.WIDTH, renderer.HEIGHT
+        ).result()
+        job = EngineJob(self, renderer, scratch)
+        with self._cond:
+            self._jobs[id(job)] = job
+        return job
+
+    def detach(self, job: EngineJob):
+        """注销任务，丢弃尚未执行的工作项"""
+        with self._cond:
+            self._jobs.pop(id(job), None)
+            pending, job.queue = job.queue, deque()
+        for _, _, future in pending:
+            future.cancel()
+        if job.scratch is not None and job.scratch.owner is job:
+            job.scratch.owner = None
+
+    def submit(self, job: EngineJob, fn, *args) -> Future:
+        """提交工作项（在引擎线程中调用时直接执行）"""
+        future = Future()
+        if threading.current_thread() is self._thread:
+            future.set_running_or_notify_cancel()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        with self._cond:
+            if id(job) not in self._jobs:
+                future.set_exception(RuntimeError("任务已从共享渲染引擎注销"))
+                return future
+            job.queue.append((fn, args, future))
+            self._cond.notify()
+        return future
+
+    def resource(self, key, create):
+        """按 key 共享的 GL 资源（在引擎线程中调用，不存在时用 create() 创建）"""
+        if key not in self._resources:
+            self._resources[key] = create()
+        return self._resources[key]
+
+    def _scratch_for(self, width: int, height: int) -> ScratchSet:
+        key = (width, height)
+        if key not in self._scratch:
+            self._scratch[key] = ScratchSet(self.ctx, width, height)
+        return self._scratch[key]
+
+    # ---------- 引擎线程 ----------
+
+    def _loop(self, ready: threading.Event):
+        try:
+            self.ctx = moderngl.create_context(standalone=True, backend="egl")
+            self.backend = self.ctx.info.get("GL_RENDERER", "unknown")
+        except Exception as e:
+            self._error = e
+            ready.set()
+            return
+        print(f"🎛️  共享渲染引擎: {self.backend}")
+        ready.set()
+        while True:
+            for job, (fn, args, future) in self._next_round():
+                self._execute(job, fn, args, future)
+
+    def _next_round(self) -> list:
+        """每个有待处理工作项的任务各取一项（轮流排在最前，避免固定顺序偏向先登记的任务）"""
+        with self._cond:
+            while not any(job.queue for job in self._jobs.values()):
+                self._cond.wait()
+            batch = [
+                (job, job.queue.popleft()) for job in self._jobs.values() if job.queue
+            ]
+            self._jobs.move_to_end(next(iter(self._jobs)))
+            self.rounds += 1
+        return batch
+
+    def _execute(self, job: EngineJob, fn, args, future: Future):
+        if not future.set_running_or_notify_cancel():
+            return
+        renderer = job.renderer
+        if renderer is not None and renderer.cancel_token.cancelled:
+            future.set_exception(RenderCancelled(renderer.cancel_token.reason))
+            return
+
+        scratch = job.scratch
+        if scratch is not None and scratch.owner is not job:
+            # 其它任务写过工作纹理，本任务记录的纹理内容已失效
+            renderer.textures.invalidate()
+            scratch.owner = job
+
+        start = time.perf_counter()
+        try:
+            result = fn(*args)
+        except Exception as e:
+            # 只影响提交该工作项的任务；工作纹理内容未知，下一个工作项重新上传
+            if scratch is not None:
+                scratch.owner = None
+            self.ctx.disable(moderngl.BLEND)
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            elapsed = time.perf_counter() - start
+            job.items += 1
+            job.gl_seconds += elapsed
+            self.items += 1
+            self.busy_seconds += elapsed
+
+    # ---------- 统计 ----------
+
+    def stats(self) -> dict:
+        uptime = max(time.time() - self.started, 1e-6)
+        with self._cond:
+            jobs = len(self._jobs) - 1
+            queued = sum(len(job.queue) for job in self._jobs.values())
+        return {
+            "backend": self.backend,
+            "jobs": jobs,
+            "queued": queued,
+            "items": self.items,
+            "rounds": self.rounds,
+            "busy": round(self.busy_seconds / uptime, 3),  # GL 线程忙碌比例
+            "scratch_sets": len(self._scratch),
+            "shared_resources": len(self._resources),
+        }
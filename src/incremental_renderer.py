@@ -8,34 +8,48 @@
 """
 
 import io
+import time
 import numpy as np
 import subprocess
 from pathlib import Path
-from datetime import datetime
 from typing import Optional
 from PIL import Image
 
 from src.api_renderer import ApiVlogRenderer
+from src.cancellation import CancelToken
+from src.output_store import LocalOutputStore, OutputStore
+from src.preview import PreviewCapture, PreviewConfig
+from src.segment_cache import PieceStats, SegmentCache
 from src.session_manager import SessionManager, SegmentInfo
-from src.video import VideoReader, create_encoder
-from src.shaders import create_transition_shader, load_transitions
+from src.textures import TextureResidency
+from src.timeline import compile_plan
+from src.video import Rendition, create_encoder, rendition_path
+from src.shaders import load_transitions
 
 
 class IncrementalRenderer(ApiVlogRenderer):
     """增量渲染器 - 继承自 ApiVlogRenderer"""
     
-    def __init__(self, session_id: str, template_name: str):
+    def __init__(
+        self,
+        session_id: str,
+        template_name: str,
+        profile: Optional[str] = None,
+        renditions: Optional[list] = None,
+    ):
         """初始化增量渲染器
         
         Args:
             session_id: 会话ID
             template_name: 模板名称
+            profile: 渲染档位（可选，如 draft），同一会话的所有段落必须一致
+            renditions: 附加输出规格名列表，同一会话的所有段落必须一致
         """
         # 不调用父类初始化（因为不需要完整的文件列表）
         from src.config import TemplateConfig
         
         self.session_id = session_id
-        self.config = TemplateConfig(template_name)
+        self.config = TemplateConfig(template_name, profile)
         
         # 加载配置参数
         self.WIDTH = self.config.global_config["width"]
@@ -50,17 +64,121 @@ class IncrementalRenderer(ApiVlogRenderer):
         self.IMAGE_FRAMES = int(self.IMAGE_DURATION * self.FPS)
         self.VIDEO_FRAMES = int(self.VIDEO_DURATION * self.FPS)
         self.TRANS_FRAMES = int(self.TRANSITION_DURATION * self.FPS)
+        self.ENCODER_OPTIONS = self.config.encoder_options
+        self.renditions = [
+            Rendition(**item) for item in self.config.get_renditions(renditions)
+        ]
+        self.rendition_outputs = {}
+        self.textures = TextureResidency()
+        self.segment_cache = SegmentCache.enabled()  # 按分块渲染并复用缓存
+        self.preview_config = PreviewConfig.load(self.config.config_path)
+        self.engine = None  # 共享渲染引擎中的任务句柄（AUTOVLOG_SHARED_GL=1）
+        self._init_runtime_state()
+        
+        # 最后一帧（常驻会话保留在内存中，由调用方决定何时落盘）
+        self.last_frame_bytes = None
+        self.persist_last_frame = True
+        # 内存中的最后一帧对应的段落数（会话可能已由其它节点继续）
+        self.synced_segments = None
         
         # 加载所有转场效果
         self.transitions = load_transitions(self.config.transitions)
         print(f"🎬 增量渲染器初始化 - 模板: {self.config.name}")
         print(f"   转场数量: {len(self.transitions)}")
     
-    def render_init(self, image_path: str):
+    def _store_last_frame(self, frame: bytes):
+        """记录最后一帧，persist_last_frame 为 True 时同时写入会话目录"""
+        self.last_frame_bytes = frame
+        if self.persist_last_frame:
+            self.save_last_frame()
+    
+    def save_last_frame(self):
+        """将内存中的最后一帧编码为 PNG 写入会话目录"""
+        if self.last_frame_bytes is None:
+            return
+        # 帧数据是 OpenGL 坐标系（自下而上），垂直翻转后保存
+        last_frame_rgb = np.frombuffer(self.last_frame_bytes, dtype=np.uint8).reshape(self.HEIGHT, self.WIDTH, 3)[::-1]
+        img = Image.fromarray(last_frame_rgb, mode='RGB')
+        buffer = io.BytesIO()
+        img.save(buffer, format='PNG')
+        SessionManager.save_last_frame(self.session_id, buffer.getvalue())
+    
+    def _load_last_frame(self) -> bytes:
+        """获取上一帧：优先使用内存中的帧，否则从会话目录加载"""
+        if self.last_frame_bytes is not None:
+            return self.last_frame_bytes
+        
+        last_frame_png = SessionManager.load_last_frame(self.session_id)
+        if not last_frame_png:
+            raise ValueError("未找到上一帧缓存，无法进行转场")
+        
+        # 解码上一帧（使用 Pillow，原生 RGB 格式）
+        img = Image.open(io.BytesIO(last_frame_png))
+        last_frame_rgb = np.array(img)[::-1]  # 垂直翻转以匹配 OpenGL 坐标系
+        self.last_frame_bytes = last_frame_rgb.tobytes()
+        return self.last_frame_bytes
+    
+    def _degradation_record(self) -> Optional[dict]:
+        """段落元数据中记录的降级决策"""
+        if self.degradation is not None and self.degradation.degraded:
+            return self.degradation.to_dict()
+        return None
+    
+    def _save_segment_preview(self, segment_index: int, frames: int):
+        """保存段落渲染时的预览采样（合成时拼出整段视频的预览）"""
+        if self.preview is None:
+            return
+        SessionManager.save_preview(
+            self.session_id, segment_index, self.preview.dumps(0, frames)
+        )
+        self.preview.close()
+        self.preview = None
+    
+    def dry_run_append(self, video_path: str) -> dict:
+        """空跑估算追加视频段落（上一帧出发的转场按未命中缓存估算，不改变会话状态）"""
+        transition_index = SessionManager.get_metadata(
+            self.session_id
+        ).current_transition_index
+        plan = compile_plan(
+            self.build_timeline(
+                self.transitions,
+                video_paths=[video_path],
+                transition_offset=transition_index,
+                still_from=True,
+            )
+        )
+        return self.dry_run_plan(plan, self.transitions)
+    
+    def _segment_files(self, segment_index: int) -> list:
+        """段落的所有输出文件（主输出 + 附加规格）"""
+        return [SessionManager.get_segment_path(self.session_id, segment_index)] + [
+            SessionManager.get_segment_path(self.session_id, segment_index, r.name)
+            for r in self.renditions
+        ]
+    
+    def _create_segment_encoder(self, segment_index: int):
+        """为段落创建编码器（同时输出所有附加规格的段落）"""
+        segment_path = SessionManager.get_segment_path(self.session_id, segment_index)
+        renditions = [
+            (r, str(SessionManager.get_segment_path(self.session_id, segment_index, r.name)))
+            for r in self.renditions
+        ]
+        return create_encoder(
+            self.WIDTH,
+            self.HEIGHT,
+            self.FPS,
+            str(segment_path),
+            self.ENCODER_OPTIONS,
+            renditions,
+        )
+    
+    def render_init(self, image_path: str, degradation=None, cancel_token=None):
         """渲染初始图片段落（图片 + 字幕）
         
         Args:
             image_path: 图片路径
+            degradation: 负载降级决策（可选）
+            cancel_token: 取消令牌（可选），取消时不记录段落，会话保持原状
         
         Returns:
             segment_index: 段落索引
@@ -69,96 +187,89 @@ class IncrementalRenderer(ApiVlogRenderer):
         print(f"   图片: {image_path}")
         print(f"   时长: {self.IMAGE_DURATION}秒 ({self.IMAGE_FRAMES}帧)")
         
-        # 初始化 GPU 环境
-        self.setup_gpu()
-        self.setup_overlays()
-        
-        # 获取段落文件路径
+        # 初始化 GPU 环境（常驻会话复用已有上下文）
+        start = time.perf_counter()
+        stages_before = dict(self.stage_times)
+        self.cancel_token = cancel_token or CancelToken()
+        self.cancel_token.raise_if_cancelled()
+        self.memory = self.job_memory()
+        self.segment_stats = PieceStats()
+        self.render_estimate = None
+        self._ensure_gpu()
+        self.textures.reset_stats()
+        if degradation is not None:
+            self.apply_degradation(degradation)
+        
+        # 段落索引
         segment_index = 0
-        segment_path = SessionManager.get_segment_path(self.session_id, segment_index)
+        self.start_preview()
         
-        # 创建编码器
-        encoder = create_encoder(self.WIDTH, self.HEIGHT, self.FPS, str(segment_path))
+        # 编译执行计划（图片 + 字幕）
+        plan = compile_plan(self.build_timeline(self.transitions, image_path=image_path))
+        plan.describe()
         
         # 使用BorderRenderer将图片复合到边框上
         position_config = self.config.config.get("image_position", {})
-        composited_img_data = self.image_border_renderer.composite_image_on_border(
-            image_path, position_config
-        )
-        
-        # 生成字幕
-        now = datetime.now()
-        subtitle_template = self.config.subtitle.get("template", "")
-        full_subtitle_text = subtitle_template.format(
-            year=now.year, month=now.month, day=now.day
-        )
-        typewriter_speed = self.config.subtitle.get("typewriter_speed", 3)
-        subtitle_duration = self.config.subtitle.get("duration", 6.0)
-        subtitle_frames = int(subtitle_duration * self.FPS)
-        
-        print(f"   📝 字幕: {full_subtitle_text}")
-        
-        # 渲染图片帧（带字幕打字机效果）
-        for frame_idx in range(self.IMAGE_FRAMES):
-            # 计算字幕文本
-            subtitle_text = None
-            if frame_idx < subtitle_frames:
-                chars_to_show = (frame_idx // typewriter_speed) + 1
-                subtitle_text = full_subtitle_text[:chars_to_show]
-            
-            # 渲染帧（叠加字幕）
-            if subtitle_text:
-                subtitle_data = self.subtitle_renderer.render_text(
-                    subtitle_text,
-                    color=tuple(self.config.font["color"]),
-                    outline_color=tuple(self.config.font["outline_color"]),
-                    outline_width=self.config.font["outline_width"],
-                )
-                self.subtitle_tex.write(subtitle_data)
-                
-                self.temp_tex.write(composited_img_data)
-                self.subtitle_fbo.use()
-                self.temp_tex.use(0)
-                self.subtitle_tex.use(1)
-                self.subtitle_vao.render()
-                final_frame = self.subtitle_fbo.read(components=3)
-                
-                self.fbo.use()
-            else:
-                final_frame = composited_img_data
-            
-            encoder.stdin.write(final_frame)
-        
-        # 关闭编码器
-        encoder.stdin.close()
-        encoder.wait()
-        
-        # 保存最后一帧（用于下次转场）
-        # final_frame 是 RGB 格式，使用 Pillow 编码为 PNG
-        last_frame_rgb = np.frombuffer(final_frame, dtype=np.uint8).reshape(self.HEIGHT, self.WIDTH, 3)[::-1]
-        img = Image.fromarray(last_frame_rgb, mode='RGB')
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        last_frame_png = buffer.getvalue()
-        SessionManager.save_last_frame(self.session_id, last_frame_png)
+        with self.memory.stage("composite"):
+            composited_img_data = self.image_border_renderer.composite_image_on_border(
+                image_path, position_config
+            )
+        
+        if self.segment_cache:
+            # 同一照片的图片开场直接复用缓存
+            final_frame = self.render_segments(
+                plan,
+                self.transitions,
+                self._segment_files(segment_index),
+                image_data=composited_img_data,
+                image_key=self.image_border_renderer.composite_key(
+                    image_path, position_config
+                ),
+            )
+        else:
+            # 创建编码器
+            encoder = self._create_segment_encoder(segment_index)
+            final_frame = self._encode(
+                encoder,
+                self._segment_files(segment_index),
+                lambda: self.execute_plan(
+                    plan, self.transitions, encoder, image_data=composited_img_data
+                ),
+            )
+        self.report_uploads()
+        self.report_memory()
+        
+        # 发布段落和预览采样，保存最后一帧（用于下次转场）
+        # 提交前再确认一次未取消（包括会话租约续期失败）
+        self.cancel_token.raise_if_cancelled()
+        SessionManager.publish_segment(self.session_id, self._segment_files(segment_index))
+        self._save_segment_preview(segment_index, plan.total_frames)
+        self._store_last_frame(final_frame)
         
         # 记录段落信息
         segment = SegmentInfo(
             index=segment_index,
-            frames=self.IMAGE_FRAMES,
+            frames=plan.total_frames,
             type='image',
-            source_path=image_path
+            source_path=image_path,
+            degradation=self._degradation_record(),
+            memory=self.memory.report(),
+            cache=self.segment_stats.to_dict() if self.segment_cache else None
         )
         SessionManager.add_segment(self.session_id, segment)
+        self.synced_segments = segment_index + 1
+        self.record_cost(time.perf_counter() - start, stages_before)
         
         print(f"   ✅ 图片段落渲染完成 (segment_{segment_index}.h264)")
         return segment_index
     
-    def render_append(self, video_path: str) -> int:
+    def render_append(self, video_path: str, degradation=None, cancel_token=None) -> int:
         """追加视频段落（转场 + 视频）
         
         Args:
             video_path: 视频路径
+            degradation: 负载降级决策（可选）
+            cancel_token: 取消令牌（可选），取消时不记录段落，会话保持原状
         
         Returns:
             segment_index: 新段落索引
@@ -167,139 +278,116 @@ class IncrementalRenderer(ApiVlogRenderer):
         print(f"   视频: {video_path}")
         
         # 初始化 GPU 环境（如果还没有初始化）
-        if not hasattr(self, 'ctx'):
-            self.setup_gpu()
-            self.setup_overlays()
+        start = time.perf_counter()
+        stages_before = dict(self.stage_times)
+        self.cancel_token = cancel_token or CancelToken()
+        self.cancel_token.raise_if_cancelled()
+        self.memory = self.job_memory()
+        self.segment_stats = PieceStats()
+        self.render_estimate = None
+        self._ensure_gpu()
+        self.textures.reset_stats()
+        if degradation is not None:
+            self.apply_degradation(degradation)
         
         # 获取下一个段落索引
         metadata = SessionManager.get_metadata(self.session_id)
         segment_index = len(metadata.segments)
-        segment_path = SessionManager.get_segment_path(self.session_id, segment_index)
-        
-        # 加载上一帧
-        last_frame_png = SessionManager.load_last_frame(self.session_id)
-        if not last_frame_png:
-            raise ValueError("未找到上一帧缓存，无法进行转场")
-        
-        # 解码上一帧（使用 Pillow，原生 RGB 格式）
-        img = Image.open(io.BytesIO(last_frame_png))
-        last_frame_rgb = np.array(img)[::-1]  # 垂直翻转以匹配 OpenGL 坐标系
-        last_frame_bytes = last_frame_rgb.tobytes()
-        
-        # 创建编码器
-        encoder = create_encoder(self.WIDTH, self.HEIGHT, self.FPS, str(segment_path))
-        
-        # 加载视频
-        video_reader = VideoReader(
-            video_path,
-            self.WIDTH,
-            self.HEIGHT,
-            self.FPS,
-            self.FRAME_SIZE,
-            self.VIDEO_DURATION,
-        )
-        
-        # 获取转场效果（按顺序循环）
-        transition_index = SessionManager.get_next_transition_index(
-            self.session_id, 
-            len(self.transitions)
+        self.start_preview(offset=metadata.total_frames)
+        if self.synced_segments != segment_index:
+            # 会话已由其它节点追加过段落，内存中的最后一帧已过期
+            self.last_frame_bytes = None
+        
+        # 加载上一帧（常驻会话直接使用内存中的帧）
+        last_frame_bytes = self._load_last_frame()
+        
+        # 获取转场效果（按顺序循环）；索引在段落提交时才前进，取消或失败时会话保持原状
+        transition_index = metadata.current_transition_index % len(self.transitions)
+        
+        # 编译执行计划（上一帧 → 视频 的转场 + 视频主体）
+        plan = compile_plan(
+            self.build_timeline(
+                self.transitions,
+                video_paths=[video_path],
+                transition_offset=transition_index,
+                still_from=True,
+            )
         )
-        transition = self.transitions[transition_index]
-        print(f"   ✨ 转场 #{transition_index}: {transition['name']}")
-        
-        # 创建转场着色器
-        prog = create_transition_shader(self.ctx, transition["source"])
-        vao = self._create_vao(prog)
-        self.tex0.use(0)
-        self.tex1.use(1)
-        prog["tex0"].value = 0
-        prog["tex1"].value = 1
-        if "ratio" in prog:
-            prog["ratio"].value = self.WIDTH / self.HEIGHT
-        
-        # 渲染转场帧
-        print(f"   🔄 渲染转场: {self.TRANS_FRAMES}帧")
-        transition_frames = []
-        for j in range(self.TRANS_FRAMES):
-            self.tex0.write(last_frame_bytes)
-            self.tex1.write(video_reader.read_frame())
-            prog["progress"].value = (j + 1) / self.TRANS_FRAMES
-            
-            self.fbo.use()
-            self.tex0.use(0)
-            self.tex1.use(1)
-            vao.render()
-            
-            # 叠加视频边框
-            final_frame = self.render_frame_with_border(use_image_border=False)
-            encoder.stdin.write(final_frame)
-            transition_frames.append(final_frame)
-        
-        # 渲染剩余视频帧
-        remaining_frames = self.VIDEO_FRAMES - self.TRANS_FRAMES
-        print(f"   🎞️  渲染视频: {remaining_frames}帧")
-        
-        # 复用转场着色器，progress=0 时直接显示 tex0
-        prog["progress"].value = 0.0
-        
-        last_video_frame = None
-        for _ in range(remaining_frames):
-            frame = video_reader.read_frame()
-            self.tex0.write(frame)
-            
-            # 关键：必须调用 vao.render() 将 tex0 渲染到 FBO
-            self.fbo.use()
-            self.tex0.use(0)
-            self.tex1.use(1)  # 虽然不使用，但保持一致
-            vao.render()
-            
-            # 叠加视频边框
-            final_frame = self.render_frame_with_border(use_image_border=False)
-            encoder.stdin.write(final_frame)
-            last_video_frame = final_frame
-        
-        # 关闭编码器
-        encoder.stdin.close()
-        encoder.wait()
-        video_reader.close()
-        
-        # 保存最后一帧（使用 Pillow）
-        last_frame_rgb = np.frombuffer(last_video_frame, dtype=np.uint8).reshape(self.HEIGHT, self.WIDTH, 3)[::-1]
-        img = Image.fromarray(last_frame_rgb, mode='RGB')
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        last_frame_png = buffer.getvalue()
-        SessionManager.save_last_frame(self.session_id, last_frame_png)
+        plan.describe()
+        transition_name = plan.spans[0].transition
+        print(f"   ✨ 转场 #{transition_index}: {transition_name}")
+        
+        if self.segment_cache:
+            # 片段主体（以及相同上一帧出发的转场）直接复用缓存
+            last_video_frame = self.render_segments(
+                plan,
+                self.transitions,
+                self._segment_files(segment_index),
+                still_frame=last_frame_bytes,
+            )
+        else:
+            # 创建编码器
+            encoder = self._create_segment_encoder(segment_index)
+            last_video_frame = self._encode(
+                encoder,
+                self._segment_files(segment_index),
+                lambda: self.execute_plan(
+                    plan, self.transitions, encoder, still_frame=last_frame_bytes
+                ),
+            )
+        self.report_uploads()
+        self.report_memory()
+        
+        # 发布段落和预览采样，保存最后一帧（用于下次转场）
+        # 提交前再确认一次未取消（包括会话租约续期失败）
+        self.cancel_token.raise_if_cancelled()
+        SessionManager.publish_segment(self.session_id, self._segment_files(segment_index))
+        self._save_segment_preview(segment_index, plan.total_frames)
+        self._store_last_frame(last_video_frame)
         
         # 记录段落信息
         segment = SegmentInfo(
             index=segment_index,
-            frames=self.TRANS_FRAMES + remaining_frames,
+            frames=plan.total_frames,
             type='video',
             source_path=video_path,
-            transition_shader=transition['name']
+            transition_shader=transition_name,
+            degradation=self._degradation_record(),
+            memory=self.memory.report(),
+            cache=self.segment_stats.to_dict() if self.segment_cache else None
         )
-        SessionManager.add_segment(self.session_id, segment)
+        SessionManager.add_segment(self.session_id, segment, transition_index)
+        self.synced_segments = segment_index + 1
+        self.record_cost(time.perf_counter() - start, stages_before)
         
         print(f"   ✅ 视频段落渲染完成 (segment_{segment_index}.h264)")
         return segment_index
     
-    def extract_thumbnail(self, video_path: str, thumbnail_path: str, time_position: float = 5.0) -> bool:
+    def extract_thumbnail(
+        self,
+        video_path: str,
+        thumbnail_path: str,
+        time_position: float = 5.0,
+        concat: bool = False,
+    ) -> bool:
         """从视频中提取缩略图
         
         Args:
             video_path: 视频文件路径
             thumbnail_path: 缩略图保存路径
             time_position: 提取帧的时间位置（秒），默认为5秒
+            concat: video_path 是否为 concat 列表（直接从段落中提取）
         
         Returns:
             是否成功提取
         """
         try:
             # 使用 ffmpeg 提取指定时间的帧
+            input_args = ["-f", "concat", "-safe", "0"] if concat else []
             thumbnail_cmd = [
                 "ffmpeg", "-y",
                 "-ss", str(time_position),  # 定位到指定时间
+                *input_args,
                 "-i", video_path,
                 "-vframes", "1",  # 只提取一帧
                 "-q:v", "2",  # 高质量
@@ -313,93 +401,140 @@ class IncrementalRenderer(ApiVlogRenderer):
             print(f"   ⚠️  封面提取失败: {e}")
             return False
     
-    def finalize(self, output_path: Optional[str] = None) -> tuple[str, Optional[str]]:
-        """合并所有段落并添加BGM
+    def _write_concat_list(self, segment_files, rendition: Optional[str] = None) -> Path:
+        """写入 concat 列表"""
+        session_path = SessionManager.get_session_path(self.session_id)
+        suffix = f"_{rendition}" if rendition else ""
+        concat_list = session_path / f"concat{suffix}.txt"
+        concat_list.write_text("\n".join([f"file '{f}'" for f in segment_files]))
+        return concat_list
+    
+    def _mux_segments(
+        self,
+        concat_list: Path,
+        output_key: str,
+        store: OutputStore,
+        rendition: Optional[str] = None,
+    ) -> str:
+        """合并段落（无重编码）并添加BGM，直接写入输出存储
+        
+        concat 与 BGM 在同一次 ffmpeg 调用中完成，不再生成中间文件；
+        对象存储会在封装过程中分段上传。
         
         Args:
-            output_path: 输出文件路径（可选，默认保存在会话目录）
+            concat_list: 段落 concat 列表
+            output_key: 输出文件名（对象键）
+            store: 输出存储
+            rendition: 附加输出规格名（仅用于日志）
         
         Returns:
-            (最终视频路径, 封面图片路径)
+            访问地址
         """
-        print(f"\n🎵 最终合成...")
-        
-        session_path = SessionManager.get_session_path(self.session_id)
-        
-        # 获取所有段落文件
-        segment_files = SessionManager.list_segment_files(self.session_id)
-        print(f"   段落数量: {len(segment_files)}")
-        
-        # 创建 concat 列表
-        concat_list = session_path / "concat.txt"
-        concat_list.write_text("\n".join([f"file '{f}'" for f in segment_files]))
-        
-        # 输出路径
-        if not output_path:
-            output_path = session_path / f"final_{self.session_id}.mp4"
-        else:
-            output_path = Path(output_path)
-        
-        # 第一步：使用 concat 协议合并视频段落（无重编码）
-        temp_concat = session_path / "temp_concat.mp4"
-        concat_cmd = [
+        # 使用 concat 协议合并视频段落（无重编码）
+        mux_cmd = [
             "ffmpeg", "-y",
             "-f", "concat",
             "-safe", "0",
             "-i", str(concat_list),
-            "-c:v", "copy",  # 关键：直接复制视频流
-            "-movflags", "+faststart",
-            str(temp_concat)
         ]
         
-        print(f"   🔗 合并段落...")
-        subprocess.run(concat_cmd, check=True, capture_output=True)
-        
-        # 第二步：添加BGM
+        print(f"   🔗 合并段落{f' ({rendition})' if rendition else ''}...")
         bgm_path = self.config.bgm.get("path")
         if bgm_path and Path(bgm_path).exists():
             print(f"   🎵 添加BGM: {bgm_path}")
-            
-            bgm_cmd = [
-                "ffmpeg", "-y",
-                "-i", str(temp_concat),
+            mux_cmd += [
                 "-stream_loop", "-1",  # 循环BGM
                 "-i", bgm_path,
-                "-c:v", "copy",  # 视频流直接复制
+                "-map", "0:v:0",
+                "-map", "1:a:0",
+                "-c:v", "copy",  # 关键：直接复制视频流
                 "-c:a", "aac",
                 "-b:a", "192k",
                 "-shortest",  # 以视频长度为准
-                "-movflags", "+faststart",
-                str(output_path)
             ]
-            
-            subprocess.run(bgm_cmd, check=True, capture_output=True)
-            temp_concat.unlink()  # 删除临时文件
         else:
-            # 没有BGM，直接使用合并后的文件
             print(f"   ⚠️  未配置BGM")
-            temp_concat.rename(output_path)
+            mux_cmd += ["-c:v", "copy"]
         
-        print(f"   ✅ 最终合成完成: {output_path}")
+        return store.write_ffmpeg(mux_cmd, output_key)
+    
+    def finalize(
+        self,
+        output_path: Optional[str] = None,
+        output_store: Optional[OutputStore] = None,
+    ) -> tuple[str, Optional[str]]:
+        """合并所有段落并添加BGM
         
-        # 提取视频封面（第5秒）
-        thumbnail_path = None
-        output_file = Path(output_path)
-        thumbnail_file = output_file.with_suffix('.jpg')  # 使用相同的文件名，但扩展名为 .jpg
+        Args:
+            output_path: 输出文件路径（可选，默认保存在会话目录）；
+                指定 output_store 时只使用文件名作为对象键
+            output_store: 输出存储（可选，默认写入 output_path 所在目录）
         
-        if self.extract_thumbnail(str(output_path), str(thumbnail_file), time_position=5.0):
-            thumbnail_path = str(thumbnail_file)
+        Returns:
+            (最终视频地址, 封面图片地址)，附加输出规格的地址记录在 rendition_outputs
+        """
+        print(f"\n🎵 最终合成...")
+        
+        session_path = SessionManager.get_session_path(self.session_id)
+        
+        # 获取所有段落文件
+        segment_files = SessionManager.list_segment_files(self.session_id)
+        print(f"   段落数量: {len(segment_files)}")
+        
+        # 输出路径
+        if not output_path:
+            output_path = session_path / f"final_{self.session_id}.mp4"
+        else:
+            output_path = Path(output_path)
+        store = output_store or LocalOutputStore(output_path.parent)
+        output_key = output_path.name
+        
+        concat_list = self._write_concat_list(segment_files)
+        output_url = self._mux_segments(concat_list, output_key, store)
+        
+        # 附加输出规格（段落已在渲染时同步编码）
+        for rendition in self.renditions:
+            self.rendition_outputs[rendition.name] = self._mux_segments(
+                self._write_concat_list(
+                    SessionManager.list_segment_files(self.session_id, rendition.name),
+                    rendition.name,
+                ),
+                rendition_path(output_key, rendition.name),
+                store,
+                rendition.name,
+            )
+        
+        print(f"   ✅ 最终合成完成: {output_url}")
+        
+        # 封面、雪碧图和动态预览由各段落渲染时的采样拼出，无需解码成品
+        thumbnail_url = None
+        self.preview_outputs = {}
+        if self.preview_config.enabled:
+            preview = PreviewCapture(self.WIDTH, self.HEIGHT, self.FPS, self.preview_config)
+            start = 0
+            for segment, segment_file in zip(
+                SessionManager.get_metadata(self.session_id).segments, segment_files
+            ):
+                data = SessionManager.load_preview(self.session_id, segment["index"])
+                if not (data and preview.loads(data, start, segment["frames"])):
+                    # 采样缺失（旧会话）或参数已变化，从段落码流中解码
+                    preview.decode(segment_file, start, segment["frames"])
+                start += segment["frames"]
+            self.preview_outputs = self.publish_preview(preview, output_key, start, store)
+            thumbnail_url = self.preview_outputs.pop("poster", None)
+        
+        if thumbnail_url is None:
+            # 提取视频封面（第5秒），直接从本地段落中提取，与输出存储无关
+            thumbnail_file = session_path / "thumbnail.jpg"
+            if self.extract_thumbnail(str(concat_list), str(thumbnail_file), time_position=5.0, concat=True):
+                # 使用相同的文件名，但扩展名为 .jpg
+                thumbnail_url = store.put_file(thumbnail_file, output_path.with_suffix('.jpg').name)
         
         # 更新会话状态
         SessionManager.update_metadata(self.session_id, {
             'status': 'completed',
-            'output_path': str(output_path),
-            'thumbnail_path': thumbnail_path
+            'output_path': output_url,
+            'thumbnail_path': thumbnail_url
         })
         
-        return str(output_path), thumbnail_path
-    
-    def cleanup(self):
-        """清理 GPU 资源"""
-        if hasattr(self, 'ctx'):
-            self.ctx.release()
+        return output_url, thumbnail_url
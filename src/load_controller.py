@@ -0,0 +1,246 @@
+"""
+负载自适应降级控制器
+
+高峰期所有任务仍按 1080p / 15M CBR / NVENC p4 / rc-lookahead 32、最贵的转场和完整打字机效果渲染，
+排队时间会无限增长。控制器根据同时进行的渲染任务数和近期任务的实时率（渲染耗时 / 视频时长）
+选择降级等级（config.yaml 的 load_control 节点），逐级应用：
+- 更快的编码器预设、更短的前瞻
+- 用同一模板中开销更低的转场替换昂贵的转场（按转场目录实测开销排序）
+- 关闭打字机效果（字幕只渲染一次）
+- 非交互任务降为低分辨率档位
+
+每次决策都记录在任务结果中，便于事后分析。
+"""
+
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import yaml
+
+from src.transition_catalog import TransitionCatalog
+
+
+# 统计近期任务数的默认值
+DEFAULT_WINDOW = 20
+
+
+@dataclass
+class DegradationLevel:
+    """降级等级（在 config.yaml 中按从轻到重的顺序定义）"""
+    name: str
+    queue_depth: Optional[int] = None  # 同时进行的任务数达到该值时启用
+    realtime_factor: Optional[float] = None  # 近期 p90 实时率达到该值时启用
+    encoder: Dict[str, str] = field(default_factory=dict)
+    max_transitions: Optional[int] = None  # 只保留模板中开销最低的 N 个转场
+    typewriter: bool = True
+    batch_profile: Optional[str] = None  # 非交互任务使用的渲染档位
+
+
+@dataclass
+class DegradationDecision:
+    """一次降级决策"""
+    level: int  # 0 表示不降级
+    name: str
+    queue_depth: int
+    p90_realtime_factor: Optional[float] = None
+    encoder: Dict[str, str] = field(default_factory=dict)
+    substitutes: Dict[str, str] = field(default_factory=dict)  # 原转场 -> 替代转场
+    typewriter: bool = True
+    profile: Optional[str] = None
+    reasons: List[str] = field(default_factory=list)
+
+    def to_dict(self):
+        return asdict(self)
+
+    @property
+    def degraded(self) -> bool:
+        return self.level > 0
+
+
+def rank_transitions(transition_files: list, width: int, height: int) -> List[str]:
+    """按开销从低到高排序模板转场：优先使用转场目录实测值，缺失时按 GLSL 行数估计"""
+    names = [Path(path).stem for path in transition_files]
+    measured = TransitionCatalog.transition_costs(names, width, height)
+    if len(measured) == len(set(names)):
+        return sorted(dict.fromkeys(names), key=lambda name: measured[name])
+
+    def lines(path):
+        try:
+            return len(Path(path).read_text(encoding="utf-8").splitlines())
+        except OSError:
+            return 0
+
+    sizes = {Path(path).stem: lines(path) for path in transition_files}
+    return sorted(dict.fromkeys(names), key=lambda name: sizes[name])
+
+
+class LoadController:
+    """进程内负载控制器"""
+
+    _active = 0
+    _running: Dict[int, float] = {}  # 进行中任务 -> 开始时间
+    _history: deque = deque(maxlen=DEFAULT_WINDOW)
+    _levels: Optional[List[DegradationLevel]] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def levels(config_path: Path = Path("config.yaml")) -> List[DegradationLevel]:
+        """读取降级等级配置（未配置时不降级）"""
+        if LoadController._levels is None:
+            with open(config_path, "r", encoding="utf-8") as f:
+                section = (yaml.safe_load(f) or {}).get("load_control") or {}
+            window = int(section.get("window", DEFAULT_WINDOW))
+            with LoadController._lock:
+                LoadController._history = deque(LoadController._history, maxlen=window)
+                LoadController._levels = [
+                    DegradationLevel(**level) for level in section.get("levels", [])
+                ]
+        return LoadController._levels
+
+    @staticmethod
+    @contextmanager
+    def track():
+        """
+        登记一个进行中的渲染任务，结束后记录耗时
+
+        调用方可在 job 中写入 media_seconds（输出视频时长）和 stages（各阶段耗时）。
+        """
+        job = {"media_seconds": None, "stages": {}}
+        start = time.perf_counter()
+        with LoadController._lock:
+            LoadController._active += 1
+            LoadController._running[id(job)] = start
+        try:
+            yield job
+        finally:
+            with LoadController._lock:
+                LoadController._active -= 1
+                LoadController._running.pop(id(job), None)
+        # 只记录成功完成的任务
+        LoadController.record(
+            time.perf_counter() - start, job["media_seconds"], job["stages"]
+        )
+
+    @staticmethod
+    def record(seconds: float, media_seconds: Optional[float], stages: Optional[dict] = None):
+        """记录任务耗时"""
+        entry = {
+            "seconds": seconds,
+            "realtime_factor": seconds / media_seconds if media_seconds else None,
+            "stages": dict(stages or {}),
+            "finished_at": time.time(),
+        }
+        with LoadController._lock:
+            LoadController._history.append(entry)
+
+    @staticmethod
+    def p90_realtime_factor() -> Optional[float]:
+        """近期任务实时率的 p90"""
+        with LoadController._lock:
+            factors = sorted(
+                e["realtime_factor"]
+                for e in LoadController._history
+                if e["realtime_factor"] is not None
+            )
+        if not factors:
+            return None
+        return factors[min(len(factors) - 1, int(len(factors) * 0.9))]
+
+    @staticmethod
+    def remaining_seconds() -> List[float]:
+        """进行中任务的预计剩余时间（按近期任务的平均耗时）"""
+        now = time.perf_counter()
+        with LoadController._lock:
+            started = list(LoadController._running.values())
+            history = [e["seconds"] for e in LoadController._history]
+        average = sum(history) / len(history) if history else 0.0
+        return [max(average - (now - start), 0.0) for start in started]
+
+    @staticmethod
+    def decide(
+        transition_files: list,
+        width: int,
+        height: int,
+        interactive: bool = True,
+    ) -> DegradationDecision:
+        """
+        根据当前负载选择降级等级
+
+        Args:
+            transition_files: 模板的转场文件列表（用于选择替代转场）
+            width, height: 渲染分辨率
+            interactive: 交互任务（用户在等待结果）不降低分辨率
+        """
+        levels = LoadController.levels()
+        with LoadController._lock:
+            queue_depth = LoadController._active
+        p90 = LoadController.p90_realtime_factor()
+
+        index, reasons = 0, []
+        for i, level in enumerate(levels, start=1):
+            triggers = []
+            if level.queue_depth is not None and queue_depth >= level.queue_depth:
+                triggers.append(f"排队 {queue_depth} >= {level.queue_depth}")
+            if (
+                level.realtime_factor is not None
+                and p90 is not None
+                and p90 >= level.realtime_factor
+            ):
+                triggers.append(f"p90 实时率 {p90:.2f} >= {level.realtime_factor}")
+            if triggers:
+                index, reasons = i, triggers
+
+        decision = DegradationDecision(
+            level=index,
+            name=levels[index - 1].name if index else "full",
+            queue_depth=queue_depth,
+            p90_realtime_factor=p90,
+            reasons=reasons,
+        )
+        if not index:
+            return decision
+
+        level = levels[index - 1]
+        decision.encoder = {key: str(value) for key, value in level.encoder.items()}
+        decision.typewriter = level.typewriter
+        if level.max_transitions:
+            ranked = rank_transitions(transition_files, width, height)
+            kept = ranked[: level.max_transitions]
+            decision.substitutes = {
+                name: kept[i % len(kept)]
+                for i, name in enumerate(ranked[level.max_transitions:])
+            }
+        if level.batch_profile and not interactive:
+            decision.profile = level.batch_profile
+
+        print(f"📉 负载降级: {decision.name} ({'; '.join(reasons)})")
+        return decision
+
+    @staticmethod
+    def status() -> dict:
+        """当前负载和近期任务耗时"""
+        with LoadController._lock:
+            history = list(LoadController._history)
+            active = LoadController._active
+
+        stages = {}
+        for entry in history:
+            for stage, seconds in entry["stages"].items():
+                stages.setdefault(stage, []).append(seconds)
+        return {
+            "active_jobs": active,
+            "recent_jobs": len(history),
+            "p90_realtime_factor": LoadController.p90_realtime_factor(),
+            "avg_seconds": (
+                sum(e["seconds"] for e in history) / len(history) if history else None
+            ),
+            "avg_stage_seconds": {
+                stage: sum(values) / len(values) for stage, values in stages.items()
+            },
+            "levels": [asdict(level) for level in LoadController.levels()],
+        }
@@ -0,0 +1,412 @@
+"""
+HTTP 接口压测 - 按配置的比例回放一次性渲染和增量会话请求
+
+- generate_media: 用 ffmpeg lavfi 生成合成素材（图片 + 测试视频），不依赖真实素材
+- start_server: 在本机以软件 GL + CPU 编码器启动 API 服务
+- LoadTest: 固定并发（闭环）或固定到达率（开环，泊松到达）回放请求
+- ResourceSampler: 采样服务进程树（含 ffmpeg 子进程）的 CPU 和内存
+- 报告：各接口 p50/p95/p99 延迟、吞吐、错误率、资源占用
+"""
+
+import os
+import sys
+import math
+import time
+import random
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, asdict, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import requests
+
+
+# 场景名称
+SCENARIOS = ("render", "session")
+
+# 服务启动等待时间（秒）
+SERVER_READY_TIMEOUT = 60
+
+# 单个请求超时（渲染请求同步返回，需要较长超时）
+REQUEST_TIMEOUT = 600
+
+
+def generate_media(
+    workdir: Path,
+    clips: int,
+    clip_seconds: float,
+    width: int = 640,
+    height: int = 360,
+    fps: int = 30,
+) -> dict:
+    """生成合成素材：1 张图片和若干段内容不同的测试视频"""
+    workdir.mkdir(parents=True, exist_ok=True)
+    image = workdir / "image.jpg"
+    if not image.exists():
+        subprocess.run(
+            [
+                "ffmpeg", "-y", "-f", "lavfi",
+                "-i", f"testsrc2=size={width}x{height}",
+                "-frames:v", "1", str(image),
+            ],
+            check=True,
+            capture_output=True,
+        )
+
+    sources = ["testsrc2", "smptehdbars", "rgbtestsrc", "mandelbrot"]
+    videos = []
+    for i in range(clips):
+        path = workdir / f"clip_{i}.mp4"
+        if not path.exists():
+            source = sources[i % len(sources)]
+            subprocess.run(
+                [
+                    "ffmpeg", "-y", "-f", "lavfi",
+                    "-i", f"{source}=size={width}x{height}:rate={fps}:duration={clip_seconds}",
+                    "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+                    str(path),
+                ],
+                check=True,
+                capture_output=True,
+            )
+        videos.append(str(path.resolve()))
+    print(f"🎞️  合成素材: 1 张图片, {len(videos)} 段视频 ({clip_seconds:.1f}秒)")
+    return {"image": str(image.resolve()), "videos": videos}
+
+
+def start_server(port: int, log_path: Path, software: bool = True) -> subprocess.Popen:
+    """在本机启动 API 服务（默认软件 GL + CPU 编码器）"""
+    env = dict(os.environ)
+    if software:
+        env["AUTOVLOG_SOFTWARE_GL"] = "1"
+        env["AUTOVLOG_ENCODER"] = "cpu"
+    env["API_BASE_URL"] = f"http://127.0.0.1:{port}"
+    log = open(log_path, "w", encoding="utf-8")
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "api_server:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--timeout-keep-alive", "300",
+        ],
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    print(f"🚀 启动服务: http://127.0.0.1:{port} (pid {process.pid}, 日志 {log_path})")
+    return process
+
+
+def wait_ready(base_url: str, process: Optional[subprocess.Popen] = None):
+    """等待服务可用"""
+    deadline = time.time() + SERVER_READY_TIMEOUT
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"服务启动失败（退出码 {process.returncode}）")
+        try:
+            if requests.get(f"{base_url}/api/load", timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"服务在 {SERVER_READY_TIMEOUT} 秒内未就绪: {base_url}")
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """最近秩百分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+@dataclass
+class Sample:
+    """一次请求（或一个完整场景）的结果"""
+    name: str
+    seconds: float
+    ok: bool
+    status: Optional[int] = None
+    error: Optional[str] = None
+
+
+class ResourceSampler(threading.Thread):
+    """采样进程树的 CPU 使用率和常驻内存（Linux /proc）"""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []  # (cpu_percent, rss_mb, processes)
+        self._stop_event = threading.Event()
+        self._ticks = os.sysconf("SC_CLK_TCK")
+        self._page_mb = os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+    def _tree(self) -> List[int]:
+        children = {}
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+        pids, stack = [], [self.pid]
+        while stack:
+            pid = stack.pop()
+            pids.append(pid)
+            stack.extend(children.get(pid, []))
+        return pids
+
+    def _usage(self):
+        cpu_ticks, rss_pages, count = 0, 0, 0
+        for pid in self._tree():
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+                with open(f"/proc/{pid}/statm") as f:
+                    rss_pages += int(f.read().split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            # utime, stime（含已回收子进程 cutime, cstime）
+            cpu_ticks += sum(int(value) for value in fields[11:15])
+            count += 1
+        return cpu_ticks / self._ticks, rss_pages * self._page_mb, count
+
+    def run(self):
+        last_cpu, _, _ = self._usage()
+        last_time = time.perf_counter()
+        while not self._stop_event.wait(self.interval):
+            cpu, rss, count = self._usage()
+            now = time.perf_counter()
+            self.samples.append(
+                (max(0.0, cpu - last_cpu) / (now - last_time) * 100, rss, count)
+            )
+            last_cpu, last_time = cpu, now
+
+    def stop(self) -> dict:
+        self._stop_event.set()
+        self.join()
+        if not self.samples:
+            return {}
+        cpu = [s[0] for s in self.samples]
+        rss = [s[1] for s in self.samples]
+        return {
+            "cpu_percent_avg": round(sum(cpu) / len(cpu), 1),
+            "cpu_percent_max": round(max(cpu), 1),
+            "rss_mb_avg": round(sum(rss) / len(rss), 1),
+            "rss_mb_max": round(max(rss), 1),
+            "processes_max": max(s[2] for s in self.samples),
+        }
+
+
+@dataclass
+class LoadTestConfig:
+    """压测参数"""
+    template: str
+    mix: Dict[str, float]  # 场景 -> 权重
+    concurrency: int = 2  # 闭环：同时进行的场景数
+    rate: Optional[float] = None  # 开环：每秒到达的场景数
+    requests: Optional[int] = None  # 场景总数
+    duration: Optional[float] = None  # 最长运行时间（秒）
+    clips_per_render: int = 2
+    appends: int = 2
+    profile: Optional[str] = None
+    seed: int = 0
+
+
+@dataclass
+class LoadTestReport:
+    """压测报告"""
+    config: dict
+    elapsed: float
+    scenarios: int
+    throughput_per_min: float
+    endpoints: Dict[str, dict] = field(default_factory=dict)
+    resources: Dict[str, float] = field(default_factory=dict)
+    server_load: Optional[dict] = None
+    errors: List[str] = field(default_factory=list)
+
+    def to_dict(self):
+        return asdict(self)
+
+
+class LoadTest:
+    """按场景比例回放请求"""
+
+    def __init__(self, base_url: str, media: dict, config: LoadTestConfig):
+        self.base_url = base_url.rstrip("/")
+        self.media = media
+        self.config = config
+        self.samples: List[Sample] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._random = random.Random(config.seed)
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _record(self, sample: Sample):
+        with self._lock:
+            self.samples.append(sample)
+
+    def _post(self, endpoint: str, payload: dict) -> Optional[requests.Response]:
+        """发送请求并记录延迟，失败时返回 None"""
+        start = time.perf_counter()
+        try:
+            response = self._session().post(
+                f"{self.base_url}{endpoint}", json=payload, timeout=REQUEST_TIMEOUT
+            )
+        except requests.RequestException as e:
+            self._record(Sample(endpoint, time.perf_counter() - start, False, error=str(e)))
+            return None
+        ok = response.status_code == 200
+        self._record(
+            Sample(
+                endpoint,
+                time.perf_counter() - start,
+                ok,
+                status=response.status_code,
+                error=None if ok else response.text[:200],
+            )
+        )
+        return response if ok else None
+
+    def _pick_clips(self, count: int) -> List[str]:
+        videos = self.media["videos"]
+        with self._lock:
+            return [self._random.choice(videos) for _ in range(count)]
+
+    def run_render(self) -> bool:
+        """场景：一次性渲染"""
+        payload = {
+            "template": self.config.template,
+            "image_path": self.media["image"],
+            "video_paths": self._pick_clips(self.config.clips_per_render),
+            "profile": self.config.profile,
+            "interactive": False,
+        }
+        return self._post("/api/render", payload) is not None
+
+    def run_session(self) -> bool:
+        """场景：增量会话（init + append × N + finalize）"""
+        response = self._post(
+            "/api/render/init",
+            {
+                "template": self.config.template,
+                "image_path": self.media["image"],
+                "profile": self.config.profile,
+            },
+        )
+        if response is None:
+            return False
+        session_id = response.json()["session_id"]
+        for path in self._pick_clips(self.config.appends):
+            if self._post(
+                "/api/render/append", {"session_id": session_id, "video_path": path}
+            ) is None:
+                return False
+        return self._post("/api/render/finalize", {"session_id": session_id}) is not None
+
+    def _choose(self) -> str:
+        names = list(self.config.mix)
+        with self._lock:
+            return self._random.choices(names, weights=[self.config.mix[n] for n in names])[0]
+
+    def _run_scenario(self, name: str, arrived: Optional[float] = None):
+        """执行一个场景；开环模式下从到达时刻计时（包含客户端排队）"""
+        start = arrived if arrived is not None else time.perf_counter()
+        try:
+            ok = getattr(self, f"run_{name}")()
+            error = None
+        except Exception as e:
+            ok, error = False, f"{type(e).__name__}: {e}"
+        self._record(Sample(f"scenario:{name}", time.perf_counter() - start, ok, error=error))
+
+    def _finished(self, started: int, start: float) -> bool:
+        config = self.config
+        if config.requests is not None and started >= config.requests:
+            return True
+        if config.duration is not None and time.perf_counter() - start >= config.duration:
+            return True
+        return False
+
+    def run(self) -> float:
+        """执行压测，返回总耗时"""
+        config = self.config
+        start = time.perf_counter()
+        started = 0
+        if config.rate:
+            print(f"📈 开环压测: {config.rate}/秒, 场景比例 {config.mix}")
+            with ThreadPoolExecutor(max_workers=max(1, config.concurrency)) as pool:
+                futures = []
+                while not self._finished(started, start):
+                    futures.append(
+                        pool.submit(self._run_scenario, self._choose(), time.perf_counter())
+                    )
+                    started += 1
+                    time.sleep(self._random.expovariate(config.rate))
+                wait(futures)
+        else:
+            print(f"📈 闭环压测: 并发 {config.concurrency}, 场景比例 {config.mix}")
+            counter = threading.Lock()
+
+            def worker():
+                nonlocal started
+                while True:
+                    with counter:
+                        if self._finished(started, start):
+                            return
+                        started += 1
+                    self._run_scenario(self._choose())
+
+            threads = [threading.Thread(target=worker) for _ in range(config.concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return time.perf_counter() - start
+
+    def report(self, elapsed: float, resources: dict, server_load=None) -> LoadTestReport:
+        """汇总各接口延迟、吞吐和错误率"""
+        groups: Dict[str, List[Sample]] = {}
+        for sample in self.samples:
+            groups.setdefault(sample.name, []).append(sample)
+
+        endpoints = {}
+        for name, samples in sorted(groups.items()):
+            latencies = [s.seconds for s in samples if s.ok]
+            errors = sum(1 for s in samples if not s.ok)
+            endpoints[name] = {
+                "count": len(samples),
+                "errors": errors,
+                "error_rate": round(errors / len(samples), 4),
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "max": max(latencies) if latencies else None,
+                "per_min": round(len(samples) / elapsed * 60, 2) if elapsed else None,
+            }
+
+        scenarios = sum(
+            1 for s in self.samples if s.name.startswith("scenario:") and s.ok
+        )
+        error_messages = sorted(
+            {f"{s.name}: {s.status or ''} {s.error}" for s in self.samples if s.error}
+        )
+        return LoadTestReport(
+            config=asdict(self.config),
+            elapsed=round(elapsed, 2),
+            scenarios=scenarios,
+            throughput_per_min=round(scenarios / elapsed * 60, 2) if elapsed else 0.0,
+            endpoints=endpoints,
+            resources=resources,
+            server_load=server_load,
+            errors=error_messages[:20],
+        )
@@ -0,0 +1,244 @@
+"""
+媒体探测模块 - ffprobe 探测结果缓存与解码参数选择
+
+- probe_media: 探测时长、分辨率、帧率、旋转、编码和关键帧间隔，
+  按 (路径, 大小, 修改时间) 缓存在内存和磁盘中
+- check_renderable: 在占用渲染资源之前拒绝无法渲染的素材
+- decoder_threads: 根据分辨率和编码选择解码线程数
+"""
+
+import os
+import json
+import hashlib
+import subprocess
+import threading
+from dataclasses import dataclass, asdict
+from fractions import Fraction
+from pathlib import Path
+from typing import Optional
+
+import ffmpeg
+
+
+# 探测结果磁盘缓存目录
+PROBE_CACHE_DIR = Path("/tmp/autovlog_probe_cache")
+PROBE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+# 关键帧间隔只统计开头若干秒的包
+KEYFRAME_SCAN_SECONDS = 10
+
+# 可渲染素材限制
+MIN_DURATION = 0.5  # 秒
+MAX_PIXELS = 7680 * 4320  # 8K
+MAX_FPS = 240
+
+# 高复杂度编码（解码开销明显高于 H.264）
+HEAVY_CODECS = ("hevc", "vp9", "av1")
+
+
+@dataclass
+class MediaInfo:
+    """媒体探测结果"""
+    path: str
+    size: int
+    mtime: float
+    format: Optional[str] = None
+    codec: Optional[str] = None
+    width: int = 0  # 显示宽度（已考虑旋转）
+    height: int = 0  # 显示高度（已考虑旋转）
+    fps: float = 0.0
+    variable_frame_rate: bool = False
+    duration: float = 0.0
+    rotation: int = 0
+    keyframe_interval: Optional[float] = None  # 平均关键帧间隔（秒）
+    keyframes_scanned: bool = False  # 是否已统计关键帧（统计后间隔仍可能为 None）
+    has_video: bool = False
+
+    def to_dict(self):
+        return asdict(self)
+
+    @property
+    def pixels(self) -> int:
+        return self.width * self.height
+
+
+class _ProbeCache:
+    """内存 + 磁盘两级缓存"""
+
+    def __init__(self):
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cache_file(key) -> Path:
+        digest = hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest()
+        return PROBE_CACHE_DIR / f"{digest}.json"
+
+    def get(self, key) -> Optional[MediaInfo]:
+        with self._lock:
+            if key in self._memory:
+                return self._memory[key]
+
+        cache_file = self._cache_file(key)
+        if cache_file.exists():
+            try:
+                info = MediaInfo(**json.loads(cache_file.read_text()))
+            except Exception:
+                return None
+            with self._lock:
+                self._memory[key] = info
+            return info
+        return None
+
+    def put(self, key, info: MediaInfo):
+        with self._lock:
+            self._memory[key] = info
+        self._cache_file(key).write_text(json.dumps(info.to_dict()))
+
+
+_cache = _ProbeCache()
+
+
+def _parse_rate(rate: Optional[str]) -> float:
+    """解析 ffprobe 帧率字符串（如 30000/1001）"""
+    try:
+        value = Fraction(rate)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return 0.0
+    return float(value)
+
+
+def _stream_rotation(stream: dict) -> int:
+    """读取视频流旋转角度（side data 或旧版 rotate 标签）"""
+    for side_data in stream.get("side_data_list", []):
+        if "rotation" in side_data:
+            return int(side_data["rotation"]) % 360
+    rotate = stream.get("tags", {}).get("rotate")
+    return int(rotate) % 360 if rotate else 0
+
+
+def _keyframe_interval(path: str) -> Optional[float]:
+    """统计开头若干秒内的关键帧间隔（只读包，不解码）"""
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-read_intervals", f"%+{KEYFRAME_SCAN_SECONDS}",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        path,
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
+    except (subprocess.SubprocessError, OSError):
+        return None
+
+    keyframes = []
+    for line in result.stdout.splitlines():
+        pts, _, flags = line.partition(",")
+        if "K" in flags:
+            try:
+                keyframes.append(float(pts))
+            except ValueError:
+                continue
+    if len(keyframes) < 2:
+        return None
+    keyframes.sort()
+    return (keyframes[-1] - keyframes[0]) / (len(keyframes) - 1)
+
+
+def _run_probe(path: str, size: int, mtime: float) -> MediaInfo:
+    """执行 ffprobe 并解析结果"""
+    probe = ffmpeg.probe(path)
+    info = MediaInfo(path=path, size=size, mtime=mtime)
+    fmt = probe.get("format", {})
+    info.format = fmt.get("format_name")
+    info.duration = float(fmt.get("duration") or 0.0)
+
+    stream = next(
+        (s for s in probe.get("streams", []) if s.get("codec_type") == "video"), None
+    )
+    if stream is None:
+        return info
+
+    info.has_video = True
+    info.codec = stream.get("codec_name")
+    info.rotation = _stream_rotation(stream)
+    width, height = int(stream.get("width", 0)), int(stream.get("height", 0))
+    if info.rotation in (90, 270):
+        width, height = height, width
+    info.width, info.height = width, height
+    avg_rate = _parse_rate(stream.get("avg_frame_rate"))
+    base_rate = _parse_rate(stream.get("r_frame_rate"))
+    info.fps = avg_rate or base_rate
+    info.variable_frame_rate = bool(avg_rate and base_rate and abs(avg_rate - base_rate) > 1e-3)
+    if not info.duration:
+        info.duration = float(stream.get("duration") or 0.0)
+    return info
+
+
+def probe_media(path: str, use_cache: bool = True, keyframes: bool = True) -> MediaInfo:
+    """
+    探测媒体文件
+
+    Args:
+        path: 文件路径
+        use_cache: 是否使用缓存（写入中的文件应传 False）
+        keyframes: 是否统计关键帧间隔（图片无需统计）
+
+    Raises:
+        ValueError: 文件无法解析
+    """
+    stat = os.stat(path)
+    key = [os.path.abspath(path), stat.st_size, stat.st_mtime]
+    if use_cache:
+        cached = _cache.get(key)
+        if cached is not None:
+            if keyframes and cached.has_video and not cached.keyframes_scanned:
+                # 请求校验只探测容器，关键帧间隔在首次需要时补充（只统计一次）
+                cached.keyframe_interval = _keyframe_interval(path)
+                cached.keyframes_scanned = True
+                _cache.put(key, cached)
+            return cached
+
+    try:
+        info = _run_probe(path, stat.st_size, stat.st_mtime)
+    except Exception as e:
+        stderr = getattr(e, "stderr", None)
+        detail = stderr.decode("utf-8", "ignore").strip() if stderr else str(e)
+        raise ValueError(f"无法解析媒体文件 {path}: {detail}")
+
+    if keyframes and info.has_video:
+        info.keyframe_interval = _keyframe_interval(path)
+        info.keyframes_scanned = True
+
+    if use_cache:
+        _cache.put(key, info)
+    return info
+
+
+def check_renderable(info: MediaInfo, require_video: bool = True):
+    """拒绝无法渲染的素材（在分配 GPU 和编码器之前调用）"""
+    if require_video and not info.has_video:
+        raise ValueError(f"文件中没有视频流: {info.path}")
+    if not info.width or not info.height:
+        raise ValueError(f"无法确定分辨率: {info.path}")
+    if info.pixels > MAX_PIXELS:
+        raise ValueError(f"分辨率过大 ({info.width}x{info.height}): {info.path}")
+    if require_video:
+        if info.duration < MIN_DURATION:
+            raise ValueError(f"视频时长过短 ({info.duration:.2f}秒): {info.path}")
+        if info.fps <= 0 or info.fps > MAX_FPS:
+            raise ValueError(f"帧率异常 ({info.fps:.2f}): {info.path}")
+
+
+def decoder_threads(info: MediaInfo) -> int:
+    """根据分辨率和编码选择解码线程数"""
+    if info.pixels <= 1920 * 1080:
+        threads = 2
+    elif info.pixels <= 3840 * 2160:
+        threads = 4
+    else:
+        threads = 8
+    if info.codec in HEAVY_CODECS:
+        threads *= 2
+    return max(1, min(threads, os.cpu_count() or 1))
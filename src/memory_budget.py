@@ -0,0 +1,245 @@
+"""
+任务内存预算 - 内存统计、准入控制和单任务内存上限
+
+- JobMemory: 任务执行期间后台采样内存（本任务的 ffmpeg 子进程 RSS + 本任务在进程内的估算内存），
+  按阶段记录峰值；AUTOVLOG_TRACEMALLOC=1 时同时记录 Python 分配峰值（tracemalloc）。
+  超过单任务上限（AUTOVLOG_JOB_MEMORY_MB）时通过取消令牌中止任务
+- MemoryBudget: 按估算内存为任务预留额度（总额度 AUTOVLOG_MEMORY_BUDGET_MB），
+  额度不足时排队，超过等待时间拒绝，避免并发任务叠加后耗尽内存
+- estimate_job_mb: 按分辨率、输出规格和预加载数量估算单任务内存
+
+渲染循环逐帧流式处理，内存与片段数量无关：解码器数量受预加载预算限制，
+帧数据只保留当前帧和最后一帧。
+本进程的 RSS 增量包含并发任务、常驻会话和各类缓存的增长，无法归属到单个任务，
+只作为诊断信息记录（process_peak_mb），不参与单任务上限判断。
+"""
+
+import os
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from src.preloader import PRELOAD_AHEAD, READER_MEMORY_FRAMES
+
+
+# 单任务内存上限（MB，0 表示不限）
+JOB_MEMORY_MB = float(os.getenv("AUTOVLOG_JOB_MEMORY_MB", "4096"))
+
+# 所有任务的内存预算（MB，0 表示按启动时可用内存的 80%）
+MEMORY_BUDGET_MB = float(os.getenv("AUTOVLOG_MEMORY_BUDGET_MB", "0"))
+
+# 额度不足时的最长等待时间（秒）
+RESERVE_TIMEOUT = float(os.getenv("AUTOVLOG_MEMORY_WAIT", "60"))
+
+# 是否记录 Python 分配峰值（tracemalloc 有额外开销，且统计的是整个进程）
+TRACEMALLOC = os.getenv("AUTOVLOG_TRACEMALLOC") == "1"
+
+# 采样间隔（秒）
+SAMPLE_INTERVAL = 0.2
+
+# 估算参数（以输出帧大小为单位）
+JOB_BASE_MB = 150  # GL 上下文、着色器、字体等固定开销
+WORKING_FRAMES = 16  # 纹理（软件 GL 时在内存中）、FBO 回读、复合图片、字幕、最后一帧
+ENCODER_FRAMES = 10  # 每路编码输出的管道和编码器缓冲
+
+# 超过单任务内存上限时的取消原因前缀
+MEMORY_EXCEEDED = "内存超限"
+
+_PAGE_MB = os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+class MemoryUnavailable(Exception):
+    """内存额度不足"""
+
+
+def rss_mb(pid: Optional[int] = None) -> float:
+    """进程常驻内存（MB），进程不存在时返回 0"""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_MB
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+
+def estimate_in_process_mb(width: int, height: int) -> float:
+    """估算单任务在本进程内的内存（MB，不含 ffmpeg 子进程）"""
+    frame_mb = width * height * 3 / 1024 / 1024
+    return JOB_BASE_MB + frame_mb * WORKING_FRAMES
+
+
+def estimate_job_mb(width: int, height: int, renditions: int = 0) -> float:
+    """估算单任务内存（MB）"""
+    frame_mb = width * height * 3 / 1024 / 1024
+    frames = (
+        WORKING_FRAMES
+        + (PRELOAD_AHEAD + 2) * READER_MEMORY_FRAMES
+        + ENCODER_FRAMES * (1 + renditions)
+    )
+    return JOB_BASE_MB + frame_mb * frames
+
+
+class JobMemory:
+    """单任务内存统计（本任务的 ffmpeg 子进程 + 进程内估算）"""
+
+    def __init__(self, ceiling_mb: float = JOB_MEMORY_MB, in_process_mb: float = 0.0):
+        """
+        Args:
+            ceiling_mb: 单任务内存上限（0 表示不限）
+            in_process_mb: 本任务在进程内的估算内存（estimate_in_process_mb）
+        """
+        self.ceiling_mb = ceiling_mb or None
+        self.in_process_mb = in_process_mb
+        self.stage_peaks: Dict[str, float] = {}
+        self.peak_mb = 0.0
+        self.peak_children_mb = 0.0
+        self.peak_process_mb = 0.0  # 本进程 RSS 增量（含其它任务，仅诊断）
+        self.python_peaks: Dict[str, float] = {}
+        self._stage: Optional[str] = None
+        self._pids: List[int] = []
+        self._baseline = rss_mb()  # 任务开始时的进程内存
+        self._token = None
+        self._lock = threading.Lock()
+
+    def attach(self, pid: int):
+        """登记本任务的 ffmpeg 子进程"""
+        with self._lock:
+            self._pids.append(pid)
+
+    def sample(self) -> float:
+        """采样一次，返回本任务当前内存（MB）"""
+        with self._lock:
+            pids = list(self._pids)
+        children = [rss_mb(pid) for pid in pids]
+        exited = {pid for pid, mb in zip(pids, children) if not mb}
+        with self._lock:
+            # 已退出的子进程不再采样
+            self._pids = [pid for pid in self._pids if pid not in exited]
+            children_mb = sum(children)
+            current = self.in_process_mb + children_mb
+            self.peak_mb = max(self.peak_mb, current)
+            self.peak_children_mb = max(self.peak_children_mb, children_mb)
+            self.peak_process_mb = max(
+                self.peak_process_mb, rss_mb() - self._baseline
+            )
+            if self._stage is not None:
+                self.stage_peaks[self._stage] = max(
+                    self.stage_peaks.get(self._stage, 0.0), current
+                )
+        if self.ceiling_mb and current > self.ceiling_mb and self._token is not None:
+            self._token.cancel(f"{MEMORY_EXCEEDED} ({current:.0f}MB > {self.ceiling_mb:.0f}MB)")
+        return current
+
+    @contextmanager
+    def track(self, token=None):
+        """任务执行期间后台采样；超过上限时取消 token"""
+        if TRACEMALLOC and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._token = token
+        stop = threading.Event()
+
+        def _loop():
+            while not stop.wait(SAMPLE_INTERVAL):
+                self.sample()
+
+        sampler = threading.Thread(target=_loop, name="job-memory", daemon=True)
+        sampler.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            sampler.join()
+            self.sample()
+            self._token = None
+
+    @contextmanager
+    def stage(self, name: str):
+        """标记当前阶段（采样结果计入该阶段）"""
+        with self._lock:
+            previous, self._stage = self._stage, name
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            self.sample()
+            if tracemalloc.is_tracing():
+                peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+                self.python_peaks[name] = max(self.python_peaks.get(name, 0.0), peak)
+            with self._lock:
+                self._stage = previous
+
+    def report(self) -> dict:
+        """内存高水位（MB）"""
+        data = {
+            "peak_mb": round(self.peak_mb, 1),
+            "peak_children_mb": round(self.peak_children_mb, 1),
+            "process_peak_mb": round(self.peak_process_mb, 1),
+            "ceiling_mb": self.ceiling_mb,
+            "stages": {name: round(mb, 1) for name, mb in self.stage_peaks.items()},
+        }
+        if self.python_peaks:
+            data["python_peak_mb"] = {
+                name: round(mb, 1) for name, mb in self.python_peaks.items()
+            }
+        return data
+
+
+class MemoryBudget:
+    """进程内存预算（准入控制）"""
+
+    _capacity: Optional[float] = None
+    _reserved = 0.0
+    _condition = threading.Condition()
+
+    @staticmethod
+    def capacity() -> float:
+        if MemoryBudget._capacity is None:
+            capacity = MEMORY_BUDGET_MB
+            if not capacity:
+                from src.session_actor import available_memory_mb
+
+                capacity = (available_memory_mb() or 8192) * 0.8
+            MemoryBudget._capacity = capacity
+        return MemoryBudget._capacity
+
+    @staticmethod
+    @contextmanager
+    def reserve(mb: float, timeout: float = RESERVE_TIMEOUT, token=None):
+        """
+        预留内存额度，额度不足时等待
+
+        单个任务的估算超过总额度时按总额度预留（独占执行）。
+        """
+        capacity = MemoryBudget.capacity()
+        mb = min(mb, capacity)
+        deadline = time.monotonic() + timeout
+        with MemoryBudget._condition:
+            while MemoryBudget._reserved + mb > capacity:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise MemoryUnavailable(
+                        f"内存额度不足: 需要 {mb:.0f}MB，"
+                        f"已预留 {MemoryBudget._reserved:.0f}/{capacity:.0f}MB"
+                    )
+                if token is not None:
+                    token.raise_if_cancelled()
+                MemoryBudget._condition.wait(min(remaining, 0.5))
+            MemoryBudget._reserved += mb
+        try:
+            yield mb
+        finally:
+            with MemoryBudget._condition:
+                MemoryBudget._reserved -= mb
+                MemoryBudget._condition.notify_all()
+
+    @staticmethod
+    def status() -> dict:
+        with MemoryBudget._condition:
+            reserved = MemoryBudget._reserved
+        return {
+            "capacity_mb": round(MemoryBudget.capacity(), 1),
+            "reserved_mb": round(reserved, 1),
+            "job_ceiling_mb": JOB_MEMORY_MB or None,
+        }
@@ -0,0 +1,354 @@
+"""
+片段中间格式缓存 - 按目标分辨率和帧率缓存解码后的原始帧
+
+同一批体验视频片段被几乎每个任务使用，每次都要启动 ffmpeg 解码、缩放到输出分辨率并转换帧率。
+热门片段在第一次完整解码时顺带把输出帧写入缓存（rgb24 原始帧，与解码器输出逐字节一致），
+之后的任务以内存映射方式直接读取，不再启动解码器：
+- MezzanineCache: 磁盘缓存（多进程共享，条目通过重命名原子提交，按最久未使用淘汰）
+- MezzanineReader: 从缓存条目读取帧，接口与 VideoReader 相同
+- MezzanineFill: 包装 VideoReader，读取的同时由后台线程写入缓存（写入跟不上时放弃，不阻塞渲染）
+
+原始帧很大（1080p 每秒约 180MB，18 秒片段约 2.8GB），缓存默认关闭，
+容量需按常用片段的总时长设置；单个条目超过容量一半的片段不写入缓存，避免条目互相淘汰。
+
+- AUTOVLOG_MEZZANINE_DIR: 缓存目录（默认 /tmp/autovlog_mezzanine）
+- AUTOVLOG_MEZZANINE_MB: 缓存容量（默认 0 关闭缓存）
+- AUTOVLOG_MEZZANINE_MIN_USES: 片段在本进程中被打开多少次后写入缓存（默认 2）
+"""
+
+import os
+import json
+import mmap
+import uuid
+import queue
+import shutil
+import threading
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.segment_cache import content_hash, cache_key
+
+
+MEZZANINE_DIR = Path(os.getenv("AUTOVLOG_MEZZANINE_DIR", "/tmp/autovlog_mezzanine"))
+MEZZANINE_MB = float(os.getenv("AUTOVLOG_MEZZANINE_MB", "0"))
+MEZZANINE_MIN_USES = int(os.getenv("AUTOVLOG_MEZZANINE_MIN_USES", "2"))
+
+# 写入线程排队的最大帧数（超过时放弃本次写入）
+FILL_QUEUE_FRAMES = 8
+
+# 条目中的文件
+FRAMES_FILE = "frames.rgb"
+META_FILE = "meta.json"
+
+_PAGE_SIZE = mmap.PAGESIZE
+
+
+@dataclass
+class MezzanineEntry:
+    """缓存条目元数据"""
+
+    frames: int  # 缓存的帧数（从片段第 0 帧开始）
+    complete: bool  # 是否读到了片段末尾（之后没有更多帧）
+    width: int
+    height: int
+    fps: float
+
+    def covers(self, start_frame: int, read_frames: int) -> bool:
+        return self.complete or self.frames >= start_frame + read_frames
+
+
+class MezzanineCache:
+    """解码帧的磁盘缓存"""
+
+    _lock = threading.Lock()
+    _uses: Dict[str, int] = {}  # 缓存键 -> 本进程中的打开次数
+    hits = 0
+    fills = 0
+
+    @staticmethod
+    def enabled() -> bool:
+        return MEZZANINE_MB > 0
+
+    @staticmethod
+    def _entries() -> Path:
+        path = MEZZANINE_DIR / "entries"
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    @staticmethod
+    def key(path: str, width: int, height: int, fps: float) -> Optional[str]:
+        digest = content_hash(path)
+        if digest is None:
+            return None
+        return cache_key("mezzanine", digest, width, height, fps)
+
+    @staticmethod
+    def open(
+        path: str,
+        width: int,
+        height: int,
+        fps: float,
+        frame_size: int,
+        start_frame: int,
+        read_frames: int,
+        decode,
+    ):
+        """
+        打开片段读取器：命中时从缓存读取，否则调用 decode() 启动解码器
+
+        从第 0 帧开始读取的热门片段在解码时同时写入缓存。
+        """
+        key = MezzanineCache.key(path, width, height, fps)
+        if key is None:
+            return decode()
+
+        reader = MezzanineCache.lookup(key, path, frame_size, start_frame, read_frames)
+        if reader is not None:
+            return reader
+
+        with MezzanineCache._lock:
+            uses = MezzanineCache._uses[key] = MezzanineCache._uses.get(key, 0) + 1
+        reader = decode()
+        if start_frame or uses < MEZZANINE_MIN_USES:
+            return reader
+        if read_frames * frame_size > MEZZANINE_MB * 1024 * 1024 / 2:
+            # 容量容纳不下两个这样的条目，写入后很快被淘汰
+            return reader
+        return MezzanineFill(
+            reader, key, MezzanineEntry(0, False, width, height, fps), read_frames
+        )
+
+    @staticmethod
+    def lookup(key, path, frame_size, start_frame, read_frames):
+        """命中且覆盖所需帧范围时返回 MezzanineReader，否则返回 None"""
+        entry_dir = MezzanineCache._entries() / key
+        try:
+            meta = MezzanineEntry(**json.loads((entry_dir / META_FILE).read_text()))
+            if not meta.covers(start_frame, read_frames):
+                return None
+            reader = MezzanineReader(
+                entry_dir / FRAMES_FILE, path, frame_size, meta.frames, start_frame, read_frames
+            )
+            os.utime(entry_dir)  # 最近使用时间
+        except (OSError, ValueError, TypeError):
+            # 条目不存在、不完整或刚被淘汰
+            return None
+        with MezzanineCache._lock:
+            MezzanineCache.hits += 1
+        return reader
+
+    @staticmethod
+    def staging() -> Path:
+        """新条目的暂存目录（与缓存同一文件系统，提交时重命名）"""
+        path = MezzanineCache._entries() / f".{uuid.uuid4().hex}"
+        path.mkdir()
+        return path
+
+    @staticmethod
+    def store(key: str, staging: Path, meta: MezzanineEntry):
+        """提交暂存目录；已有同样或更长的条目时保留已有条目"""
+        (staging / META_FILE).write_text(json.dumps(asdict(meta)))
+        target = MezzanineCache._entries() / key
+        try:
+            existing = MezzanineEntry(**json.loads((target / META_FILE).read_text()))
+            if existing.complete or existing.frames >= meta.frames:
+                shutil.rmtree(staging, ignore_errors=True)
+                return
+            # 替换较短的条目（正在读取旧条目的任务持有文件，不受影响）
+            shutil.rmtree(target, ignore_errors=True)
+        except (OSError, ValueError, TypeError):
+            pass
+        try:
+            os.rename(staging, target)
+        except OSError:
+            # 其它任务已提交同一条目
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        with MezzanineCache._lock:
+            MezzanineCache.fills += 1
+        MezzanineCache.evict()
+
+    @staticmethod
+    def evict():
+        """按最久未使用淘汰，直到总大小不超过容量"""
+        with MezzanineCache._lock:
+            entries = []
+            total = 0
+            for entry in MezzanineCache._entries().iterdir():
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    size = sum(path.stat().st_size for path in entry.iterdir())
+                    entries.append((entry.stat().st_mtime, size, entry))
+                except OSError:
+                    continue
+                total += size
+            limit = MEZZANINE_MB * 1024 * 1024
+            for _, size, entry in sorted(entries, key=lambda item: item[0]):
+                if total <= limit:
+                    break
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+
+    @staticmethod
+    def stats() -> dict:
+        entries = [
+            entry
+            for entry in MezzanineCache._entries().iterdir()
+            if not entry.name.startswith(".")
+        ]
+        size = 0
+        for entry in entries:
+            try:
+                size += sum(path.stat().st_size for path in entry.iterdir())
+            except OSError:
+                continue
+        with MezzanineCache._lock:
+            hits, fills = MezzanineCache.hits, MezzanineCache.fills
+        return {
+            "entries": len(entries),
+            "size_mb": round(size / 1024 / 1024, 1),
+            "capacity_mb": MEZZANINE_MB,
+            "hits": hits,
+            "fills": fills,
+        }
+
+
+class MezzanineReader:
+    """从缓存条目读取帧（接口与 VideoReader 相同）"""
+
+    process = None  # 没有解码进程
+
+    def __init__(self, frames_path, filename, frame_size, frames, start_frame, read_frames):
+        self.filename = filename
+        self.frame_size = frame_size
+        self.eof_reached = False
+        self.last_valid_frame = bytes(frame_size)
+        self.first_frame_buffer = None
+        self._end = min(frames, start_frame + read_frames)
+        self._next = start_frame
+        self._released = 0  # 已从本进程映射中释放的字节数
+
+        # 打开文件后即使条目被淘汰，映射仍然有效
+        with open(frames_path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(self._map, "madvise"):
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+        if self._next < self._end:
+            self.first_frame_buffer = self._take()
+            self.last_valid_frame = self.first_frame_buffer
+        print(f"   💾 缓存读取 {filename} (第 {start_frame} 帧起)")
+
+    def _take(self) -> bytes:
+        offset = self._next * self.frame_size
+        frame = self._map[offset : offset + self.frame_size]
+        self._next += 1
+        # 已读过的页面不计入本进程内存（页缓存仍由其它任务共享）
+        released = (offset + self.frame_size) // _PAGE_SIZE * _PAGE_SIZE
+        if hasattr(self._map, "madvise") and released > self._released:
+            self._map.madvise(mmap.MADV_DONTNEED, self._released, released - self._released)
+            self._released = released
+        return frame
+
+    def read_frame(self):
+        """读取一帧，读完后返回最后一帧"""
+        if self.first_frame_buffer:
+            frame = self.first_frame_buffer
+            self.first_frame_buffer = None
+            return frame
+        if self._next < self._end:
+            self.last_valid_frame = self._take()
+            return self.last_valid_frame
+        self.eof_reached = True
+        return self.last_valid_frame
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class MezzanineFill:
+    """包装解码器，读取帧的同时由后台线程写入缓存；完整读取后在关闭时提交"""
+
+    def __init__(self, reader, key: str, meta: MezzanineEntry, read_frames: int):
+        self.reader = reader
+        self.key = key
+        self.meta = meta
+        self.read_frames = read_frames
+        self.staging = MezzanineCache.staging()
+        self._queue = queue.Queue(maxsize=FILL_QUEUE_FRAMES)
+        self._failed = False
+        self._commit = False
+        self._writer = threading.Thread(
+            target=self._write_loop, name="mezzanine-fill", daemon=True
+        )
+        self._writer.start()
+
+    @property
+    def process(self):
+        return self.reader.process
+
+    @property
+    def filename(self):
+        return self.reader.filename
+
+    @property
+    def eof_reached(self):
+        return self.reader.eof_reached
+
+    @property
+    def last_valid_frame(self):
+        return self.reader.last_valid_frame
+
+    @property
+    def first_frame_buffer(self):
+        return self.reader.first_frame_buffer
+
+    def read_frame(self):
+        frame = self.reader.read_frame()
+        if not self._failed and not self.reader.eof_reached:
+            try:
+                self._queue.put_nowait(frame)
+                self.meta.frames += 1
+            except queue.Full:
+                # 磁盘写入跟不上解码，放弃写入缓存（不阻塞渲染线程）
+                self._failed = True
+        return frame
+
+    def _write_loop(self):
+        """写入线程：写完排队的帧，关闭时提交或丢弃暂存目录"""
+        closed = False
+        try:
+            with open(self.staging / FRAMES_FILE, "wb") as f:
+                while not closed:
+                    frame = self._queue.get()
+                    closed = frame is None
+                    if not (closed or self._failed):
+                        f.write(frame)
+        except OSError:
+            # 磁盘空间不足等，放弃写入缓存
+            self._failed = True
+        while not closed:
+            closed = self._queue.get() is None
+        if self._commit and not self._failed:
+            MezzanineCache.store(self.key, self.staging, self.meta)
+        else:
+            shutil.rmtree(self.staging, ignore_errors=True)
+
+    def close(self):
+        self.reader.close()
+        if self._writer is None:
+            return
+        # 读满所需帧数，或在此之前到达片段末尾（之后没有更多帧）时才提交；
+        # 取消或提前结束时帧不完整，丢弃
+        self.meta.complete = (
+            self.reader.eof_reached and self.meta.frames < self.read_frames
+        )
+        self._commit = bool(self.meta.frames) and (
+            self.meta.complete or self.meta.frames >= self.read_frames
+        )
+        # 提交在写入线程中完成，渲染线程不等待剩余帧写入磁盘
+        self._queue.put(None)
+        self._writer = None
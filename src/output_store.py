@@ -0,0 +1,352 @@
+"""
+输出存储 - 成品视频的存放位置
+
+- LocalOutputStore: 本地目录（默认，配合 /videos 静态文件服务）
+- S3OutputStore: S3 兼容对象存储（AWS S3、MinIO 等），多节点共享输出
+
+写入对象存储时，最终封装的 ffmpeg 以分片 MP4 输出到管道，
+数据按分段（multipart）边封装边上传，最后一个分段提交后立即返回对象 URL，
+无需先写完本地文件再整体上传。
+
+环境变量：
+- AUTOVLOG_OUTPUT_STORE: local（默认）或 s3
+- AUTOVLOG_S3_BUCKET / AUTOVLOG_S3_PREFIX: 存储桶和对象键前缀
+- AUTOVLOG_S3_ENDPOINT: 自定义端点（如本地 MinIO: http://minio:9000）
+- AUTOVLOG_S3_PUBLIC_URL: 公开访问地址前缀，未设置时返回预签名 URL
+- AUTOVLOG_S3_URL_EXPIRES: 预签名 URL 有效期（秒）
+- 访问凭证使用 boto3 标准环境变量（AWS_ACCESS_KEY_ID 等）
+"""
+
+import os
+import errno
+import shutil
+import tempfile
+import mimetypes
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+
+# 分段大小（S3 要求除最后一段外不小于 5MB）
+PART_SIZE = 8 * 1024 * 1024
+# 同时上传的分段数（限制内存中缓冲的数据量）
+MAX_INFLIGHT_PARTS = 4
+# 管道读取块大小
+READ_SIZE = 1024 * 1024
+
+# 较旧的系统 MIME 表中可能缺少预览文件的类型
+mimetypes.add_type("text/vtt", ".vtt")
+mimetypes.add_type("image/webp", ".webp")
+
+# 输出到管道时使用分片 MP4（moov 在文件头，无需回写）
+STREAM_MOVFLAGS = "frag_keyframe+empty_moov+default_base_moof"
+
+
+class OutputStore:
+    """输出存储接口"""
+
+    def url(self, key: str) -> str:
+        """对象访问地址"""
+        raise NotImplementedError
+
+    def put_file(self, path, key: str) -> str:
+        """发布本地文件（发布后本地文件被移走或删除），返回访问地址"""
+        raise NotImplementedError
+
+    def write_ffmpeg(self, args: List[str], key: str) -> str:
+        """
+        运行 ffmpeg 并将输出写入存储，返回访问地址
+
+        Args:
+            args: ffmpeg 命令（不含输出格式和输出路径）
+            key: 对象键（文件名）
+        """
+        raise NotImplementedError
+
+
+class LocalOutputStore(OutputStore):
+    """本地目录存储"""
+
+    def __init__(self, root, base_url: Optional[str] = None):
+        """
+        Args:
+            root: 输出目录
+            base_url: 访问地址前缀，未设置时返回本地路径
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.base_url = base_url.rstrip("/") if base_url else None
+
+    def url(self, key: str) -> str:
+        if self.base_url:
+            return f"{self.base_url}/{key}"
+        return str(self.root / key)
+
+    def put_file(self, path, key: str) -> str:
+        target = self.root / key
+        if Path(path).resolve() == target.resolve():
+            return self.url(key)
+        try:
+            os.replace(path, target)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # 跨文件系统（如 tmpfs 工作目录）：先复制为临时文件，完成后再改名
+            # 临时文件名唯一，同时发布同一 key 的任务不会互相覆盖未写完的文件
+            fd, partial = tempfile.mkstemp(
+                dir=target.parent, prefix=target.name + ".", suffix=".part"
+            )
+            os.close(fd)
+            try:
+                shutil.copyfile(path, partial)
+                # mkstemp 创建的文件只有所有者可读，与同文件系统改名一样保留原文件权限
+                shutil.copymode(path, partial)
+            except BaseException:
+                os.remove(partial)
+                raise
+            os.replace(partial, target)
+            os.remove(path)
+        return self.url(key)
+
+    def write_ffmpeg(self, args: List[str], key: str) -> str:
+        # 本地文件可回写，使用 faststart 生成普通 MP4；先写临时文件，完成后再改名
+        target = self.root / key
+        partial = target.with_name(target.name + ".part")
+        try:
+            subprocess.run(
+                args + ["-movflags", "+faststart", "-f", "mp4", str(partial)],
+                check=True,
+                capture_output=True,
+            )
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        os.replace(partial, target)
+        return self.url(key)
+
+    def __repr__(self):
+        return f"LocalOutputStore({self.root})"
+
+
+class S3MultipartWriter:
+    """S3 分段上传写入器：缓冲满一个分段即在后台上传"""
+
+    def __init__(self, store: "S3OutputStore", key: str):
+        self.store = store
+        self.key = key
+        self.object_key = store.object_key(key)
+        self.upload_id = store.client.create_multipart_upload(
+            Bucket=store.bucket,
+            Key=self.object_key,
+            ContentType=store.content_type(key),
+        )["UploadId"]
+        self.buffer = bytearray()
+        self.part_number = 0
+        self.futures = []
+        self.bytes_written = 0
+        self._slots = threading.BoundedSemaphore(MAX_INFLIGHT_PARTS)
+
+    def write(self, data: bytes):
+        self.buffer.extend(data)
+        self.bytes_written += len(data)
+        while len(self.buffer) >= PART_SIZE:
+            part = bytes(self.buffer[:PART_SIZE])
+            del self.buffer[:PART_SIZE]
+            self._submit(part)
+
+    def _submit(self, data: bytes):
+        # 上传中的分段达到上限时阻塞写入方，避免无界缓冲
+        self._slots.acquire()
+        self.part_number += 1
+        future = self.store.executor.submit(self._upload_part, self.part_number, data)
+        future.add_done_callback(lambda _: self._slots.release())
+        self.futures.append(future)
+
+    def _upload_part(self, part_number: int, data: bytes) -> dict:
+        response = self.store.client.upload_part(
+            Bucket=self.store.bucket,
+            Key=self.object_key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    def close(self) -> str:
+        """上传剩余数据并提交，返回访问地址"""
+        if self.buffer or self.part_number == 0:
+            self._submit(bytes(self.buffer))
+            self.buffer.clear()
+        try:
+            parts = [future.result() for future in self.futures]
+            self.store.client.complete_multipart_upload(
+                Bucket=self.store.bucket,
+                Key=self.object_key,
+                UploadId=self.upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except BaseException:
+            self.abort()
+            raise
+        print(
+            f"   ☁️  已上传: s3://{self.store.bucket}/{self.object_key} "
+            f"({self.bytes_written / 1024 / 1024:.1f}MB, {len(parts)} 段)"
+        )
+        return self.store.url(self.key)
+
+    def abort(self):
+        """放弃上传，删除已上传的分段"""
+        for future in self.futures:
+            future.cancel()
+        try:
+            self.store.client.abort_multipart_upload(
+                Bucket=self.store.bucket, Key=self.object_key, UploadId=self.upload_id
+            )
+        except Exception as e:
+            print(f"   ⚠️  取消分段上传失败: {e}")
+
+
+class S3OutputStore(OutputStore):
+    """S3 兼容对象存储"""
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        public_url: Optional[str] = None,
+        url_expires: int = 86400,
+    ):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("使用 S3 输出存储需要安装 boto3: pip install boto3")
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.endpoint_url = endpoint_url
+        self.public_url = public_url.rstrip("/") if public_url else None
+        self.url_expires = url_expires
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.executor = ThreadPoolExecutor(
+            max_workers=MAX_INFLIGHT_PARTS, thread_name_prefix="s3-upload"
+        )
+        self._ensure_bucket()
+
+    def _ensure_bucket(self):
+        """存储桶不存在时创建（便于对接本地 MinIO）"""
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_bucket(Bucket=self.bucket)
+        except ClientError:
+            self.client.create_bucket(Bucket=self.bucket)
+            print(f"🪣 已创建存储桶: {self.bucket}")
+
+    def object_key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    @staticmethod
+    def content_type(key: str) -> str:
+        """按扩展名确定对象类型（成品视频、封面、雪碧图、WebVTT 索引、动态预览）"""
+        return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+    def url(self, key: str) -> str:
+        if self.public_url:
+            return f"{self.public_url}/{self.object_key(key)}"
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self.object_key(key)},
+            ExpiresIn=self.url_expires,
+        )
+
+    def open_writer(self, key: str) -> S3MultipartWriter:
+        return S3MultipartWriter(self, key)
+
+    def put_file(self, path, key: str) -> str:
+        writer = self.open_writer(key)
+        try:
+            with open(path, "rb") as f:
+                while True:
+                    chunk = f.read(READ_SIZE)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+        except BaseException:
+            writer.abort()
+            raise
+        url = writer.close()
+        os.remove(path)
+        return url
+
+    def write_ffmpeg(self, args: List[str], key: str) -> str:
+        writer = self.open_writer(key)
+        process = subprocess.Popen(
+            args + ["-movflags", STREAM_MOVFLAGS, "-f", "mp4", "pipe:1"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        # 单独线程读取 stderr，避免管道写满阻塞 ffmpeg
+        stderr_chunks = []
+        stderr_thread = threading.Thread(
+            target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True
+        )
+        stderr_thread.start()
+
+        try:
+            while True:
+                chunk = process.stdout.read(READ_SIZE)
+                if not chunk:
+                    break
+                writer.write(chunk)
+            process.wait()
+            stderr_thread.join()
+            if process.returncode != 0:
+                raise subprocess.CalledProcessError(
+                    process.returncode, args, stderr=b"".join(stderr_chunks)
+                )
+        except BaseException:
+            process.kill()
+            process.wait()
+            writer.abort()
+            raise
+        return writer.close()
+
+    def __repr__(self):
+        endpoint = f" @ {self.endpoint_url}" if self.endpoint_url else ""
+        return f"S3OutputStore(s3://{self.bucket}/{self.prefix}{endpoint})"
+
+
+_store: Optional[OutputStore] = None
+_store_lock = threading.Lock()
+
+
+def get_output_store(output_dir="outputs") -> OutputStore:
+    """按环境变量创建服务使用的输出存储（进程内单例）"""
+    global _store
+    with _store_lock:
+        if _store is not None:
+            return _store
+
+        backend = os.getenv("AUTOVLOG_OUTPUT_STORE", "local").lower()
+        if backend == "s3":
+            bucket = os.getenv("AUTOVLOG_S3_BUCKET")
+            if not bucket:
+                raise RuntimeError("AUTOVLOG_OUTPUT_STORE=s3 需要设置 AUTOVLOG_S3_BUCKET")
+            _store = S3OutputStore(
+                bucket,
+                prefix=os.getenv("AUTOVLOG_S3_PREFIX", ""),
+                endpoint_url=os.getenv("AUTOVLOG_S3_ENDPOINT") or None,
+                public_url=os.getenv("AUTOVLOG_S3_PUBLIC_URL") or None,
+                url_expires=int(os.getenv("AUTOVLOG_S3_URL_EXPIRES", "86400")),
+            )
+        elif backend == "local":
+            base_url = os.getenv("API_BASE_URL", "http://localhost:8001")
+            _store = LocalOutputStore(output_dir, f"{base_url}/videos")
+        else:
+            raise RuntimeError(f"未知的输出存储: {backend}")
+
+        print(f"📦 输出存储: {_store}")
+        return _store
@@ -0,0 +1,159 @@
+"""
+片段预加载 - 提前启动后续片段的解码器
+
+VideoReader 的构造函数会阻塞到 ffmpeg 启动、打开文件并解出首帧为止。
+按需打开时，每个片段边界都要等待这段时间，GPU 处于空闲。
+ClipPreloader 按执行计划中片段的使用顺序，在后台线程中提前打开解码器：
+- 同时预热（已打开但尚未开始使用）的解码器数量受 AUTOVLOG_PRELOAD_AHEAD 限制
+- 所有打开的解码器的估算内存受 AUTOVLOG_PRELOAD_MAX_MB 限制（超出时退化为按需打开）
+- 记录每个片段边界的等待时间
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List
+
+
+# 同时预热的解码器数量（0 表示关闭预加载）
+PRELOAD_AHEAD = int(os.getenv("AUTOVLOG_PRELOAD_AHEAD", "2"))
+
+# 所有打开的解码器的内存预算（MB）
+PRELOAD_MAX_MB = float(os.getenv("AUTOVLOG_PRELOAD_MAX_MB", "512"))
+
+# 单个解码器的内存估算：首帧缓冲 + 管道缓冲 + ffmpeg 解码/滤镜中的帧（以输出帧大小计）
+READER_MEMORY_FRAMES = 6
+
+
+@dataclass
+class ClipStall:
+    """一个片段边界的等待记录"""
+    clip: int
+    seconds: float  # 渲染线程等待解码器就绪的时间
+    preloaded: bool  # 是否由预加载打开
+
+
+class ClipPreloader:
+    """按执行计划提前打开片段解码器"""
+
+    def __init__(
+        self,
+        plan,
+        open_reader: Callable,
+        frame_size: int,
+        ahead: int = PRELOAD_AHEAD,
+        max_mb: float = PRELOAD_MAX_MB,
+    ):
+        """
+        Args:
+            plan: 执行计划（按区间顺序确定片段的使用顺序）
+            open_reader: 打开片段解码器的函数 open_reader(clip)
+            frame_size: 输出帧大小（字节），用于估算解码器内存
+        """
+        self.plan = plan
+        self.open_reader = open_reader
+        self.ahead = max(0, ahead)
+        reader_mb = frame_size * READER_MEMORY_FRAMES / 1024 / 1024
+        self.max_open = max(1, int(max_mb // reader_mb)) if reader_mb else 1
+        self.stalls: List[ClipStall] = []
+
+        # 片段的首次使用顺序
+        self._order: List[int] = []
+        for span in plan.spans:
+            for clip in (span.from_clip, span.clip):
+                if clip is not None and clip not in self._order:
+                    self._order.append(clip)
+        self._next = 0
+
+        self._futures: Dict[int, object] = {}  # 预加载中 / 已预热（未被取用）
+        self._readers: Dict[int, object] = {}  # 已取用
+        self._lock = threading.Lock()
+        self._executor = (
+            ThreadPoolExecutor(max_workers=self.ahead, thread_name_prefix="preload")
+            if self.ahead
+            else None
+        )
+        self._fill()
+
+    def _fill(self):
+        """在预算内为后续片段启动解码器"""
+        if self._executor is None:
+            return
+        with self._lock:
+            while (
+                self._next < len(self._order)
+                and len(self._futures) < self.ahead
+                and len(self._futures) + len(self._readers) < self.max_open
+            ):
+                index = self._order[self._next]
+                self._next += 1
+                if index in self._readers or index in self._futures:
+                    continue
+                self._futures[index] = self._executor.submit(
+                    self.open_reader, self.plan.clips[index]
+                )
+
+    def get(self, index: int):
+        """取得片段解码器（未预热时阻塞等待），记录边界等待时间"""
+        if index in self._readers:
+            return self._readers[index]
+
+        start = time.perf_counter()
+        with self._lock:
+            future = self._futures.pop(index, None)
+            if future is None and index in self._order[self._next:]:
+                # 超出预算未预加载的片段：跳过调度，直接按需打开
+                self._order.remove(index)
+        reader = future.result() if future is not None else self.open_reader(
+            self.plan.clips[index]
+        )
+        stall = ClipStall(index, round(time.perf_counter() - start, 4), future is not None)
+        self.stalls.append(stall)
+        if stall.seconds >= 0.05:
+            print(f"   ⏱️  视频{index + 1} 解码器等待 {stall.seconds * 1000:.0f}ms")
+
+        with self._lock:
+            self._readers[index] = reader
+        self._fill()
+        return reader
+
+    def release(self, index: int):
+        """关闭用完的解码器，并为后续片段腾出预算"""
+        with self._lock:
+            reader = self._readers.pop(index, None)
+        if reader is not None:
+            reader.close()
+        self._fill()
+
+    @property
+    def stall_seconds(self) -> float:
+        return sum(stall.seconds for stall in self.stalls)
+
+    def stall_report(self) -> List[dict]:
+        return [asdict(stall) for stall in self.stalls]
+
+    def close(self):
+        """关闭所有解码器（包括尚未取用的预热解码器）"""
+        with self._lock:
+            futures = list(self._futures.values())
+            readers = list(self._readers.values())
+            self._futures.clear()
+            self._readers.clear()
+            self._next = len(self._order)
+        for reader in readers:
+            reader.close()
+        for future in futures:
+            if not future.cancel():
+                future.add_done_callback(_close_result)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+def _close_result(future):
+    """关闭后台打开完成的解码器"""
+    try:
+        future.result().close()
+    except Exception:
+        pass
@@ -0,0 +1,344 @@
+"""
+预览生成 - 在渲染循环中截取帧，生成封面、拖动预览雪碧图和动态预览
+
+渲染循环写出每一帧时，PreviewCapture 在后台线程中处理时间线上的采样帧（与编码并行）：
+- 封面: poster_time 处的帧（JPEG）
+- 雪碧图: 每 sprite_interval 秒一帧缩略图拼成的网格（JPEG）+ WebVTT 索引（时间 → 区域）
+- 动态预览: 每 animation_interval 秒一帧低分辨率画面，按 animation_fps 播放（GIF / WebP）
+
+采样帧先用 numpy 整数倍区域平均缩小到代理尺寸（只保留代理图），不再在渲染后解码成品视频。
+复用的分块（src.segment_cache）带有渲染时保存的代理图；缺少时从分块码流中解码需要的帧。
+
+参数在 config.yaml 的 preview 节点中配置。
+"""
+
+import io
+import math
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import yaml
+from PIL import Image
+
+
+@dataclass
+class PreviewConfig:
+    """预览参数（config.yaml 的 preview 节点）"""
+
+    enabled: bool = True
+    poster_time: float = 5.0  # 封面时间（秒）
+    poster_width: int = 0  # 封面宽度（0 表示输出分辨率）
+    sprite_interval: float = 2.0  # 雪碧图采样间隔（秒）
+    sprite_width: int = 160  # 雪碧图单格宽度
+    sprite_columns: int = 10
+    animation_interval: float = 1.0  # 动态预览采样间隔（秒）
+    animation_width: int = 320
+    animation_fps: float = 8.0  # 动态预览播放帧率
+    animation_format: str = "gif"  # gif 或 webp
+    jpeg_quality: int = 90
+
+    @staticmethod
+    def load(config_path: Path = Path("config.yaml")) -> "PreviewConfig":
+        try:
+            with open(config_path, "r", encoding="utf-8") as f:
+                section = (yaml.safe_load(f) or {}).get("preview") or {}
+        except OSError:
+            section = {}
+        names = {item.name for item in fields(PreviewConfig)}
+        return PreviewConfig(**{k: v for k, v in section.items() if k in names})
+
+
+def frame_to_array(frame: bytes, width: int, height: int) -> np.ndarray:
+    """渲染帧（OpenGL 坐标系，自下而上）转为自上而下的 RGB 数组"""
+    return np.frombuffer(frame, dtype=np.uint8).reshape(height, width, 3)[::-1]
+
+
+def downscale(array: np.ndarray, width: int, height: int) -> np.ndarray:
+    """缩小图像：先按整数倍区域平均（向量化），剩余的小比例缩放交给 Pillow"""
+    src_h, src_w = array.shape[:2]
+    factor = max(1, min(src_w // width, src_h // height))
+    if factor > 1:
+        h, w = src_h // factor * factor, src_w // factor * factor
+        array = (
+            array[:h, :w]
+            .reshape(h // factor, factor, w // factor, factor, 3)
+            .mean(axis=(1, 3), dtype=np.float32)
+            .astype(np.uint8)
+        )
+    if array.shape[:2] != (height, width):
+        array = np.asarray(
+            Image.fromarray(np.ascontiguousarray(array)).resize(
+                (width, height), Image.BILINEAR
+            )
+        )
+    return np.ascontiguousarray(array)
+
+
+def scaled_size(width: int, height: int, target_width: int):
+    """按宽度等比缩放（尺寸取偶数）"""
+    target_width = min(target_width, width)
+    return target_width, max(2, round(height * target_width / width / 2) * 2)
+
+
+def _vtt_time(seconds: float) -> str:
+    hours, rest = divmod(seconds, 3600)
+    minutes, rest = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{rest:06.3f}"
+
+
+class PreviewCapture:
+    """渲染循环中的预览采样"""
+
+    def __init__(self, width: int, height: int, fps: float, config: PreviewConfig, offset: int = 0):
+        """
+        Args:
+            offset: 本次渲染的第 0 帧在成品时间线中的位置（增量模式的段落起点）
+        """
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.config = config
+        self.offset = offset
+        self.sprite_stride = max(1, round(config.sprite_interval * fps))
+        self.animation_stride = max(1, round(config.animation_interval * fps))
+        self.grid = math.gcd(self.sprite_stride, self.animation_stride)
+        self.proxy_size = scaled_size(
+            width, height, max(config.sprite_width, config.animation_width)
+        )
+        self.poster_index = round(config.poster_time * fps)
+        self.proxies: Dict[int, np.ndarray] = {}  # 时间线帧序号 -> 代理图
+        self.poster: Optional[bytes] = None  # 封面 JPEG
+        self._lock = threading.Lock()
+        self._futures = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="preview")
+
+    def capture(self, index: int, frame: bytes):
+        """登记写出的一帧（index 为本次渲染中的帧序号），需要时交给后台线程处理"""
+        index += self.offset
+        if index == self.poster_index:
+            self._futures.append(self._executor.submit(self._make_poster, frame))
+        if index % self.grid == 0:
+            self._futures.append(self._executor.submit(self._make_proxy, index, frame))
+
+    def _make_poster(self, frame: bytes):
+        array = frame_to_array(frame, self.width, self.height)
+        if self.config.poster_width and self.config.poster_width < self.width:
+            array = downscale(array, *scaled_size(self.width, self.height, self.config.poster_width))
+        buffer = io.BytesIO()
+        Image.fromarray(np.ascontiguousarray(array)).save(
+            buffer, format="JPEG", quality=self.config.jpeg_quality
+        )
+        self.poster = buffer.getvalue()
+
+    def _make_proxy(self, index: int, frame: bytes):
+        proxy = downscale(frame_to_array(frame, self.width, self.height), *self.proxy_size)
+        with self._lock:
+            self.proxies[index] = proxy
+
+    # ---------- 分块 / 段落之间传递采样结果 ----------
+
+    def dumps(self, start: int, frames: int) -> bytes:
+        """序列化 [start, start + frames) 内的采样结果（start 为本次渲染中的帧序号）"""
+        self.finish()
+        start += self.offset
+        with self._lock:
+            indices = sorted(i for i in self.proxies if start <= i < start + frames)
+            proxies = [self.proxies[i] for i in indices]
+        poster = b""
+        if self.poster is not None and start <= self.poster_index < start + frames:
+            poster = self.poster
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            grid=self.grid,
+            proxy_size=np.array(self.proxy_size),
+            indices=np.array([i - start for i in indices], dtype=np.int64),
+            proxies=np.array(proxies, dtype=np.uint8).reshape(
+                len(proxies), self.proxy_size[1], self.proxy_size[0], 3
+            ),
+            poster=np.frombuffer(poster, dtype=np.uint8),
+            poster_index=self.poster_index - start,
+        )
+        return buffer.getvalue()
+
+    def loads(self, data: bytes, start: int, frames: int) -> bool:
+        """
+        合并其它渲染保存的采样结果（start 为本次渲染中的帧序号）
+
+        Returns:
+            采样参数一致且覆盖了该范围内需要的所有帧时返回 True
+        """
+        start += self.offset
+        with np.load(io.BytesIO(data)) as saved:
+            if (
+                int(saved["grid"]) != self.grid
+                or tuple(saved["proxy_size"]) != self.proxy_size
+            ):
+                return False
+            indices = {int(i) + start for i in saved["indices"]}
+            wanted = {
+                i for i in range(start, start + frames) if i % self.grid == 0
+            }
+            poster = saved["poster"].tobytes()
+            needs_poster = start <= self.poster_index < start + frames
+            if not wanted <= indices:
+                return False
+            if needs_poster and (
+                not poster or int(saved["poster_index"]) + start != self.poster_index
+            ):
+                return False
+            with self._lock:
+                for i, proxy in zip(saved["indices"], saved["proxies"]):
+                    if int(i) + start in wanted:
+                        self.proxies[int(i) + start] = proxy
+            if needs_poster:
+                self.poster = poster
+        return True
+
+    def decode(self, video_path, start: int, frames: int):
+        """从已编码的分块码流（H.264 Annex B）中解码需要的采样帧（后台执行）"""
+        self._futures.append(
+            self._executor.submit(self._decode, str(video_path), start + self.offset, frames)
+        )
+
+    def _decode(self, video_path: str, start: int, frames: int):
+        wanted = [i for i in range(start, start + frames) if i % self.grid == 0]
+        if wanted:
+            proxy_w, proxy_h = self.proxy_size
+            data = self._run_ffmpeg(
+                video_path,
+                f"select='not(mod(n+{start % self.grid}\\,{self.grid}))',"
+                f"scale={proxy_w}:{proxy_h}",
+            )
+            size = proxy_w * proxy_h * 3
+            with self._lock:
+                for k, index in enumerate(wanted):
+                    chunk = data[k * size : (k + 1) * size]
+                    if len(chunk) == size:
+                        self.proxies[index] = np.frombuffer(chunk, dtype=np.uint8).reshape(
+                            proxy_h, proxy_w, 3
+                        )
+        if start <= self.poster_index < start + frames:
+            poster_w, poster_h = scaled_size(
+                self.width, self.height, self.config.poster_width or self.width
+            )
+            data = self._run_ffmpeg(
+                video_path,
+                f"select='eq(n\\,{self.poster_index - start})',scale={poster_w}:{poster_h}",
+            )
+            if len(data) >= poster_w * poster_h * 3:
+                array = np.frombuffer(data[: poster_w * poster_h * 3], dtype=np.uint8)
+                buffer = io.BytesIO()
+                Image.fromarray(array.reshape(poster_h, poster_w, 3)).save(
+                    buffer, format="JPEG", quality=self.config.jpeg_quality
+                )
+                self.poster = buffer.getvalue()
+
+    def _run_ffmpeg(self, video_path: str, video_filter: str) -> bytes:
+        return subprocess.run(
+            [
+                "ffmpeg", "-v", "error",
+                "-f", "h264",
+                "-framerate", str(self.fps),
+                "-i", video_path,
+                "-vf", video_filter,
+                "-vsync", "0",
+                "-f", "rawvideo",
+                "-pix_fmt", "rgb24",
+                "pipe:",
+            ],
+            check=True,
+            capture_output=True,
+        ).stdout
+
+    # ---------- 输出 ----------
+
+    def finish(self):
+        """等待后台处理完成（预览失败不影响渲染结果）"""
+        futures, self._futures = self._futures, []
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"   ⚠️  预览采样失败: {e}")
+
+    def write(self, directory, stem: str, total_frames: int) -> Dict[str, Path]:
+        """
+        生成封面、雪碧图（+ WebVTT）和动态预览
+
+        Returns:
+            {'poster': 路径, 'sprite': 路径, 'sprite_vtt': 路径, 'animation': 路径}（缺少采样帧的项省略）
+        """
+        self.finish()
+        directory = Path(directory)
+        outputs = {}
+
+        if self.poster is not None:
+            outputs["poster"] = directory / f"{stem}.jpg"
+            outputs["poster"].write_bytes(self.poster)
+
+        sprite_frames = self._frames(self.sprite_stride, total_frames)
+        if sprite_frames:
+            outputs["sprite"], outputs["sprite_vtt"] = self._write_sprite(
+                directory, stem, sprite_frames, total_frames
+            )
+
+        animation_frames = self._frames(self.animation_stride, total_frames)
+        if animation_frames:
+            outputs["animation"] = self._write_animation(
+                directory, stem, [proxy for _, proxy in animation_frames]
+            )
+        self.close()
+        return outputs
+
+    def _frames(self, stride: int, total_frames: int) -> List[tuple]:
+        with self._lock:
+            return [
+                (i, self.proxies[i])
+                for i in range(0, total_frames, stride)
+                if i in self.proxies
+            ]
+
+    def _write_sprite(self, directory: Path, stem: str, frames: List[tuple], total_frames: int):
+        tile_w, tile_h = scaled_size(self.width, self.height, self.config.sprite_width)
+        columns = max(1, min(self.config.sprite_columns, len(frames)))
+        rows = math.ceil(len(frames) / columns)
+        sheet = np.zeros((rows * tile_h, columns * tile_w, 3), dtype=np.uint8)
+        sprite_path = directory / f"{stem}_sprite.jpg"
+        cues = ["WEBVTT", ""]
+        for k, (index, proxy) in enumerate(frames):
+            row, column = divmod(k, columns)
+            x, y = column * tile_w, row * tile_h
+            sheet[y : y + tile_h, x : x + tile_w] = downscale(proxy, tile_w, tile_h)
+            end = frames[k + 1][0] if k + 1 < len(frames) else total_frames
+            cues += [
+                f"{_vtt_time(index / self.fps)} --> {_vtt_time(end / self.fps)}",
+                f"{sprite_path.name}#xywh={x},{y},{tile_w},{tile_h}",
+                "",
+            ]
+        Image.fromarray(sheet).save(sprite_path, format="JPEG", quality=self.config.jpeg_quality)
+        vtt_path = directory / f"{stem}_sprite.vtt"
+        vtt_path.write_text("\n".join(cues), encoding="utf-8")
+        return sprite_path, vtt_path
+
+    def _write_animation(self, directory: Path, stem: str, proxies: List[np.ndarray]) -> Path:
+        size = scaled_size(self.width, self.height, self.config.animation_width)
+        images = [Image.fromarray(downscale(proxy, *size)) for proxy in proxies]
+        extension = "webp" if self.config.animation_format == "webp" else "gif"
+        path = directory / f"{stem}_preview.{extension}"
+        images[0].save(
+            path,
+            save_all=True,
+            append_images=images[1:],
+            duration=round(1000 / self.config.animation_fps),
+            loop=0,
+        )
+        return path
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -3,13 +3,156 @@
 """
 
 import os
+import hashlib
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from PIL import Image, ImageDraw, ImageFont
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+
+# EXIF Orientation 中需要交换宽高的取值（旋转 90/270 度）
+EXIF_ORIENTATION_TAG = 0x0112
+EXIF_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+# 边框透明度分块大小（像素）
+BORDER_TILE_SIZE = 32
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """计算文件内容哈希"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_photo(image_path, target_width, target_height):
+    """
+    加载照片并等比缩放到目标区域内
+
+    - JPEG 使用 draft 模式在解码阶段按 1/2、1/4、1/8 降采样，
+      选取不小于目标尺寸的最小比例，避免完整解码 12-48MP 大图
+    - 应用 EXIF 方向信息
+    - 最后使用 LANCZOS 高质量重采样到精确尺寸
+
+    Returns:
+        缩放后的 RGB 图片
+    """
+    img = Image.open(image_path)
+
+    # 按 EXIF 方向计算显示尺寸
+    orientation = img.getexif().get(EXIF_ORIENTATION_TAG, 1)
+    transposed = orientation in EXIF_TRANSPOSED_ORIENTATIONS
+    img_width, img_height = img.size
+    if transposed:
+        img_width, img_height = img_height, img_width
+
+    scale = min(target_width / img_width, target_height / img_height)
+    new_width = max(1, int(img_width * scale))
+    new_height = max(1, int(img_height * scale))
+
+    # draft 请求的是原始（未旋转）方向的尺寸
+    draft_size = (new_height, new_width) if transposed else (new_width, new_height)
+    img.draft("RGB", draft_size)
+
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    if img.size != (new_width, new_height):
+        img = img.resize((new_width, new_height), Image.LANCZOS)
+    return img
+
+
+class AlphaTileIndex:
+    """
+    叠加层透明度分块索引
+
+    模板边框大部分区域完全透明，只有边缘一圈不透明。按分块记录每块的透明度类别，
+    叠加时跳过透明分块，只在不透明和半透明分块上绘制。
+    """
+
+    TRANSPARENT = 0
+    OPAQUE = 1
+    PARTIAL = 2
+
+    def __init__(self, rgba_image, tile_size=BORDER_TILE_SIZE):
+        self.width, self.height = rgba_image.size
+        self.tile_size = tile_size
+        self.cols = -(-self.width // tile_size)
+        self.rows = -(-self.height // tile_size)
+
+        # 透明度通道补齐到整块（补齐部分视为透明，不影响块的最大值；最小值只统计有效像素）
+        alpha = np.asarray(rgba_image.getchannel("A"), dtype=np.uint8)
+        padded_max = np.zeros((self.rows * tile_size, self.cols * tile_size), np.uint8)
+        padded_min = np.full_like(padded_max, 255)
+        padded_max[: self.height, : self.width] = alpha
+        padded_min[: self.height, : self.width] = alpha
+        shape = (self.rows, tile_size, self.cols, tile_size)
+        tile_max = padded_max.reshape(shape).max(axis=(1, 3))
+        tile_min = padded_min.reshape(shape).min(axis=(1, 3))
+
+        self.kinds = np.full((self.rows, self.cols), self.PARTIAL, np.uint8)
+        self.kinds[tile_max == 0] = self.TRANSPARENT
+        self.kinds[tile_min == 255] = self.OPAQUE
+
+    def coverage(self) -> dict:
+        """各类分块占比"""
+        total = self.kinds.size
+        return {
+            "transparent": round(float(np.mean(self.kinds == self.TRANSPARENT)), 4),
+            "opaque": round(float(np.mean(self.kinds == self.OPAQUE)), 4),
+            "partial": round(float(np.mean(self.kinds == self.PARTIAL)), 4),
+            "tiles": total,
+        }
+
+    def rects(self, kinds=(OPAQUE, PARTIAL)) -> list:
+        """
+        指定类别分块合并后的矩形列表 [(x0, y0, x1, y1), ...]（像素坐标，行从上到下）
+
+        每行相邻分块合并为一段，上下相邻且范围相同的段再合并，
+        常见的框形边框合并后只有上下两条和左右两列。
+        """
+        mask = np.isin(self.kinds, kinds)
+        merged = []
+        open_runs = {}  # (起始列, 结束列) -> 起始行
+        for row in range(self.rows + 1):
+            runs = set()
+            if row < self.rows:
+                col = 0
+                while col < self.cols:
+                    if mask[row, col]:
+                        start = col
+                        while col < self.cols and mask[row, col]:
+                            col += 1
+                        runs.add((start, col))
+                    else:
+                        col += 1
+            for run in list(open_runs):
+                if run not in runs:
+                    merged.append((run, open_runs.pop(run), row))
+            for run in runs:
+                open_runs.setdefault(run, row)
+
+        size = self.tile_size
+        return [
+            (
+                c0 * size,
+                r0 * size,
+                min(c1 * size, self.width),
+                min(r1 * size, self.height),
+            )
+            for (c0, c1), r0, r1 in sorted(merged, key=lambda m: (m[1], m[0]))
+        ]
 
 
 class BorderRenderer:
     """边框渲染器，加载 PNG 边框图片"""
 
+    # 复合后的图片帧缓存（进程内共享），键为 (照片哈希, 边框快照, 位置)
+    COMPOSITE_CACHE_SIZE = 8
+    _composite_cache = OrderedDict()
+    _cache_lock = threading.Lock()
+
     def __init__(self, border_path, width, height):
         self.width = width
         self.height = height
@@ -31,12 +174,36 @@ class BorderRenderer:
 
         self.border_image = img
         self.texture_data = img.tobytes("raw", "RGBA")
-        print(f"   ✓ 边框加载: {border_path}")
+        # 模板快照：边框内容 + 尺寸，用于复合帧缓存键
+        self.snapshot = hashlib.sha1(self.texture_data).hexdigest()
+        self.tiles = AlphaTileIndex(img)
+        coverage = self.tiles.coverage()
+        print(
+            f"   ✓ 边框加载: {border_path} (透明分块 {coverage['transparent']:.0%}，"
+            f"不透明 {coverage['opaque']:.0%}，半透明 {coverage['partial']:.0%})"
+        )
+
+    def overlay_rects(self):
+        """需要绘制的区域（不透明和半透明分块合并后的矩形）"""
+        return self.tiles.rects()
 
     def get_texture_data(self):
         """获取边框纹理数据"""
         return self.texture_data
 
+    def composite_key(self, image_path, position_config):
+        """复合结果的内容键：照片哈希、边框快照和目标区域"""
+        return (
+            hash_file(image_path),
+            self.snapshot,
+            (
+                position_config.get("x", 0),
+                position_config.get("y", 0),
+                position_config.get("width", self.width),
+                position_config.get("height", self.height),
+            ),
+        )
+
     def composite_image_on_border(self, image_path, position_config):
         """
         将图片按比例缩放后贴到边框的指定位置上
@@ -48,27 +215,22 @@ class BorderRenderer:
         Returns:
             合成后的RGB图像数据（用于视频编码）
         """
-        # 加载用户图片
-        user_img = Image.open(image_path).convert("RGB")
-
         # 提取目标区域参数
         target_x = position_config.get("x", 0)
         target_y = position_config.get("y", 0)
         target_width = position_config.get("width", self.width)
         target_height = position_config.get("height", self.height)
 
-        # 计算缩放比例（保持宽高比）
-        img_width, img_height = user_img.size
-        scale_w = target_width / img_width
-        scale_h = target_height / img_height
-        scale = min(scale_w, scale_h)  # 使用较小的比例以确保完全适配
+        cache_key = self.composite_key(image_path, position_config)
+        with self._cache_lock:
+            if cache_key in self._composite_cache:
+                self._composite_cache.move_to_end(cache_key)
+                print("   ✓ 复合图片命中缓存")
+                return self._composite_cache[cache_key]
 
-        # 计算缩放后的尺寸
-        new_width = int(img_width * scale)
-        new_height = int(img_height * scale)
-
-        # 缩放图片
-        resized_img = user_img.resize((new_width, new_height), Image.LANCZOS)
+        # 加载用户图片（降采样解码 + EXIF 方向 + 高质量缩放）
+        resized_img = load_photo(image_path, target_width, target_height)
+        new_width, new_height = resized_img.size
 
         # 计算居中位置（在目标区域内居中）
         offset_x = target_x + (target_width - new_width) // 2
@@ -82,15 +244,22 @@ class BorderRenderer:
 
         # 转换为RGB并返回字节数据
         result_rgb = result.convert("RGB")
-        return result_rgb.tobytes("raw", "RGB")
+        data = result_rgb.tobytes("raw", "RGB")
+
+        with self._cache_lock:
+            self._composite_cache[cache_key] = data
+            while len(self._composite_cache) > self.COMPOSITE_CACHE_SIZE:
+                self._composite_cache.popitem(last=False)
+        return data
 
 
 class SubtitleRenderer:
     """字幕渲染器，生成透明背景文字纹理"""
 
-    def __init__(self, font_path, font_size, width, height):
+    def __init__(self, font_path, font_size, width, height, bottom_margin=100):
         self.width = width
         self.height = height
+        self.bottom_margin = bottom_margin
         self.font = ImageFont.truetype(font_path, font_size)
         self.current_text = None
         self.texture_data = None
@@ -115,7 +284,7 @@ class SubtitleRenderer:
         text_width = bbox[2] - bbox[0]
         text_height = bbox[3] - bbox[1]
         x = (self.width - text_width) // 2
-        y = self.height - text_height - 100
+        y = self.height - text_height - self.bottom_margin
 
         # 绘制描边
         if outline_width > 0:
@@ -0,0 +1,287 @@
+"""
+片段级渲染缓存 - 复用已编码的图片开场、转场和片段主体
+
+场馆中大多数游客拿到相同的几段体验视频，只有照片和第一个转场不同。
+执行计划按区间划分为分块，每个分块由独立的编码器编码（以 IDR 帧开始，不引用其它分块），
+以内容哈希和模板快照为键缓存：
+- image: 图片开场（照片复合结果、边框、字幕）
+- transition: 转场（from 侧内容 + to 片段 + 转场着色器）
+- clip: 片段主体（片段内容 + 起始帧 + 视频边框）
+渲染时只渲染未命中的分块，所有分块的 H.264 码流直接拼接（无重编码）。
+
+- AUTOVLOG_SEGMENT_CACHE_DIR: 缓存目录（默认 /tmp/autovlog_segment_cache）
+- AUTOVLOG_SEGMENT_CACHE_MB: 缓存容量（按最久未使用淘汰；默认 0 关闭缓存，如设为 4096 启用）
+
+分块边界强制 IDR 并重置码率控制，输出与整段编码不同，因此默认关闭，只在大量任务共用片段的场景中启用。
+"""
+
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional
+
+from src.renderers import hash_file
+
+
+SEGMENT_CACHE_DIR = Path(
+    os.getenv("AUTOVLOG_SEGMENT_CACHE_DIR", "/tmp/autovlog_segment_cache")
+)
+SEGMENT_CACHE_MB = float(os.getenv("AUTOVLOG_SEGMENT_CACHE_MB", "0"))
+
+# 缓存格式版本（分块内容或编码方式变化时递增，使旧缓存失效）
+CACHE_VERSION = 1
+
+# 分块目录中的文件
+VIDEO_FILE = "video.h264"
+LAST_FRAME_FILE = "last.rgb"
+PREVIEW_FILE = "preview.npz"  # 预览采样（可选，src.preview）
+
+
+_hash_lock = threading.Lock()
+_content_hashes = {}  # (路径, 大小, 修改时间) -> 内容哈希
+
+
+def content_hash(path: str) -> Optional[str]:
+    """文件内容哈希（按路径、大小和修改时间缓存），文件不存在时返回 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    with _hash_lock:
+        if key in _content_hashes:
+            return _content_hashes[key]
+    digest = hash_file(path)
+    with _hash_lock:
+        _content_hashes[key] = digest
+    return digest
+
+
+def cache_key(*parts) -> str:
+    """由任意可 JSON 序列化的部分生成缓存键"""
+    payload = json.dumps([CACHE_VERSION, *parts], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def video_files(directory: Path, renditions=()) -> List[Path]:
+    """分块目录中的码流文件（主输出 + 各规格）"""
+    return [directory / VIDEO_FILE] + [
+        directory / f"video.{rendition.name}.h264" for rendition in renditions
+    ]
+
+
+@dataclass
+class Piece:
+    """执行计划中独立编码的一个分块"""
+
+    kind: str  # 'image', 'transition', 'clip'
+    spans: list
+    key: Optional[str]  # None 表示不可缓存（如素材仍在上传）
+    directory: Path  # 本任务中分块码流所在目录
+    cached: bool = False
+
+    @property
+    def frames(self) -> int:
+        return sum(span.frames for span in self.spans)
+
+    def last_frame(self) -> bytes:
+        return (self.directory / LAST_FRAME_FILE).read_bytes()
+
+
+@dataclass
+class PieceStats:
+    """本任务的分块缓存统计"""
+
+    pieces: int = 0
+    hits: int = 0
+    frames_reused: int = 0
+    frames_rendered: int = 0
+    kinds: dict = field(default_factory=dict)  # 分块类型 -> [命中数, 总数]
+
+    def add(self, piece: Piece):
+        self.pieces += 1
+        counts = self.kinds.setdefault(piece.kind, [0, 0])
+        counts[1] += 1
+        if piece.cached:
+            self.hits += 1
+            counts[0] += 1
+            self.frames_reused += piece.frames
+        else:
+            self.frames_rendered += piece.frames
+
+    def merge(self, other: "PieceStats"):
+        """累加另一次渲染的统计（增量渲染的多个段落）"""
+        self.pieces += other.pieces
+        self.hits += other.hits
+        self.frames_reused += other.frames_reused
+        self.frames_rendered += other.frames_rendered
+        for kind, (hits, total) in other.kinds.items():
+            counts = self.kinds.setdefault(kind, [0, 0])
+            counts[0] += hits
+            counts[1] += total
+
+    def to_dict(self) -> dict:
+        return {
+            "pieces": self.pieces,
+            "hits": self.hits,
+            "frames_reused": self.frames_reused,
+            "frames_rendered": self.frames_rendered,
+            "kinds": dict(self.kinds),
+        }
+
+
+class SegmentCache:
+    """已编码分块的磁盘缓存（多进程共享，条目通过重命名原子提交）"""
+
+    _lock = threading.Lock()
+
+    @staticmethod
+    def enabled() -> bool:
+        return SEGMENT_CACHE_MB > 0
+
+    @staticmethod
+    def _entries() -> Path:
+        path = SEGMENT_CACHE_DIR / "entries"
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    @staticmethod
+    def workdir() -> Path:
+        """本任务的分块目录（与缓存同一文件系统，命中时以硬链接取出）"""
+        root = SEGMENT_CACHE_DIR / "jobs"
+        root.mkdir(parents=True, exist_ok=True)
+        return Path(tempfile.mkdtemp(dir=root))
+
+    @staticmethod
+    def fetch(key: Optional[str], directory: Path, renditions=()) -> bool:
+        """
+        命中时将缓存条目链接到 directory（硬链接，条目随后被淘汰也不影响本任务）
+
+        Returns:
+            是否命中
+        """
+        if key is None:
+            return False
+        entry = SegmentCache._entries() / key
+        names = [path.name for path in video_files(entry, renditions)] + [LAST_FRAME_FILE]
+        directory.mkdir(parents=True, exist_ok=True)
+        try:
+            for name in names:
+                os.link(entry / name, directory / name)
+            os.utime(entry)  # 最近使用时间
+        except OSError:
+            # 条目不存在、不完整或刚被淘汰
+            for name in names:
+                (directory / name).unlink(missing_ok=True)
+            return False
+        try:
+            os.link(entry / PREVIEW_FILE, directory / PREVIEW_FILE)
+        except OSError:
+            pass  # 没有预览采样时从码流中解码
+        return True
+
+    @staticmethod
+    def contains(key: Optional[str], renditions=()) -> bool:
+        """是否命中（只查询，不取出条目）"""
+        if key is None:
+            return False
+        entry = SegmentCache._entries() / key
+        names = [path.name for path in video_files(entry, renditions)] + [LAST_FRAME_FILE]
+        return all((entry / name).exists() for name in names)
+
+    @staticmethod
+    def store(key: Optional[str], directory: Path):
+        """将渲染完成的分块提交到缓存（同一条目已存在时保留已有条目）"""
+        if key is None:
+            return
+        entries = SegmentCache._entries()
+        staging = entries / f".{uuid.uuid4().hex}"
+        staging.mkdir()
+        try:
+            for path in directory.iterdir():
+                os.link(path, staging / path.name)
+            os.rename(staging, entries / key)
+        except OSError:
+            # 其它任务已提交同一条目
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        SegmentCache.evict()
+
+    @staticmethod
+    def evict():
+        """按最久未使用淘汰，直到总大小不超过容量"""
+        with SegmentCache._lock:
+            entries = []
+            total = 0
+            for entry in SegmentCache._entries().iterdir():
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    size = sum(path.stat().st_size for path in entry.iterdir())
+                    entries.append((entry.stat().st_mtime, size, entry))
+                except OSError:
+                    continue
+                total += size
+            limit = SEGMENT_CACHE_MB * 1024 * 1024
+            for _, size, entry in sorted(entries, key=lambda item: item[0]):
+                if total <= limit:
+                    break
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+
+    @staticmethod
+    def stats() -> dict:
+        entries = [
+            entry
+            for entry in SegmentCache._entries().iterdir()
+            if not entry.name.startswith(".")
+        ]
+        size = sum(
+            path.stat().st_size for entry in entries for path in entry.iterdir()
+        )
+        return {
+            "entries": len(entries),
+            "size_mb": round(size / 1024 / 1024, 1),
+            "capacity_mb": SEGMENT_CACHE_MB,
+        }
+
+
+def assemble_pieces(pieces: List[Piece], output_path, fps: float, rendition=None):
+    """
+    按顺序拼接分块码流（流复制，无重编码）
+
+    每个分块以 IDR 帧开始并携带参数集，H.264 Annex B 码流可以直接首尾相接：
+    .h264 输出（增量渲染的段落文件）直接拼接字节，其它格式用 ffmpeg 封装，
+    裸码流没有时间戳，按 fps 重新生成。
+
+    Args:
+        rendition: 附加输出规格（None 表示主输出）
+    """
+    renditions = [rendition] if rendition else []
+    files = [video_files(piece.directory, renditions)[-1] for piece in pieces]
+    if str(output_path).endswith(".h264"):
+        with open(output_path, "wb") as out:
+            for path in files:
+                with open(path, "rb") as f:
+                    shutil.copyfileobj(f, out, 1 << 20)
+        return
+
+    subprocess.run(
+        [
+            "ffmpeg", "-y",
+            "-f", "h264",
+            "-framerate", str(fps),
+            "-i", "concat:" + "|".join(str(path) for path in files),
+            "-c:v", "copy",
+            str(output_path),
+        ],
+        check=True,
+        capture_output=True,
+    )
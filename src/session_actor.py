@@ -0,0 +1,242 @@
+"""
+常驻会话 Actor - 在多次 append 之间保持 GPU 状态
+
+每个活跃的增量渲染会话绑定到一个专属工作线程（OpenGL 上下文只能在创建它的线程中使用），
+线程中常驻一个 IncrementalRenderer：
+- EGL 上下文、已编译的转场程序、边框纹理在会话期间只创建一次
+- 最后一帧保留在内存中，不再每次 append 都编码/解码 PNG
+- 空闲超时、常驻数量超限或内存不足时驱逐：最后一帧落盘，释放 GPU 资源，
+  之后的请求会从会话存储重新恢复
+- 会话存储为多节点共享时（src.session_store），每次调用期间持有会话租约，
+  调用结束后最后一帧即落盘，任何节点都可以继续该会话
+
+这样 append 的耗时主要取决于新片段的解码和编码，而不是初始化开销。
+使用共享渲染引擎（src.gl_engine）时，会话线程不持有上下文，GL 工作提交到引擎线程执行。
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from src.config import TemplateConfig
+from src.incremental_renderer import IncrementalRenderer
+from src.memory_budget import estimate_job_mb
+from src.session_manager import SessionManager
+
+
+# 常驻会话数量上限
+MAX_RESIDENT_SESSIONS = int(os.getenv("AUTOVLOG_MAX_RESIDENT_SESSIONS", "4"))
+# 空闲超时（秒）
+SESSION_IDLE_TIMEOUT = float(os.getenv("AUTOVLOG_SESSION_IDLE_TIMEOUT", "300"))
+# 系统可用内存低于该值（MB）时驱逐最久未使用的会话
+MIN_AVAILABLE_MEMORY_MB = int(os.getenv("AUTOVLOG_MIN_AVAILABLE_MB", "1024"))
+# 后台巡检间隔（秒）
+REAPER_INTERVAL = 30
+
+
+def available_memory_mb() -> Optional[float]:
+    """读取系统可用内存（Linux /proc/meminfo），无法读取时返回 None"""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class SessionActor:
+    """绑定单个会话的常驻渲染线程"""
+
+    def __init__(
+        self,
+        session_id: str,
+        template_name: str,
+        profile: Optional[str] = None,
+        renditions: Optional[list] = None,
+    ):
+        self.session_id = session_id
+        self.template_name = template_name
+        self.profile = profile
+        self.renditions = renditions
+        self.renderer: Optional[IncrementalRenderer] = None
+        self.last_used = time.time()
+        self.pending = 0  # 已获取但尚未完成的调用数，大于 0 时不会被驱逐
+        self.closed = False  # 已移出池但仍有调用进行中，由最后一个结束的调用驱逐
+        self.close_persist = True
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f"session-{session_id[:8]}"
+        )
+
+    def call(self, method: str, *args, **kwargs):
+        """在会话线程中调用渲染器方法并等待结果（同一会话的请求按顺序执行）
+
+        必须先通过 SessionActorPool.get 获取 Actor，每次 get 对应一次 call。
+        """
+        try:
+            return self._executor.submit(self._run, method, *args, **kwargs).result()
+        finally:
+            # 与 get() 和驱逐时的检查使用同一把锁
+            with SessionActorPool._lock:
+                self.pending -= 1
+                self.last_used = time.time()
+                teardown = self.closed and self.pending == 0
+            if teardown:
+                try:
+                    SessionActorPool._teardown(self, self.close_persist)
+                except Exception as e:
+                    print(f"⚠️  会话驱逐失败: {e}")
+
+    def _run(self, method: str, *args, **kwargs):
+        # 持有会话租约期间渲染（会话存储为多节点共享时，同一会话同一时间只由一个节点渲染）
+        # 租约续期失败时取消本次调用（渲染器在提交段落前检查）
+        with SessionManager.lease(self.session_id, kwargs.get("cancel_token")):
+            if self.renderer is None:
+                self.renderer = IncrementalRenderer(
+                    self.session_id, self.template_name, self.profile, self.renditions
+                )
+                # 最后一帧只在驱逐时落盘；共享会话存储时每次调用后都要落盘，其它节点才能继续
+                self.renderer.persist_last_frame = SessionManager.store().shared
+            return getattr(self.renderer, method)(*args, **kwargs)
+
+    def estimate_memory_mb(self) -> float:
+        """估算单次渲染的内存（MB），渲染器尚未创建（首次调用、驱逐后）时按模板配置估算"""
+        renderer = self.renderer
+        if renderer is not None:
+            return renderer.estimate_memory_mb()
+        config = TemplateConfig(self.template_name, self.profile)
+        return estimate_job_mb(
+            config.global_config["width"],
+            config.global_config["height"],
+            len(config.get_renditions(self.renditions)),
+        )
+
+    def evict(self, persist: bool = True):
+        """驱逐：最后一帧落盘并释放 GPU 资源"""
+
+        def _teardown():
+            if self.renderer is None:
+                return
+            # 已在每次调用后落盘时不再写入（会话可能已由其它节点继续）
+            if persist and not self.renderer.persist_last_frame:
+                self.renderer.save_last_frame()
+            self.renderer.cleanup()
+            self.renderer = None
+
+        try:
+            self._executor.submit(_teardown).result()
+        finally:
+            self._executor.shutdown(wait=False)
+
+
+class SessionActorPool:
+    """常驻会话池"""
+
+    _actors: Dict[str, SessionActor] = {}
+    _lock = threading.Lock()
+    _reaper: Optional[threading.Thread] = None
+
+    @staticmethod
+    def get(
+        session_id: str,
+        template_name: str,
+        profile: Optional[str] = None,
+        renditions: Optional[list] = None,
+    ) -> SessionActor:
+        """获取会话 Actor，不存在时创建（被驱逐的会话从会话目录恢复）"""
+        SessionActorPool._ensure_reaper()
+        with SessionActorPool._lock:
+            actor = SessionActorPool._actors.get(session_id)
+            if actor is None:
+                actor = SessionActor(session_id, template_name, profile, renditions)
+                SessionActorPool._actors[session_id] = actor
+                print(f"🧵 会话常驻: {session_id} (常驻数: {len(SessionActorPool._actors)})")
+            actor.pending += 1
+            actor.last_used = time.time()
+
+        SessionActorPool._enforce_limits(keep=session_id)
+        return actor
+
+    @staticmethod
+    def evict(session_id: str, persist: bool = True):
+        """驱逐指定会话（仍有调用进行中时，由最后一个结束的调用驱逐）"""
+        with SessionActorPool._lock:
+            actor = SessionActorPool._actors.pop(session_id, None)
+            if actor is None:
+                return
+            if actor.pending > 0:
+                actor.closed = True
+                actor.close_persist = persist
+                return
+        SessionActorPool._teardown(actor, persist)
+
+    @staticmethod
+    def _teardown(actor: SessionActor, persist: bool = True):
+        """释放已从池中移除的 Actor"""
+        actor.evict(persist)
+        print(f"💤 会话驱逐: {actor.session_id}")
+
+    @staticmethod
+    def evict_idle():
+        """驱逐空闲超时的会话"""
+        now = time.time()
+        # 空闲判断和移出在同一临界区内完成，避免 get() 在两者之间取走同一 Actor
+        with SessionActorPool._lock:
+            idle = [
+                actor
+                for actor in SessionActorPool._actors.values()
+                if actor.pending == 0 and now - actor.last_used > SESSION_IDLE_TIMEOUT
+            ]
+            for actor in idle:
+                del SessionActorPool._actors[actor.session_id]
+        for actor in idle:
+            SessionActorPool._teardown(actor)
+
+    @staticmethod
+    def _enforce_limits(keep: Optional[str] = None):
+        """常驻数量超限或内存不足时，按最久未使用顺序驱逐空闲会话"""
+        while True:
+            memory = available_memory_mb()
+            low_memory = memory is not None and memory < MIN_AVAILABLE_MEMORY_MB
+            with SessionActorPool._lock:
+                over_limit = len(SessionActorPool._actors) > MAX_RESIDENT_SESSIONS
+                candidates = [
+                    actor
+                    for sid, actor in SessionActorPool._actors.items()
+                    if sid != keep and actor.pending == 0
+                ]
+                if not candidates or not (over_limit or low_memory):
+                    return
+                actor = min(candidates, key=lambda actor: actor.last_used)
+                del SessionActorPool._actors[actor.session_id]
+            SessionActorPool._teardown(actor)
+
+    @staticmethod
+    def _ensure_reaper():
+        """启动后台巡检线程"""
+        with SessionActorPool._lock:
+            if SessionActorPool._reaper is not None:
+                return
+
+            def _loop():
+                while True:
+                    time.sleep(REAPER_INTERVAL)
+                    try:
+                        SessionActorPool.evict_idle()
+                        SessionActorPool._enforce_limits()
+                    except Exception as e:
+                        print(f"⚠️  会话巡检失败: {e}")
+
+            SessionActorPool._reaper = threading.Thread(
+                target=_loop, name="session-reaper", daemon=True
+            )
+            SessionActorPool._reaper.start()
+
+    @staticmethod
+    def shutdown():
+        """服务关闭时驱逐所有会话"""
+        for sid in list(SessionActorPool._actors):
+            SessionActorPool.evict(sid)
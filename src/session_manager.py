@@ -1,23 +1,33 @@
 """
-会话管理器 - 基于文件系统的轻量级会话存储
+会话管理器 - 增量渲染会话的生命周期
 
 负责管理增量渲染会话的生命周期：
 - 创建会话目录和元数据
 - 读写会话状态
 - 保存/加载最后一帧缓存
 - 管理段落文件
+- 会话租约、导出和导入
+
+会话状态保存在会话存储（src.session_store）中，SESSION_DIR 是本节点的工作目录：
+段落在工作目录中渲染后发布到会话存储，合成时从会话存储取回本节点缺少的段落。
 """
 
 import json
 import time
 import uuid
 import shutil
-from pathlib import Path
+import tarfile
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path, PurePosixPath
 from typing import Optional, Dict, List
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
+
+from src.session_store import LEASE_FILE, LEASE_TTL, SessionStore, get_session_store
 
 
-# 会话根目录
+# 会话根目录（本节点工作目录）
 SESSION_DIR = Path("/tmp/autovlog_sessions")
 SESSION_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -30,6 +40,9 @@ class SegmentInfo:
     type: str  # 'image', 'video', 'transition'
     source_path: Optional[str] = None
     transition_shader: Optional[str] = None
+    degradation: Optional[dict] = None  # 负载降级决策（未降级时为空）
+    memory: Optional[dict] = None  # 内存高水位（MB）
+    cache: Optional[dict] = None  # 分块缓存命中情况
 
 
 @dataclass
@@ -42,6 +55,8 @@ class SessionMetadata:
     segments: List[Dict]
     status: str  # 'initialized', 'rendering', 'completed', 'error'
     current_transition_index: int = 0  # 当前使用的转场索引
+    profile: Optional[str] = None  # 渲染档位（None 表示全质量）
+    renditions: List[str] = field(default_factory=list)  # 附加输出规格
     
     def to_dict(self):
         return asdict(self)
@@ -53,15 +68,22 @@ class SessionMetadata:
 
 
 class SessionManager:
-    """文件系统会话管理器"""
+    """会话管理器"""
+    
+    @staticmethod
+    def store() -> SessionStore:
+        """会话存储"""
+        return get_session_store(SESSION_DIR)
     
     @staticmethod
-    def create_session(template_name: str) -> str:
+    def create_session(
+        template_name: str,
+        profile: Optional[str] = None,
+        renditions: Optional[List[str]] = None
+    ) -> str:
         """创建新会话"""
         session_id = str(uuid.uuid4())
-        session_path = SESSION_DIR / session_id
-        session_path.mkdir(parents=True, exist_ok=True)
-        (session_path / "segments").mkdir(exist_ok=True)
+        SessionManager.get_session_path(session_id)
         
         # 初始化元数据
         metadata = SessionMetadata(
@@ -71,7 +93,9 @@ class SessionManager:
             total_frames=0,
             segments=[],
             status="initialized",
-            current_transition_index=0
+            current_transition_index=0,
+            profile=profile,
+            renditions=list(renditions or [])
         )
         
         SessionManager._save_metadata(session_id, metadata)
@@ -80,18 +104,19 @@ class SessionManager:
     
     @staticmethod
     def get_session_path(session_id: str) -> Path:
-        """获取会话目录路径"""
-        return SESSION_DIR / session_id
+        """获取会话工作目录路径（不存在时创建，会话可能由其它节点创建）"""
+        session_path = SESSION_DIR / session_id
+        (session_path / "segments").mkdir(parents=True, exist_ok=True)
+        return session_path
     
     @staticmethod
     def get_metadata(session_id: str) -> SessionMetadata:
         """读取会话元数据"""
-        path = SESSION_DIR / session_id / "metadata.json"
-        if not path.exists():
+        data = SessionManager.store().read(f"{session_id}/metadata.json")
+        if data is None:
             raise FileNotFoundError(f"会话不存在: {session_id}")
         
-        data = json.loads(path.read_text())
-        return SessionMetadata.from_dict(data)
+        return SessionMetadata.from_dict(json.loads(data))
     
     @staticmethod
     def update_metadata(session_id: str, updates: Dict):
@@ -107,17 +132,27 @@ class SessionManager:
     
     @staticmethod
     def _save_metadata(session_id: str, metadata: SessionMetadata):
-        """保存元数据到文件"""
-        path = SESSION_DIR / session_id / "metadata.json"
-        path.write_text(json.dumps(metadata.to_dict(), indent=2, ensure_ascii=False))
+        """保存元数据到会话存储"""
+        SessionManager.store().write(
+            f"{session_id}/metadata.json",
+            json.dumps(metadata.to_dict(), indent=2, ensure_ascii=False).encode(),
+        )
     
     @staticmethod
-    def add_segment(session_id: str, segment: SegmentInfo) -> int:
-        """添加新段落信息"""
+    def add_segment(
+        session_id: str, segment: SegmentInfo, transition_index: Optional[int] = None
+    ) -> int:
+        """添加新段落信息
+        
+        Args:
+            transition_index: 段落使用的转场索引（可选），与段落一起提交，下一段落使用下一个转场
+        """
         metadata = SessionManager.get_metadata(session_id)
         segment_dict = asdict(segment)
         metadata.segments.append(segment_dict)
         metadata.total_frames += segment.frames
+        if transition_index is not None:
+            metadata.current_transition_index = transition_index + 1
         
         SessionManager._save_metadata(session_id, metadata)
         return len(metadata.segments) - 1
@@ -125,60 +160,200 @@ class SessionManager:
     @staticmethod
     def save_last_frame(session_id: str, frame_data: bytes):
         """保存最后一帧（PNG格式）"""
-        path = SESSION_DIR / session_id / "last_frame.png"
-        path.write_bytes(frame_data)
+        SessionManager.store().write(f"{session_id}/last_frame.png", frame_data)
     
     @staticmethod
     def load_last_frame(session_id: str) -> Optional[bytes]:
         """加载最后一帧"""
-        path = SESSION_DIR / session_id / "last_frame.png"
-        if not path.exists():
-            return None
-        return path.read_bytes()
+        return SessionManager.store().read(f"{session_id}/last_frame.png")
     
     @staticmethod
-    def get_segment_path(session_id: str, segment_index: int) -> Path:
-        """获取段落文件路径"""
-        return SESSION_DIR / session_id / "segments" / f"segment_{segment_index}.h264"
+    def save_preview(session_id: str, segment_index: int, data: bytes):
+        """保存段落的预览采样（src.preview）"""
+        SessionManager.store().write(f"{session_id}/preview/segment_{segment_index}.npz", data)
     
     @staticmethod
-    def list_segment_files(session_id: str) -> List[Path]:
-        """列出所有段落文件（按顺序）"""
-        segments_dir = SESSION_DIR / session_id / "segments"
-        return sorted(segments_dir.glob("segment_*.h264"))
+    def load_preview(session_id: str, segment_index: int) -> Optional[bytes]:
+        """加载段落的预览采样"""
+        return SessionManager.store().read(f"{session_id}/preview/segment_{segment_index}.npz")
     
     @staticmethod
-    def get_next_transition_index(session_id: str, total_transitions: int) -> int:
-        """获取下一个转场索引（循环使用）"""
-        metadata = SessionManager.get_metadata(session_id)
-        current_index = metadata.current_transition_index
+    def get_segment_path(
+        session_id: str, segment_index: int, rendition: Optional[str] = None
+    ) -> Path:
+        """获取段落文件的工作路径（rendition 为附加输出规格名）"""
+        suffix = f".{rendition}" if rendition else ""
+        return (
+            SessionManager.get_session_path(session_id) / "segments"
+            / f"segment_{segment_index}{suffix}.h264"
+        )
+    
+    @staticmethod
+    def publish_segment(session_id: str, paths: List[Path]):
+        """将渲染完成的段落文件发布到会话存储（在记录段落信息之前调用）"""
+        store = SessionManager.store()
+        for path in paths:
+            store.upload(f"{session_id}/segments/{Path(path).name}", path)
+    
+    @staticmethod
+    def list_segment_files(session_id: str, rendition: Optional[str] = None) -> List[Path]:
+        """列出所有段落文件（按段落序号排序），本节点缺少的段落从会话存储取回"""
+        store = SessionManager.store()
+        segments_dir = SessionManager.get_session_path(session_id) / "segments"
+        files = []
+        for key in store.keys(f"{session_id}/segments"):
+            name = PurePosixPath(key).name
+            if not (name.startswith("segment_") and name.endswith(".h264")):
+                continue
+            index, _, suffix = name[len("segment_"):-len(".h264")].partition(".")
+            if suffix == (rendition or ""):
+                files.append((int(index), segments_dir / name, key))
+        
+        paths = []
+        for _, path, key in sorted(files):
+            if not path.exists() and not store.download(key, path):
+                raise FileNotFoundError(f"段落文件不存在: {key}")
+            paths.append(path)
+        return paths
+    
+    @staticmethod
+    def valid_session_id(session_id) -> bool:
+        """是否为规范格式的 UUID（create_session 生成的会话ID）"""
+        try:
+            return str(uuid.UUID(session_id)) == session_id
+        except (TypeError, ValueError, AttributeError):
+            return False
+
+    @staticmethod
+    @contextmanager
+    def lease(session_id: str, cancel_token=None):
+        """
+        持有会话租约（期间后台续期），其它节点持有有效租约时抛出 SessionLeased
+
+        仅本节点可见的会话存储不需要租约（同一会话的调用已由会话线程串行执行）。
+        续期失败时取消 cancel_token（可选），渲染在提交段落前中止，不再写入会话。
+        """
+        store = SessionManager.store()
+        if not store.shared:
+            yield
+            return
+        store.acquire_lease(session_id)
+        stop = threading.Event()
+
+        def _renew():
+            while not stop.wait(LEASE_TTL / 3):
+                try:
+                    store.acquire_lease(session_id)
+                except Exception as e:
+                    print(f"⚠️  会话租约续期失败 {session_id}: {e}")
+                    if cancel_token is not None:
+                        cancel_token.cancel("会话租约续期失败")
+                    return
+
+        renewer = threading.Thread(
+            target=_renew, name=f"lease-{session_id[:8]}", daemon=True
+        )
+        renewer.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            renewer.join()
+            store.release_lease(session_id)
+    
+    @staticmethod
+    def export_session(session_id: str, archive_path) -> int:
+        """
+        将会话导出为 tar 包（元数据、最后一帧、段落文件），持有租约期间导出保证状态一致
         
-        # 更新到下一个（循环）
-        next_index = (current_index + 1) % total_transitions
-        SessionManager.update_metadata(session_id, {
-            'current_transition_index': next_index
-        })
+        常驻会话需先驱逐（最后一帧落盘）再导出。
         
-        return current_index
+        Returns:
+            导出的文件数
+        """
+        if not SessionManager.session_exists(session_id):
+            raise FileNotFoundError(f"会话不存在: {session_id}")
+        store = SessionManager.store()
+        with SessionManager.lease(session_id), tempfile.TemporaryDirectory() as tmp:
+            keys = [
+                key for key in store.keys(session_id)
+                if PurePosixPath(key).name != LEASE_FILE
+            ]
+            with tarfile.open(archive_path, "w") as tar:
+                for i, key in enumerate(keys):
+                    local = Path(tmp) / str(i)
+                    if store.download(key, local):
+                        tar.add(local, arcname=key[len(session_id) + 1:])
+                        local.unlink()
+        print(f"📦 会话导出: {session_id} ({len(keys)} 个文件)")
+        return len(keys)
+    
+    @staticmethod
+    def import_session(archive_path) -> str:
+        """
+        从 export_session 生成的 tar 包导入会话，元数据最后写入（导入完成前会话不可见）
+        
+        Returns:
+            会话ID
+        
+        Raises:
+            ValueError: 不是有效的会话包
+            FileExistsError: 会话已存在
+        """
+        store = SessionManager.store()
+        with tarfile.open(archive_path, "r") as tar:
+            members = {}
+            for member in tar.getmembers():
+                name = PurePosixPath(member.name)
+                if not member.isfile():
+                    continue
+                if name.is_absolute() or ".." in name.parts or name.name == LEASE_FILE:
+                    raise ValueError(f"会话包中的路径无效: {member.name}")
+                members[str(name)] = member
+            if "metadata.json" not in members:
+                raise ValueError("会话包中没有 metadata.json")
+            metadata_bytes = tar.extractfile(members.pop("metadata.json")).read()
+            try:
+                metadata = SessionMetadata.from_dict(json.loads(metadata_bytes))
+            except (ValueError, TypeError) as e:
+                raise ValueError(f"会话元数据无效: {e}")
+            session_id = metadata.session_id
+            # 会话ID用作存储键的目录名，只接受 create_session 生成的规范 UUID（防止路径穿越）
+            if not SessionManager.valid_session_id(session_id):
+                raise ValueError(f"会话ID无效: {session_id!r}")
+            if SessionManager.session_exists(session_id):
+                raise FileExistsError(f"会话已存在: {session_id}")
+            
+            with tempfile.TemporaryDirectory() as tmp:
+                local = Path(tmp) / "member"
+                for name, member in members.items():
+                    with tar.extractfile(member) as src, open(local, "wb") as dst:
+                        shutil.copyfileobj(src, dst, 1024 * 1024)
+                    store.upload(f"{session_id}/{name}", local)
+            store.write(f"{session_id}/metadata.json", metadata_bytes)
+        print(f"📦 会话导入: {session_id} ({len(members) + 1} 个文件)")
+        return session_id
     
     @staticmethod
     def cleanup_session(session_id: str, keep_final_video: bool = True):
-        """清理会话文件
+        """清理会话文件（本节点工作目录和会话存储）
         
         Args:
             session_id: 会话ID
             keep_final_video: 是否保留最终视频
         """
+        store = SessionManager.store()
         session_path = SESSION_DIR / session_id
-        if not session_path.exists():
-            return
         
         if keep_final_video:
             # 仅删除中间文件，保留 metadata.json 用于状态查询
+            store.delete(f"{session_id}/segments")
+            store.delete(f"{session_id}/preview")
+            store.delete(f"{session_id}/last_frame.png")
             items_to_delete = [
                 session_path / "segments",
                 session_path / "last_frame.png",
-                session_path / "concat.txt",
+                *session_path.glob("concat*.txt"),
             ]
             for item in items_to_delete:
                 if item.exists():
@@ -188,16 +363,18 @@ class SessionManager:
                         item.unlink()
             print(f"🧹 会话清理完成（保留最终视频和元数据）: {session_id}")
         else:
-            # 删除整个会话目录
-            shutil.rmtree(session_path)
+            # 删除整个会话
+            store.delete(session_id)
+            if session_path.exists():
+                shutil.rmtree(session_path)
             print(f"🧹 会话完全删除: {session_id}")
     
     @staticmethod
     def list_all_sessions() -> List[str]:
         """列出所有会话ID"""
-        return [d.name for d in SESSION_DIR.iterdir() if d.is_dir()]
+        return SessionManager.store().sessions()
     
     @staticmethod
     def session_exists(session_id: str) -> bool:
         """检查会话是否存在"""
-        return (SESSION_DIR / session_id).exists()
+        return SessionManager.store().read(f"{session_id}/metadata.json") is not None
@@ -0,0 +1,377 @@
+"""
+会话存储 - 增量渲染会话状态的存放位置
+
+会话状态（元数据、最后一帧、段落文件）以 "<会话ID>/<文件名>" 为键写入会话存储，
+各节点的 SESSION_DIR 只是工作副本（渲染输出、concat 列表），任何节点都可以继续任何会话：
+- LocalSessionStore: 目录存储。默认即 SESSION_DIR（仅本节点可见，与原有行为一致）；
+  指向共享目录（NFS 等）时多个节点共享
+- S3SessionStore: S3 兼容对象存储（AWS S3、MinIO 等）
+
+租约保证同一会话同一时间只由一个节点渲染：节点在每次调用期间持有租约并定期续期，
+其它节点在租约有效期内请求该会话时返回 409，节点崩溃时租约在 TTL 后过期。
+
+环境变量：
+- AUTOVLOG_SESSION_STORE: local（默认）或 s3
+- AUTOVLOG_SESSION_STORE_DIR: 目录存储的根目录（默认为 SESSION_DIR）
+- AUTOVLOG_SESSION_S3_BUCKET / AUTOVLOG_SESSION_S3_PREFIX: 存储桶和对象键前缀
+  （端点和凭证与输出存储相同：AUTOVLOG_S3_ENDPOINT、AWS_ACCESS_KEY_ID 等）
+- AUTOVLOG_SESSION_LEASE_TTL: 租约有效期（秒，默认 120）
+- AUTOVLOG_NODE_ID: 节点标识（默认 主机名-进程号）
+"""
+
+import os
+import json
+import time
+import fcntl
+import shutil
+import socket
+import threading
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import List, Optional
+
+
+LEASE_TTL = float(os.getenv("AUTOVLOG_SESSION_LEASE_TTL", "120"))
+NODE_ID = os.getenv("AUTOVLOG_NODE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+# 租约文件（不参与导出）
+LEASE_FILE = "lease.json"
+
+# 文件复制块大小
+COPY_SIZE = 1024 * 1024
+
+
+@dataclass
+class Lease:
+    """会话租约"""
+
+    session_id: str
+    holder: str  # 持有节点
+    expires: float  # 过期时间（Unix 时间戳）
+
+    @property
+    def expired(self) -> bool:
+        return time.time() >= self.expires
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class SessionLeased(Exception):
+    """会话正由其它节点渲染"""
+
+    def __init__(self, lease: Lease):
+        self.lease = lease
+        super().__init__(
+            f"会话 {lease.session_id} 正由节点 {lease.holder} 渲染"
+            f"（租约剩余 {max(0.0, lease.expires - time.time()):.0f}秒）"
+        )
+
+
+class SessionStore:
+    """会话存储接口（键为 "<会话ID>/<相对路径>"）"""
+
+    # 其它节点是否可见（为 True 时每次调用后都需要发布完整的会话状态）
+    shared = False
+
+    def read(self, key: str) -> Optional[bytes]:
+        """读取对象，不存在时返回 None"""
+        raise NotImplementedError
+
+    def write(self, key: str, data: bytes):
+        """写入对象（原子替换）"""
+        raise NotImplementedError
+
+    def upload(self, key: str, path):
+        """发布本地文件（本地文件保留）"""
+        raise NotImplementedError
+
+    def download(self, key: str, path) -> bool:
+        """取回对象到本地文件，不存在时返回 False"""
+        raise NotImplementedError
+
+    def keys(self, prefix: str) -> List[str]:
+        """列出前缀下的所有键"""
+        raise NotImplementedError
+
+    def delete(self, prefix: str):
+        """删除前缀下的所有对象"""
+        raise NotImplementedError
+
+    def sessions(self) -> List[str]:
+        """列出所有会话ID"""
+        raise NotImplementedError
+
+    def acquire_lease(self, session_id: str, ttl: float = LEASE_TTL) -> Lease:
+        """获取或续期租约，其它节点持有有效租约时抛出 SessionLeased"""
+        raise NotImplementedError
+
+    def release_lease(self, session_id: str):
+        """释放本节点持有的租约"""
+        raise NotImplementedError
+
+
+class LocalSessionStore(SessionStore):
+    """目录存储（本地目录或多节点挂载的共享目录）"""
+
+    def __init__(self, root, shared: bool = False):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.shared = shared
+
+    def _path(self, key: str) -> Path:
+        return self.root / key
+
+    def read(self, key: str) -> Optional[bytes]:
+        try:
+            return self._path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def write(self, key: str, data: bytes):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(f".{path.name}.{NODE_ID}.part")
+        partial.write_bytes(data)
+        os.replace(partial, path)
+
+    def upload(self, key: str, path):
+        target = self._path(key)
+        if Path(path).resolve() == target.resolve():
+            return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        partial = target.with_name(f".{target.name}.{NODE_ID}.part")
+        shutil.copyfile(path, partial)
+        os.replace(partial, target)
+
+    def download(self, key: str, path) -> bool:
+        source = self._path(key)
+        if Path(path).resolve() == source.resolve():
+            return source.exists()
+        try:
+            shutil.copyfile(source, path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def keys(self, prefix: str) -> List[str]:
+        base = self._path(prefix)
+        if not base.is_dir():
+            return []
+        return sorted(
+            str(path.relative_to(self.root))
+            for path in base.rglob("*")
+            if path.is_file() and not path.name.startswith(".")
+        )
+
+    def delete(self, prefix: str):
+        path = self._path(prefix)
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+
+    def sessions(self) -> List[str]:
+        return [path.name for path in self.root.iterdir() if path.is_dir()]
+
+    def _locked(self, session_id: str):
+        """租约读写的互斥锁（flock，共享目录需支持文件锁）"""
+        directory = self._path(session_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        return open(directory / ".lease.lock", "w")
+
+    def _read_lease(self, session_id: str) -> Optional[Lease]:
+        data = self.read(f"{session_id}/{LEASE_FILE}")
+        return Lease(**json.loads(data)) if data else None
+
+    def acquire_lease(self, session_id: str, ttl: float = LEASE_TTL) -> Lease:
+        with self._locked(session_id) as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            current = self._read_lease(session_id)
+            if current and current.holder != NODE_ID and not current.expired:
+                raise SessionLeased(current)
+            lease = Lease(session_id, NODE_ID, time.time() + ttl)
+            self.write(f"{session_id}/{LEASE_FILE}", json.dumps(lease.to_dict()).encode())
+            return lease
+
+    def release_lease(self, session_id: str):
+        if not self._path(session_id).is_dir():
+            return
+        with self._locked(session_id) as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            current = self._read_lease(session_id)
+            if current and current.holder == NODE_ID:
+                self._path(f"{session_id}/{LEASE_FILE}").unlink(missing_ok=True)
+
+    def __repr__(self):
+        return f"LocalSessionStore({self.root}{', shared' if self.shared else ''})"
+
+
+class S3SessionStore(SessionStore):
+    """S3 兼容对象存储（租约使用条件写入：If-None-Match / If-Match）"""
+
+    shared = True
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("使用 S3 会话存储需要安装 boto3: pip install boto3")
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.endpoint_url = endpoint_url
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def object_key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    @staticmethod
+    def _missing(error) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey")
+
+    def _get(self, key: str):
+        """读取对象，返回 (数据, ETag)，不存在时返回 (None, None)"""
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))
+        except ClientError as e:
+            if self._missing(e):
+                return None, None
+            raise
+        return response["Body"].read(), response["ETag"]
+
+    def read(self, key: str) -> Optional[bytes]:
+        return self._get(key)[0]
+
+    def write(self, key: str, data: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=self.object_key(key), Body=data)
+
+    def upload(self, key: str, path):
+        self.client.upload_file(str(path), self.bucket, self.object_key(key))
+
+    def download(self, key: str, path) -> bool:
+        from botocore.exceptions import ClientError
+
+        partial = Path(f"{path}.part")
+        try:
+            self.client.download_file(self.bucket, self.object_key(key), str(partial))
+        except ClientError as e:
+            partial.unlink(missing_ok=True)
+            if self._missing(e):
+                return False
+            raise
+        os.replace(partial, path)
+        return True
+
+    def _list(self, prefix: str, delimiter: Optional[str] = None):
+        paginator = self.client.get_paginator("list_objects_v2")
+        options = {"Bucket": self.bucket, "Prefix": self.object_key(prefix)}
+        if delimiter:
+            options["Delimiter"] = delimiter
+        return paginator.paginate(**options)
+
+    def keys(self, prefix: str) -> List[str]:
+        return sorted(
+            item["Key"][len(self.prefix):]
+            for page in self._list(prefix.rstrip("/") + "/")
+            for item in page.get("Contents", [])
+        )
+
+    def delete(self, prefix: str):
+        keys = self.keys(prefix) or [prefix]
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={
+                    "Objects": [
+                        {"Key": self.object_key(key)} for key in keys[start:start + 1000]
+                    ]
+                },
+            )
+
+    def sessions(self) -> List[str]:
+        return [
+            item["Prefix"][len(self.prefix):].rstrip("/")
+            for page in self._list("", delimiter="/")
+            for item in page.get("CommonPrefixes", [])
+        ]
+
+    def acquire_lease(self, session_id: str, ttl: float = LEASE_TTL) -> Lease:
+        from botocore.exceptions import ClientError
+
+        key = f"{session_id}/{LEASE_FILE}"
+        data, etag = self._get(key)
+        if data:
+            current = Lease(**json.loads(data))
+            if current.holder != NODE_ID and not current.expired:
+                raise SessionLeased(current)
+        lease = Lease(session_id, NODE_ID, time.time() + ttl)
+        # 只有在读取后无人改写时才写入，并发获取时只有一个节点成功
+        condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+        try:
+            self.client.put_object(
+                Bucket=self.bucket,
+                Key=self.object_key(key),
+                Body=json.dumps(lease.to_dict()).encode(),
+                **condition,
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in (
+                "PreconditionFailed",
+                "ConditionalRequestConflict",
+            ):
+                raise
+            data = self.read(key)
+            raise SessionLeased(
+                Lease(**json.loads(data)) if data else Lease(session_id, "?", time.time() + ttl)
+            )
+        return lease
+
+    def release_lease(self, session_id: str):
+        key = f"{session_id}/{LEASE_FILE}"
+        data = self.read(key)
+        if data and Lease(**json.loads(data)).holder == NODE_ID:
+            self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+    def __repr__(self):
+        endpoint = f" @ {self.endpoint_url}" if self.endpoint_url else ""
+        return f"S3SessionStore(s3://{self.bucket}/{self.prefix}{endpoint})"
+
+
+_store: Optional[SessionStore] = None
+_store_lock = threading.Lock()
+
+
+def get_session_store(default_dir) -> SessionStore:
+    """按环境变量创建会话存储（进程内单例）
+
+    Args:
+        default_dir: 未指定存储目录时使用的本节点目录（SESSION_DIR）
+    """
+    global _store
+    with _store_lock:
+        if _store is not None:
+            return _store
+
+        backend = os.getenv("AUTOVLOG_SESSION_STORE", "local").lower()
+        if backend == "s3":
+            bucket = os.getenv("AUTOVLOG_SESSION_S3_BUCKET")
+            if not bucket:
+                raise RuntimeError(
+                    "AUTOVLOG_SESSION_STORE=s3 需要设置 AUTOVLOG_SESSION_S3_BUCKET"
+                )
+            _store = S3SessionStore(
+                bucket,
+                prefix=os.getenv("AUTOVLOG_SESSION_S3_PREFIX", "sessions"),
+                endpoint_url=os.getenv("AUTOVLOG_S3_ENDPOINT") or None,
+            )
+        elif backend == "local":
+            root = os.getenv("AUTOVLOG_SESSION_STORE_DIR")
+            _store = LocalSessionStore(root or default_dir, shared=bool(root))
+        else:
+            raise RuntimeError(f"未知的会话存储: {backend}")
+
+        print(f"🗄️  会话存储: {_store}")
+        return _store
@@ -7,6 +7,14 @@ import re
 from pathlib import Path
 
 
+def use_software_gl():
+    """使用 Mesa 软件光栅化（llvmpipe），必须在创建第一个 EGL 上下文之前调用"""
+    os.environ["LIBGL_ALWAYS_SOFTWARE"] = "1"
+    mesa_vendor = Path("/usr/share/glvnd/egl_vendor.d/50_mesa.json")
+    if mesa_vendor.exists():
+        os.environ["__EGL_VENDOR_LIBRARY_FILENAMES"] = str(mesa_vendor)
+
+
 def create_transition_shader(ctx, transition_source):
     """创建转场 shader 程序，自动补充缺失的辅助函数"""
     helpers = []
@@ -73,6 +81,27 @@ def create_overlay_shader(ctx, overlay_name="subtitle"):
     return ctx.program(vertex_shader=vertex_shader, fragment_shader=fragment_shader)
 
 
+def create_blend_shader(ctx):
+    """创建叠加层 shader（输出叠加层颜色，配合 GL 混合直接叠加到目标 FBO）"""
+    vertex_shader = """
+        #version 330
+        in vec2 in_vert, in_text;
+        out vec2 v_text;
+        void main() { gl_Position = vec4(in_vert, 0.0, 1.0); v_text = in_text; }
+    """
+
+    fragment_shader = """
+        #version 330
+        uniform sampler2D overlay_tex;
+        in vec2 v_text;
+        out vec4 f_color;
+
+        void main() { f_color = texture(overlay_tex, v_text); }
+    """
+
+    return ctx.program(vertex_shader=vertex_shader, fragment_shader=fragment_shader)
+
+
 def load_transitions(transition_files):
     """加载转场效果 GLSL 文件"""
     print("📦 加载转场效果...")
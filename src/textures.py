@@ -0,0 +1,87 @@
+"""
+纹理驻留管理 - 跳过内容未变化的纹理上传
+
+渲染循环中大量上传是重复的：图片转场每帧把同一张复合图片写入 tex0，
+增量追加的 50 帧转场每帧重写上一段最后一帧，打字机字幕每 N 帧才变化一次。
+TextureResidency 按纹理记录当前内容标识，标识相同时跳过 write()：
+- 显式标识：write(tex, data, source="border", version=1)
+- 隐式标识：data 为 bytes（不可变）时以对象本身为标识，同一对象内容必然相同
+- 其它数据（bytearray、numpy 数组等可变缓冲区）总是上传
+
+同时统计每个任务的上传/跳过字节数。
+"""
+
+from dataclasses import dataclass, asdict
+
+
+@dataclass
+class UploadStats:
+    """纹理上传统计"""
+    uploads: int = 0
+    upload_bytes: int = 0
+    skipped: int = 0
+    skipped_bytes: int = 0
+
+    def to_dict(self):
+        return asdict(self)
+
+
+class TextureResidency:
+    """按纹理跟踪已上传的内容"""
+
+    def __init__(self):
+        # id(texture) -> (texture, 内容标识)；保留引用，避免 id 被复用
+        self._resident = {}
+        self.stats = UploadStats()
+
+    def write(self, texture, data, source=None, version=None) -> bool:
+        """
+        写入纹理（内容未变化时跳过）
+
+        Args:
+            texture: moderngl 纹理
+            data: 像素数据
+            source, version: 内容标识；未指定时 bytes 数据以对象本身为标识
+
+        Returns:
+            是否实际上传
+        """
+        size = len(data) if isinstance(data, (bytes, bytearray)) else data.nbytes
+        if source is not None:
+            identity = ("source", source, version)
+        elif isinstance(data, bytes):
+            identity = ("object", data)
+        else:
+            identity = None
+
+        current = self._resident.get(id(texture))
+        if identity is not None and current is not None and self._same(current[1], identity):
+            self.stats.skipped += 1
+            self.stats.skipped_bytes += size
+            return False
+
+        texture.write(data)
+        self._resident[id(texture)] = (texture, identity)
+        self.stats.uploads += 1
+        self.stats.upload_bytes += size
+        return True
+
+    @staticmethod
+    def _same(a, b) -> bool:
+        if a is None or a[0] != b[0]:
+            return False
+        if a[0] == "object":
+            return a[1] is b[1]
+        return a == b
+
+    def invalidate(self, texture=None):
+        """标记纹理内容未知（外部修改或上下文释放后调用）"""
+        if texture is None:
+            self._resident.clear()
+        else:
+            self._resident.pop(id(texture), None)
+
+    def reset_stats(self) -> UploadStats:
+        """开始新任务：返回并清零统计（驻留内容保留）"""
+        stats, self.stats = self.stats, UploadStats()
+        return stats
@@ -0,0 +1,347 @@
+"""
+时间线规划模块 - 声明式时间线与执行计划
+
+一次性渲染（ApiVlogRenderer.render）与增量渲染（render_init / render_append）
+共用同一套帧调度：
+- Timeline: 声明素材（图片、视频片段）、转场顺序和叠加层参数
+- compile_plan: 将时间线编译为按帧区间划分的执行计划
+- ExecutionPlan: 标注静态区间、可复用区间和可并行分块，给出精确帧数与代价估算
+
+帧数规则（两种渲染模式一致）：
+- 图片段: IMAGE_FRAMES 帧，前 subtitle_frames 帧带打字机字幕，其余为静态帧
+- 每个视频片段: TRANS_FRAMES 帧入场转场 + (VIDEO_FRAMES - TRANS_FRAMES) 帧主体
+"""
+
+from dataclasses import dataclass, field, asdict, replace
+from typing import Dict, List, Optional
+
+
+# 各阶段单帧耗时估算（毫秒），用于执行前的代价模型，可由实测数据覆盖
+DEFAULT_STAGE_COSTS = {
+    "decode": 4.0,  # 解码并缩放一帧视频
+    "upload": 1.5,  # 上传一帧 RGB 纹理
+    "transition": 1.0,  # 转场 shader 绘制
+    "overlay": 2.0,  # 边框/字幕叠加绘制
+    "readback": 3.0,  # 从 FBO 读回一帧
+    "encode": 3.0,  # 编码一帧
+    "subtitle": 0.5,  # 字幕文字光栅化（仅在文字变化时发生）
+}
+
+
+@dataclass
+class ClipSource:
+    """视频片段源"""
+
+    index: int
+    path: str
+    read_frames: int  # 需要从解码器读取的帧数
+    fps: float
+    start_frame: int = 0  # 从片段的第几帧开始读取（前面的帧已有缓存结果）
+
+    @property
+    def trim_duration(self) -> float:
+        """解码器裁剪时长（秒）"""
+        return self.read_frames / self.fps
+
+
+@dataclass
+class Span:
+    """时间线上的一个帧区间"""
+
+    index: int
+    kind: str  # 'image', 'transition', 'clip'
+    start: int  # 在时间线（或本段）中的起始帧
+    frames: int
+    border: str  # 'image'（图片已复合边框）或 'video'（叠加视频边框）
+    clip: Optional[int] = None  # 目标视频片段（转场 to 侧 / 片段主体）
+    from_kind: Optional[str] = None  # 转场 from 侧: 'image', 'clip', 'still'
+    from_clip: Optional[int] = None  # from 侧为 'clip' 时的片段索引
+    transition: Optional[str] = None  # 转场名称
+    transition_index: Optional[int] = None  # 在模板转场列表中的索引
+    subtitle_frames: int = 0  # 带字幕的帧数
+    static: bool = False  # 区间内所有帧内容相同
+    reuse_key: Optional[str] = None  # 可复用区间的内容键
+    chunk: int = 0  # 所属并行分块
+    release_clips: List[int] = field(default_factory=list)  # 本区间结束后可关闭的解码器
+
+    @property
+    def end(self) -> int:
+        return self.start + self.frames
+
+
+@dataclass
+class Timeline:
+    """声明式时间线"""
+
+    image_path: Optional[str]
+    clip_paths: List[str]
+    transitions: List[str]  # 模板转场名称（按配置顺序）
+    fps: float
+    image_frames: int
+    video_frames: int
+    trans_frames: int
+    subtitle_frames: int = 0
+    transition_offset: int = 0  # 第一个入场转场在模板转场列表中的序号
+    still_from: bool = False  # 首个转场的 from 侧是否为上一段的最后一帧（增量模式）
+
+
+@dataclass
+class ExecutionPlan:
+    """编译后的执行计划"""
+
+    spans: List[Span]
+    clips: List[ClipSource]
+    fps: float
+
+    @property
+    def total_frames(self) -> int:
+        return sum(span.frames for span in self.spans)
+
+    @property
+    def duration(self) -> float:
+        return self.total_frames / self.fps
+
+    def frame_counts(self) -> Dict[str, int]:
+        """按区间类型统计帧数"""
+        counts = {"image": 0, "transition": 0, "clip": 0, "static": 0}
+        for span in self.spans:
+            counts[span.kind] += span.frames
+            if span.static:
+                counts["static"] += span.frames
+        counts["total"] = self.total_frames
+        return counts
+
+    def static_spans(self) -> List[Span]:
+        return [span for span in self.spans if span.static]
+
+    def reusable_spans(self) -> List[Span]:
+        return [span for span in self.spans if span.reuse_key]
+
+    def chunks(self) -> List[List[Span]]:
+        """返回可并行渲染的分块（每块可独立打开解码器，从片段偏移处开始渲染）"""
+        grouped: Dict[int, List[Span]] = {}
+        for span in self.spans:
+            grouped.setdefault(span.chunk, []).append(span)
+        return [grouped[key] for key in sorted(grouped)]
+
+    def clip_reads(self) -> Dict[int, List[tuple]]:
+        """每个区间读取的片段帧范围 {区间序号: [(片段, 起始帧, 帧数), ...]}"""
+        cursor = {clip.index: clip.start_frame for clip in self.clips}
+        reads = {}
+        for span in self.spans:
+            items = []
+            if span.kind == "transition" and span.from_kind == "clip":
+                items.append((span.from_clip, cursor[span.from_clip], span.frames))
+                cursor[span.from_clip] += span.frames
+            if span.clip is not None:
+                items.append((span.clip, cursor[span.clip], span.frames))
+                cursor[span.clip] += span.frames
+            reads[span.index] = items
+        return reads
+
+    def subset(self, span_indices) -> "ExecutionPlan":
+        """
+        只保留指定区间的执行计划（其余区间已有缓存结果）
+
+        区间保留原序号。片段在被跳过的区间之后再次使用时，新建一个从对应帧开始读取的片段源，
+        解码器关闭时机按保留的区间重新计算。
+        """
+        keep = set(span_indices)
+        reads = self.clip_reads()
+        clips: List[ClipSource] = []
+        sources: Dict[int, ClipSource] = {}  # 原片段 -> 当前片段源
+        next_frame: Dict[int, int] = {}  # 原片段 -> 当前片段源的下一帧
+        last_use: Dict[int, Span] = {}
+        spans: List[Span] = []
+        for span in self.spans:
+            if span.index not in keep:
+                continue
+            mapping = {}
+            for clip, start, frames in reads[span.index]:
+                if clip not in sources or next_frame[clip] != start:
+                    original = self.clips[clip]
+                    sources[clip] = ClipSource(
+                        len(clips), original.path, 0, original.fps, start_frame=start
+                    )
+                    clips.append(sources[clip])
+                sources[clip].read_frames += frames
+                next_frame[clip] = start + frames
+                mapping[clip] = sources[clip].index
+            kept = replace(
+                span,
+                clip=mapping.get(span.clip, span.clip),
+                from_clip=mapping.get(span.from_clip, span.from_clip),
+                release_clips=[],
+            )
+            for index in mapping.values():
+                last_use[index] = kept
+            spans.append(kept)
+        for index, span in last_use.items():
+            span.release_clips.append(index)
+        return ExecutionPlan(spans=spans, clips=clips, fps=self.fps)
+
+    def estimate_cost(
+        self,
+        stage_costs: Optional[Dict[str, float]] = None,
+        transition_costs: Optional[Dict[str, float]] = None,
+    ) -> dict:
+        """估算各阶段耗时（毫秒），在任何 GPU 工作开始前调用
+
+        Args:
+            stage_costs: 覆盖默认的各阶段单帧耗时
+            transition_costs: 各转场的实测单帧耗时（TransitionCatalog），
+                未列出的转场使用 stage_costs["transition"]
+        """
+        costs = dict(DEFAULT_STAGE_COSTS)
+        if stage_costs:
+            costs.update(stage_costs)
+        transition_costs = transition_costs or {}
+
+        ops = {key: 0 for key in costs}
+        transition_ms = 0.0
+        for span in self.spans:
+            n = span.frames
+            ops["encode"] += n
+            if span.kind == "image":
+                if span.static:
+                    continue
+                ops["upload"] += n
+                ops["overlay"] += n
+                ops["readback"] += n
+                ops["subtitle"] += n
+            elif span.kind == "transition":
+                ops["decode"] += n * (2 if span.from_kind == "clip" else 1)
+                ops["upload"] += n * 2
+                ops["transition"] += n
+                ops["overlay"] += n
+                ops["readback"] += n * 2
+                transition_ms += n * transition_costs.get(
+                    span.transition, costs["transition"]
+                )
+            else:
+                ops["decode"] += n
+                ops["upload"] += n
+                ops["transition"] += n
+                ops["overlay"] += n
+                ops["readback"] += n * 2
+                # 片段主体以 progress=0 绘制，着色器直接输出 tex0
+                transition_ms += n * costs["transition"]
+
+        stages = {key: ops[key] * costs[key] for key in costs}
+        stages["transition"] = transition_ms
+        return {
+            "frames": self.frame_counts(),
+            "operations": ops,
+            "stages_ms": stages,
+            "total_ms": sum(stages.values()),
+        }
+
+    def describe(self):
+        """打印执行计划摘要"""
+        counts = self.frame_counts()
+        print(
+            f"🗺️  执行计划: {len(self.spans)} 个区间, {counts['total']} 帧 "
+            f"({self.duration:.1f}秒), 静态帧 {counts['static']}, "
+            f"并行分块 {len(self.chunks())}"
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "fps": self.fps,
+            "total_frames": self.total_frames,
+            "spans": [asdict(span) for span in self.spans],
+            "clips": [asdict(clip) for clip in self.clips],
+        }
+
+
+def compile_plan(timeline: Timeline) -> ExecutionPlan:
+    """将时间线编译为执行计划"""
+    spans: List[Span] = []
+    cursor = 0
+    chunk = 0
+
+    def add(kind, frames, border, **kwargs):
+        nonlocal cursor
+        span = Span(
+            index=len(spans),
+            kind=kind,
+            start=cursor,
+            frames=frames,
+            border=border,
+            chunk=chunk,
+            **kwargs,
+        )
+        spans.append(span)
+        cursor += frames
+        return span
+
+    # 图片段：字幕部分 + 静态尾部
+    if timeline.image_path:
+        subtitle_frames = min(timeline.subtitle_frames, timeline.image_frames)
+        if subtitle_frames > 0:
+            add(
+                "image",
+                subtitle_frames,
+                "image",
+                subtitle_frames=subtitle_frames,
+                reuse_key=f"image:{timeline.image_path}:subtitle",
+            )
+        if timeline.image_frames > subtitle_frames:
+            add(
+                "image",
+                timeline.image_frames - subtitle_frames,
+                "image",
+                static=True,
+                reuse_key=f"image:{timeline.image_path}:static",
+            )
+        chunk += 1
+
+    # 视频片段：入场转场 + 主体
+    clips: List[ClipSource] = []
+    n_clips = len(timeline.clip_paths)
+    body_frames = timeline.video_frames - timeline.trans_frames
+    for i, path in enumerate(timeline.clip_paths):
+        is_last = i == n_clips - 1
+        # 一次性渲染时，下一个转场的 from 侧继续读取本片段
+        read_frames = timeline.video_frames + (0 if is_last else timeline.trans_frames)
+        clips.append(ClipSource(i, path, read_frames, timeline.fps))
+
+        if i > 0:
+            from_kind, from_clip = "clip", i - 1
+        elif timeline.image_path:
+            from_kind, from_clip = "image", None
+        elif timeline.still_from:
+            from_kind, from_clip = "still", None
+        else:
+            from_kind, from_clip = None, None
+
+        if from_kind and timeline.trans_frames > 0:
+            transition_index = (timeline.transition_offset + i) % len(
+                timeline.transitions
+            )
+            add(
+                "transition",
+                timeline.trans_frames,
+                "video",
+                clip=i,
+                from_kind=from_kind,
+                from_clip=from_clip,
+                transition=timeline.transitions[transition_index],
+                transition_index=transition_index,
+                release_clips=[from_clip] if from_clip is not None else [],
+            )
+            clip_frames = body_frames
+        else:
+            clip_frames = timeline.video_frames
+
+        add(
+            "clip",
+            clip_frames,
+            "video",
+            clip=i,
+            reuse_key=f"clip:{path}:{timeline.video_frames - clip_frames}:{clip_frames}",
+            release_clips=[i] if is_last else [],
+        )
+        chunk += 1
+
+    return ExecutionPlan(spans=spans, clips=clips, fps=timeline.fps)
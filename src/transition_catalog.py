@@ -0,0 +1,297 @@
+"""
+转场目录 - 各转场效果的实测 GPU 开销
+
+transitions/ 中的 GLSL 复杂度差异很大（stereo-viewer 约 200 行，mosaic 约 40 行），
+profile_transition 在目标分辨率下用 GL 计时查询测量每帧耗时，
+结果按 (转场, 后端, 分辨率) 写入目录文件，运行时可查询：
+- TransitionCatalog.lookup: 单个转场的每帧耗时（按像素数换算到目标分辨率）
+- TransitionCatalog.transition_costs: 供 ExecutionPlan.estimate_cost 使用
+
+生成目录: python profile_transitions.py
+"""
+
+import os
+import time
+import hashlib
+import json
+import threading
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.shaders import create_transition_shader
+
+
+# 目录文件
+CATALOG_PATH = Path(
+    os.getenv("AUTOVLOG_TRANSITION_CATALOG", "transitions/catalog.json")
+)
+TRANSITIONS_DIR = Path("transitions")
+
+# 软件光栅化实现（GL_RENDERER 中的关键字）
+SOFTWARE_RENDERERS = ("llvmpipe", "softpipe", "swrast", "swiftshader")
+
+
+def gl_backend(ctx) -> str:
+    """当前上下文的 GL 实现名称"""
+    return ctx.info.get("GL_RENDERER", "unknown")
+
+
+def is_software(backend: str) -> bool:
+    """是否为软件光栅化"""
+    return any(name in backend.lower() for name in SOFTWARE_RENDERERS)
+
+
+def source_digest(source: str) -> str:
+    """转场源码摘要（判断目录条目是否过期）"""
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+
+
+@dataclass
+class TransitionCost:
+    """单个转场在某个后端、分辨率下的实测开销"""
+    name: str
+    backend: str
+    width: int
+    height: int
+    ms_per_frame: float  # 平均每帧耗时
+    p95_ms: float
+    max_ms: float
+    compile_ms: float
+    samples: int
+    timing: str  # 'gl_timer' 或 'cpu'（不支持计时查询时退化为 glFinish 计时）
+    source_sha1: str
+    profiled_at: float
+
+    def to_dict(self):
+        return asdict(self)
+
+    @property
+    def pixels(self) -> int:
+        return self.width * self.height
+
+
+def _random_texture(ctx, width: int, height: int, seed: int):
+    """随机内容纹理（避免纯色输入让着色器走捷径）"""
+    rng = np.random.default_rng(seed)
+    tex = ctx.texture((width, height), 3)
+    tex.write(rng.integers(0, 256, (height, width, 3), dtype=np.uint8).tobytes())
+    return tex
+
+
+def profile_transition(
+    ctx,
+    name: str,
+    source: str,
+    width: int,
+    height: int,
+    steps: int = 50,
+    repeats: int = 3,
+    warmup: int = 5,
+) -> TransitionCost:
+    """
+    测量单个转场的每帧开销
+
+    在 (0, 1) 进度区间均匀取 steps 个点，每个点绘制 repeats 次，
+    每次绘制用 GL 计时查询测量 GPU 时间。
+
+    Args:
+        ctx: moderngl 上下文
+        name: 转场名称
+        source: GLSL 源码
+        width, height: 目标分辨率
+        steps: 进度采样点数
+        repeats: 每个采样点的绘制次数
+        warmup: 预热绘制次数（不计入结果）
+    """
+    start = time.perf_counter()
+    prog = create_transition_shader(ctx, source)
+    vertices = np.array(
+        [-1, -1, 0, 0, 1, -1, 1, 0, -1, 1, 0, 1, -1, 1, 0, 1, 1, -1, 1, 0, 1, 1, 1, 1],
+        dtype="f4",
+    )
+    vbo = ctx.buffer(vertices)
+    vao = ctx.vertex_array(prog, [(vbo, "2f 2f", "in_vert", "in_text")])
+    tex0 = _random_texture(ctx, width, height, 0)
+    tex1 = _random_texture(ctx, width, height, 1)
+    fbo = ctx.simple_framebuffer((width, height), components=3)
+    fbo.use()
+
+    tex0.use(location=0)
+    tex1.use(location=1)
+    prog["tex0"].value = 0
+    prog["tex1"].value = 1
+    if "ratio" in prog:
+        prog["ratio"].value = width / height
+
+    # 首次绘制包含驱动侧的延迟编译
+    prog["progress"].value = 0.5
+    vao.render()
+    ctx.finish()
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    for i in range(warmup):
+        prog["progress"].value = (i + 1) / (warmup + 1)
+        vao.render()
+    ctx.finish()
+
+    query = ctx.query(time=True)
+    timing = "gl_timer"
+    samples = []
+    try:
+        for step in range(steps):
+            prog["progress"].value = (step + 0.5) / steps
+            for _ in range(repeats):
+                if timing == "gl_timer":
+                    with query:
+                        vao.render()
+                    elapsed = query.elapsed / 1e6
+                    if elapsed > 0:
+                        samples.append(elapsed)
+                        continue
+                    # 不支持计时查询（部分软件实现返回 0），改用 CPU 计时
+                    timing = "cpu"
+                t0 = time.perf_counter()
+                vao.render()
+                ctx.finish()
+                samples.append((time.perf_counter() - t0) * 1000)
+    finally:
+        for obj in (query, fbo, tex0, tex1, vao, vbo, prog):
+            obj.release()
+
+    samples = np.array(samples)
+    return TransitionCost(
+        name=name,
+        backend=gl_backend(ctx),
+        width=width,
+        height=height,
+        ms_per_frame=round(float(samples.mean()), 4),
+        p95_ms=round(float(np.percentile(samples, 95)), 4),
+        max_ms=round(float(samples.max()), 4),
+        compile_ms=round(compile_ms, 2),
+        samples=len(samples),
+        timing=timing,
+        source_sha1=source_digest(source),
+        profiled_at=time.time(),
+    )
+
+
+class TransitionCatalog:
+    """转场开销目录（进程内缓存，文件变化时重新加载）"""
+
+    _entries: Optional[List[TransitionCost]] = None
+    _version: Optional[tuple] = None  # (路径, 修改时间)
+    _lock = threading.Lock()
+
+    @staticmethod
+    def load(path: Path = None) -> List[TransitionCost]:
+        """读取目录（文件不存在时为空）"""
+        path = Path(path or CATALOG_PATH)
+        version = (str(path), path.stat().st_mtime if path.exists() else None)
+        with TransitionCatalog._lock:
+            if TransitionCatalog._entries is None or version != TransitionCatalog._version:
+                entries = []
+                if version[1] is not None:
+                    data = json.loads(path.read_text(encoding="utf-8"))
+                    entries = [TransitionCost(**item) for item in data.get("entries", [])]
+                TransitionCatalog._entries = entries
+                TransitionCatalog._version = version
+            return list(TransitionCatalog._entries)
+
+    @staticmethod
+    def record(costs: List[TransitionCost], path: Path = None):
+        """写入测量结果（替换相同 转场/后端/分辨率 的旧条目）"""
+        path = Path(path or CATALOG_PATH)
+        replaced = {(c.name, c.backend, c.width, c.height) for c in costs}
+        entries = [
+            e
+            for e in TransitionCatalog.load(path)
+            if (e.name, e.backend, e.width, e.height) not in replaced
+        ]
+        entries.extend(costs)
+        entries.sort(key=lambda e: (e.backend, e.width * e.height, e.name))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(
+            json.dumps(
+                {"version": 1, "entries": [e.to_dict() for e in entries]},
+                indent=2,
+                ensure_ascii=False,
+            ),
+            encoding="utf-8",
+        )
+        with TransitionCatalog._lock:
+            TransitionCatalog._entries = None
+
+    @staticmethod
+    def backends() -> List[str]:
+        """目录中已测量的后端"""
+        return sorted({e.backend for e in TransitionCatalog.load()})
+
+    @staticmethod
+    def default_backend() -> Optional[str]:
+        """未指定后端时使用的后端：优先硬件实现"""
+        backends = TransitionCatalog.backends()
+        hardware = [b for b in backends if not is_software(b)]
+        return (hardware or backends or [None])[0]
+
+    @staticmethod
+    def lookup(
+        name: str, width: int, height: int, backend: Optional[str] = None
+    ) -> Optional[float]:
+        """
+        查询转场在目标分辨率下的每帧耗时（毫秒），目录中没有时返回 None
+
+        取像素数最接近的测量结果，并按像素数比例换算（转场开销以片元着色为主）。
+        """
+        backend = backend or TransitionCatalog.default_backend()
+        candidates = [
+            e
+            for e in TransitionCatalog.load()
+            if e.name == name and e.backend == backend
+        ]
+        if not candidates:
+            return None
+        pixels = width * height
+        nearest = min(candidates, key=lambda e: abs(e.pixels - pixels))
+        return nearest.ms_per_frame * pixels / nearest.pixels
+
+    @staticmethod
+    def transition_costs(
+        names, width: int, height: int, backend: Optional[str] = None
+    ) -> Dict[str, float]:
+        """批量查询（用于执行计划估算），目录中没有的转场不返回"""
+        costs = {}
+        for name in names:
+            cost = TransitionCatalog.lookup(name, width, height, backend)
+            if cost is not None:
+                costs[name] = cost
+        return costs
+
+    @staticmethod
+    def describe(width: int, height: int, backend: Optional[str] = None) -> List[dict]:
+        """按开销排序列出所有转场（含未测量和源码已变化的转场）"""
+        backend = backend or TransitionCatalog.default_backend()
+        entries = {
+            e.name: e for e in TransitionCatalog.load() if e.backend == backend
+        }
+        rows = []
+        for path in sorted(TRANSITIONS_DIR.glob("*.glsl")):
+            entry = entries.get(path.stem)
+            rows.append(
+                {
+                    "name": path.stem,
+                    "lines": len(path.read_text(encoding="utf-8").splitlines()),
+                    "ms_per_frame": TransitionCatalog.lookup(
+                        path.stem, width, height, backend
+                    ),
+                    "stale": bool(
+                        entry
+                        and entry.source_sha1
+                        != source_digest(path.read_text(encoding="utf-8"))
+                    ),
+                }
+            )
+        rows.sort(key=lambda r: (r["ms_per_frame"] is None, r["ms_per_frame"] or 0))
+        return rows
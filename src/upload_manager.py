@@ -0,0 +1,357 @@
+"""
+上传管理器 - 流式接收素材并提前探测、预解码
+
+上传流程：
+- create_upload: 创建上传句柄（upload:<id>），可立即在 init/append 请求中使用
+- write_chunk: 分块写入文件；收到足够的头部数据后立即探测容器（probe_media）
+- 探测成功后在后台启动 VideoReader（follow 模式读取增长中的文件），预读首帧
+- complete_upload: 写入结束，渲染器通过 claim_reader 取走已预热的解码器
+
+这样网络传输与解码启动重叠进行，而不是先拷贝完文件再开始渲染。
+
+客户端未调用 DELETE 的上传由后台巡检清理：
+- AUTOVLOG_UPLOAD_TTL: 上传最后一次活动（写入、查询、使用）后保留的秒数（默认 3600）
+- AUTOVLOG_UPLOAD_READER_TTL: 上传完成后预热解码器无人取走时保留的秒数（默认 300）
+"""
+
+import os
+import time
+import uuid
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.media_probe import probe_media
+from src.video import VideoReader
+
+
+# 上传根目录
+UPLOAD_DIR = Path("/tmp/autovlog_uploads")
+UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+
+# 收到多少字节后开始探测容器头部
+PROBE_BYTES = 2 * 1024 * 1024
+
+# 过期时间（秒）和巡检间隔
+UPLOAD_TTL = float(os.getenv("AUTOVLOG_UPLOAD_TTL", "3600"))
+READER_TTL = float(os.getenv("AUTOVLOG_UPLOAD_READER_TTL", "300"))
+REAPER_INTERVAL = 60
+
+# 上传句柄前缀
+UPLOAD_SCHEME = "upload:"
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+
+
+@dataclass
+class UploadInfo:
+    """上传状态"""
+    upload_id: str
+    filename: str
+    path: str
+    media_type: str  # 'image', 'video'
+    status: str  # 'created', 'receiving', 'completed', 'error'
+    bytes_received: int = 0
+    created_at: float = 0.0
+    completed_at: Optional[float] = None
+    updated_at: float = 0.0  # 最后一次活动时间（过期清理）
+    probe: Optional[dict] = None
+    error: Optional[str] = None
+
+    def to_dict(self):
+        return asdict(self)
+
+
+class UploadManager:
+    """内存上传注册表（单进程服务）"""
+
+    _uploads: Dict[str, UploadInfo] = {}
+    _files: Dict[str, object] = {}
+    _completed: Dict[str, threading.Event] = {}
+    _readers: Dict[str, object] = {}  # upload_id -> Future[VideoReader]
+    _lock = threading.Lock()
+    _executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="upload-prewarm")
+    _reaper: Optional[threading.Thread] = None
+
+    # 预解码参数（由服务启动时根据全局配置设置）
+    _prewarm: Optional[dict] = None
+
+    @staticmethod
+    def configure_prewarm(width: int, height: int, fps: float, trim_duration: float):
+        """设置预解码参数，需与渲染参数一致才能被渲染器复用"""
+        UploadManager._prewarm = {
+            "width": width,
+            "height": height,
+            "fps": fps,
+            "trim_duration": trim_duration,
+        }
+
+    @staticmethod
+    def create_upload(filename: str) -> UploadInfo:
+        """创建上传句柄"""
+        name = Path(filename).name
+        suffix = Path(name).suffix.lower()
+        if suffix in IMAGE_EXTENSIONS:
+            media_type = "image"
+        elif suffix in VIDEO_EXTENSIONS:
+            media_type = "video"
+        else:
+            raise ValueError(f"不支持的文件格式: {filename}")
+
+        upload_id = str(uuid.uuid4())
+        upload_path = UPLOAD_DIR / upload_id
+        upload_path.mkdir(parents=True, exist_ok=True)
+
+        info = UploadInfo(
+            upload_id=upload_id,
+            filename=name,
+            path=str(upload_path / name),
+            media_type=media_type,
+            status="created",
+            created_at=time.time(),
+            updated_at=time.time(),
+        )
+        # 预先创建空文件，follow 模式的解码器可以立即打开
+        Path(info.path).touch()
+
+        UploadManager._ensure_reaper()
+        with UploadManager._lock:
+            UploadManager._uploads[upload_id] = info
+            UploadManager._completed[upload_id] = threading.Event()
+        print(f"📥 上传句柄创建: {UPLOAD_SCHEME}{upload_id} ({name})")
+        return info
+
+    @staticmethod
+    def get(upload_id: str) -> UploadInfo:
+        """获取上传状态（视为一次活动，推迟过期）"""
+        info = UploadManager._uploads.get(upload_id)
+        if info is None:
+            raise FileNotFoundError(f"上传不存在: {upload_id}")
+        info.updated_at = time.time()
+        return info
+
+    @staticmethod
+    def parse_handle(value: str) -> Optional[str]:
+        """解析 upload:<id> 句柄，不是句柄时返回 None"""
+        if value.startswith(UPLOAD_SCHEME):
+            return value[len(UPLOAD_SCHEME):]
+        return None
+
+    @staticmethod
+    def resolve(value: str) -> str:
+        """将上传句柄解析为服务器本地路径，普通路径原样返回"""
+        upload_id = UploadManager.parse_handle(value)
+        if upload_id is None:
+            return value
+        return UploadManager.get(upload_id).path
+
+    @staticmethod
+    def is_receiving(path: str) -> bool:
+        """文件是否仍在上传中"""
+        for info in list(UploadManager._uploads.values()):
+            if info.path == path:
+                return info.status in ("created", "receiving")
+        return False
+
+    @staticmethod
+    def write_chunk(upload_id: str, data: bytes):
+        """写入一个数据块，头部数据足够时触发探测（阻塞的文件写入，异步接口在线程池中调用）"""
+        info = UploadManager.get(upload_id)
+        f = UploadManager._files.get(upload_id)
+        if f is None:
+            f = open(info.path, "wb")
+            UploadManager._files[upload_id] = f
+            info.status = "receiving"
+
+        f.write(data)
+        f.flush()
+        previous = info.bytes_received
+        info.bytes_received += len(data)
+        info.updated_at = time.time()
+
+        if (
+            info.media_type == "video"
+            and previous < PROBE_BYTES <= info.bytes_received
+        ):
+            UploadManager._executor.submit(UploadManager._probe_and_prewarm, upload_id)
+
+    @staticmethod
+    def complete_upload(upload_id: str) -> UploadInfo:
+        """结束上传"""
+        info = UploadManager.get(upload_id)
+        f = UploadManager._files.pop(upload_id, None)
+        if f is not None:
+            f.close()
+
+        info.status = "completed"
+        info.completed_at = time.time()
+
+        # 小文件未达到探测阈值，或头部探测失败（如 moov 在文件末尾），完成后再探测
+        if info.probe is None:
+            UploadManager._probe_and_prewarm(upload_id)
+
+        UploadManager._completed[upload_id].set()
+        print(
+            f"📥 上传完成: {info.filename} ({info.bytes_received / 1024 / 1024:.1f}MB, "
+            f"{info.completed_at - info.created_at:.1f}秒)"
+        )
+        return info
+
+    @staticmethod
+    def fail_upload(upload_id: str, error: str):
+        """标记上传失败并释放资源"""
+        info = UploadManager.get(upload_id)
+        f = UploadManager._files.pop(upload_id, None)
+        if f is not None:
+            f.close()
+        info.status = "error"
+        info.error = error
+        UploadManager._discard_reader(upload_id)
+        UploadManager._completed[upload_id].set()
+
+    @staticmethod
+    def wait_completed(upload_id: str, timeout: Optional[float] = None) -> UploadInfo:
+        """等待上传完成（图片等需要完整文件的素材）"""
+        UploadManager.get(upload_id)
+        if not UploadManager._completed[upload_id].wait(timeout):
+            raise TimeoutError(f"等待上传超时: {upload_id}")
+        info = UploadManager.get(upload_id)
+        if info.status == "error":
+            raise ValueError(f"上传失败: {info.error}")
+        return info
+
+    @staticmethod
+    def _probe_and_prewarm(upload_id: str):
+        """探测容器，成功后启动预解码"""
+        info = UploadManager.get(upload_id)
+        if info.probe is not None:
+            return
+
+        completed = info.status == "completed"
+        try:
+            media = probe_media(
+                info.path,
+                use_cache=completed,
+                keyframes=completed and info.media_type == "video",
+            )
+        except ValueError:
+            # 头部数据不足以解析容器，等待上传完成后重试
+            if completed:
+                info.error = "无法解析媒体文件"
+            return
+
+        if info.media_type == "video" and not media.has_video:
+            info.error = "文件中没有视频流"
+            return
+
+        info.probe = media.to_dict()
+        if info.media_type == "image":
+            return
+        print(f"   🔍 探测完成: {info.filename} {info.probe}")
+
+        prewarm = UploadManager._prewarm
+        if prewarm and upload_id not in UploadManager._readers:
+            UploadManager._readers[upload_id] = UploadManager._executor.submit(
+                VideoReader,
+                info.path,
+                prewarm["width"],
+                prewarm["height"],
+                prewarm["fps"],
+                prewarm["width"] * prewarm["height"] * 3,
+                prewarm["trim_duration"],
+                follow=not completed,
+                media_info=media if completed else None,
+            )
+
+    @staticmethod
+    def claim_reader(path: str, width: int, height: int, fps: float, trim_duration: float):
+        """取走与渲染参数匹配的预热解码器，没有时返回 None"""
+        with UploadManager._lock:
+            upload_id = next(
+                (uid for uid, info in UploadManager._uploads.items() if info.path == path),
+                None,
+            )
+            future = UploadManager._readers.pop(upload_id, None) if upload_id else None
+            if upload_id:
+                UploadManager._uploads[upload_id].updated_at = time.time()
+        if future is None:
+            return None
+
+        try:
+            reader = future.result()
+        except Exception as e:
+            print(f"   ⚠️  预解码失败: {e}")
+            return None
+
+        if (
+            (reader.width, reader.height, reader.fps) != (width, height, fps)
+            or reader.trim_duration < trim_duration
+            or reader.first_frame_buffer is None
+        ):
+            reader.close()
+            return None
+
+        print(f"   ♻️  复用预解码器: {Path(path).name}")
+        return reader
+
+    @staticmethod
+    def _discard_reader(upload_id: str):
+        """关闭未被使用的预热解码器"""
+        future = UploadManager._readers.pop(upload_id, None)
+        if future is not None:
+            future.add_done_callback(
+                lambda f: f.exception() is None and f.result().close()
+            )
+
+    @staticmethod
+    def cleanup_upload(upload_id: str):
+        """删除上传文件和状态"""
+        UploadManager._discard_reader(upload_id)
+        f = UploadManager._files.pop(upload_id, None)
+        if f is not None:
+            f.close()
+        with UploadManager._lock:
+            UploadManager._uploads.pop(upload_id, None)
+            UploadManager._completed.pop(upload_id, None)
+        shutil.rmtree(UPLOAD_DIR / upload_id, ignore_errors=True)
+
+    @staticmethod
+    def expire(now: Optional[float] = None):
+        """清理过期的上传，关闭无人取走的预热解码器"""
+        now = now or time.time()
+        with UploadManager._lock:
+            uploads = list(UploadManager._uploads.values())
+        for info in uploads:
+            if now - info.updated_at > UPLOAD_TTL:
+                print(f"🗑️  上传过期: {info.filename} ({info.upload_id})")
+                UploadManager.cleanup_upload(info.upload_id)
+            elif (
+                info.completed_at is not None
+                and now - info.completed_at > READER_TTL
+                and info.upload_id in UploadManager._readers
+            ):
+                UploadManager._discard_reader(info.upload_id)
+
+    @staticmethod
+    def _ensure_reaper():
+        """启动后台巡检线程"""
+        with UploadManager._lock:
+            if UploadManager._reaper is not None:
+                return
+
+            def _loop():
+                while True:
+                    time.sleep(REAPER_INTERVAL)
+                    try:
+                        UploadManager.expire()
+                    except Exception as e:
+                        print(f"⚠️  上传巡检失败: {e}")
+
+            UploadManager._reaper = threading.Thread(
+                target=_loop, name="upload-reaper", daemon=True
+            )
+            UploadManager._reaper.start()
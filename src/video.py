@@ -2,26 +2,75 @@
 视频处理模块 - FFmpeg 解码和编码
 """
 
-import subprocess
 import ffmpeg
 import os
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from src.media_probe import decoder_threads
+
+
+# 读取增长中文件时的无数据超时（微秒）
+FOLLOW_TIMEOUT_US = 5_000_000
 
 
 class VideoReader:
     """FFmpeg 视频解码器，流式读取帧数据"""
 
-    def __init__(self, filename, width, height, fps, frame_size, trim_duration):
+    def __init__(
+        self,
+        filename,
+        width,
+        height,
+        fps,
+        frame_size,
+        trim_duration,
+        follow=False,
+        media_info=None,
+        start_frame=0,
+    ):
+        """
+        Args:
+            start_frame: 从第几帧开始输出（之前的帧解码后丢弃，帧序号与从头读取一致）
+            follow: 文件仍在写入（流式上传中）时，读到末尾后继续等待新数据
+            media_info: 探测结果（可选），源已匹配目标分辨率/帧率时跳过对应滤镜，
+                并按分辨率和编码选择解码线程数
+        """
         self.filename = filename
         self.frame_size = frame_size
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.trim_duration = trim_duration
         self.last_valid_frame = bytes([0] * frame_size)
         self.eof_reached = False
 
+        input_options = {"ss": 0}
+        if follow:
+            # file 协议 follow 模式：超过 rw_timeout 无新数据才视为结束
+            input_options.update(follow=1, rw_timeout=FOLLOW_TIMEOUT_US)
+        if media_info is not None:
+            input_options["threads"] = decoder_threads(media_info)
+
+        stream = ffmpeg.input(filename, **input_options).filter(
+            "setpts", "PTS-STARTPTS"
+        )
+        if media_info is None or (media_info.width, media_info.height) != (
+            width,
+            height,
+        ):
+            stream = stream.filter("scale", width, height)
+        if (
+            media_info is None
+            or media_info.variable_frame_rate
+            or abs(media_info.fps - fps) > 1e-3
+        ):
+            stream = stream.filter("fps", fps=fps, round="up")
+        if start_frame:
+            stream = stream.trim(start_frame=start_frame).filter("setpts", "PTS-STARTPTS")
+
         self.process = (
-            ffmpeg.input(filename, ss=0)
-            .filter("setpts", "PTS-STARTPTS")
-            .filter("scale", width, height)
-            .filter("fps", fps=fps, round="up")
-            .trim(duration=trim_duration)
+            stream.trim(duration=trim_duration)
             .output("pipe:", format="rawvideo", pix_fmt="rgb24")
             .run_async(pipe_stdout=True, quiet=True)
         )
@@ -63,38 +112,146 @@ class VideoReader:
             try:
                 self.process.wait(timeout=0.1)
             except:
-                pass
+                # 未读完的解码器（取消、提前结束）不等待自然退出
+                kill_process(self.process)
+                self.process.wait()
+
+
+ENCODER_OPTIONS = {
+    "vcodec": "h264_nvenc",
+    "pix_fmt": "yuv420p",
+    "bitrate": "15M",
+    "preset": "p4",
+    "rc": "cbr",
+    "rc-lookahead": "32",
+    "spatial-aq": "1",
+    "temporal-aq": "1",
+}
+
+# CPU 编码器（无 GPU 环境、等价性检查）：yuv444p + qp 0 无损，避免编码噪声影响对比
+CPU_ENCODER_OPTIONS = {
+    "vcodec": "libx264",
+    "pix_fmt": "yuv444p",
+    "preset": "ultrafast",
+    "qp": "0",
+}
+
+# AUTOVLOG_ENCODER=cpu：服务在无 GPU 环境（压测、CI）中运行时统一使用 CPU 编码器，
+# 档位和降级中的 NVENC 专用参数不再生效
+USE_CPU_ENCODER = os.getenv("AUTOVLOG_ENCODER", "nvenc").lower() == "cpu"
+
+
+@dataclass
+class Rendition:
+    """附加输出规格（与主输出共用同一帧流）"""
+
+    name: str
+    width: int
+    height: int
+    bitrate: str = "6M"
+    vcodec: str = "h264_nvenc"
+    options: dict = field(default_factory=dict)
+
+    def output_options(self, base_options):
+        """生成该规格的编码参数：同编码器时继承主输出参数，否则只保留通用参数"""
+        if self.vcodec == base_options.get("vcodec"):
+            options = dict(base_options)
+        else:
+            options = {"vcodec": self.vcodec, "pix_fmt": base_options["pix_fmt"]}
+        options["bitrate"] = self.bitrate
+        options.update({key: str(value) for key, value in self.options.items()})
+        return options
+
+
+def rendition_path(path, name):
+    """附加输出文件路径：在主输出文件名后追加规格名"""
+    path = Path(path)
+    return str(path.with_name(f"{path.stem}_{name}{path.suffix}"))
+
 
+def create_encoder(
+    width, height, fps, output_path, encoder_options=None, renditions=None
+):
+    """创建 FFmpeg NVENC 编码器
 
-def create_encoder(width, height, fps, output_path):
-    """创建 FFmpeg NVENC 编码器"""
+    Args:
+        encoder_options: 覆盖默认编码参数（如渲染档位中的 preset/bitrate）
+        renditions: [(Rendition, 输出路径), ...]，在同一编码进程中通过 split + scale
+            生成附加分辨率，帧只需渲染一次
+    """
     print("🎥 启动编码器...")
-    return (
-        ffmpeg.input(
-            "pipe:", format="rawvideo", pix_fmt="rgb24", s=f"{width}x{height}", r=fps
+    options = dict(ENCODER_OPTIONS)
+    if USE_CPU_ENCODER:
+        options = dict(CPU_ENCODER_OPTIONS)
+    elif encoder_options:
+        vcodec = encoder_options.get("vcodec")
+        if vcodec and vcodec != options["vcodec"]:
+            # 更换编码器时不继承 NVENC 专用参数
+            options = {"vcodec": vcodec, "pix_fmt": options["pix_fmt"]}
+        options.update({key: str(value) for key, value in encoder_options.items()})
+
+    stream = ffmpeg.input(
+        "pipe:", format="rawvideo", pix_fmt="rgb24", s=f"{width}x{height}", r=fps
+    )
+    if not renditions:
+        return (
+            stream.output(output_path, **options)
+            .overwrite_output()
+            .run_async(pipe_stdin=True, quiet=True)
         )
-        .output(
-            output_path,
-            vcodec="h264_nvenc",
-            pix_fmt="yuv420p",
-            bitrate="15M",
-            preset="p4",
-            rc="cbr",
-            **{"rc-lookahead": "32", "spatial-aq": "1", "temporal-aq": "1"},
+
+    branches = stream.filter_multi_output("split", len(renditions) + 1)
+    outputs = [branches[0].output(output_path, **options)]
+    for i, (rendition, path) in enumerate(renditions, start=1):
+        print(f"   ↳ {rendition.name}: {rendition.width}x{rendition.height} @ {rendition.bitrate}")
+        outputs.append(
+            branches[i]
+            .filter("scale", rendition.width, rendition.height, flags="bicubic")
+            .output(
+                path,
+                **(dict(options) if USE_CPU_ENCODER else rendition.output_options(options)),
+            )
         )
+    return (
+        ffmpeg.merge_outputs(*outputs)
         .overwrite_output()
         .run_async(pipe_stdin=True, quiet=True)
     )
 
 
-def merge_audio(video_path, bgm_path, output_path):
-    """合并 BGM 到视频"""
+def kill_process(process):
+    """终止 ffmpeg 进程（可在其它线程中调用，用于打断阻塞的管道读写）"""
+    try:
+        if process.poll() is None:
+            process.kill()
+    except OSError:
+        pass
+
+
+def abort_encoder(encoder):
+    """终止编码器并回收进程（取消或失败时使用，输出文件不完整）"""
+    kill_process(encoder)
+    try:
+        encoder.stdin.close()
+    except OSError:
+        pass
+    encoder.wait()
+
+
+def merge_audio(video_path, bgm_path, output_key, store):
+    """合并 BGM 并写入输出存储，返回访问地址
+
+    Args:
+        video_path: 无声视频（合成后删除）
+        bgm_path: 背景音乐
+        output_key: 输出文件名（对象键）
+        store: 输出存储（src.output_store）
+    """
     if not os.path.exists(bgm_path):
-        os.rename(video_path, output_path)
-        return
+        return store.put_file(video_path, output_key)
 
     print("🎵 合成 BGM...")
-    subprocess.run(
+    url = store.write_ffmpeg(
         [
             "ffmpeg",
             "-y",
@@ -117,9 +274,8 @@ def merge_audio(video_path, bgm_path, output_path):
             "-shortest",
             "-fflags",
             "+genpts",
-            output_path,
         ],
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
+        output_key,
     )
     os.remove(video_path)
+    return url
@@ -0,0 +1,193 @@
+"""
+任务工作目录 - 每个渲染任务独占一个目录存放中间文件
+
+无声中间视频、各规格的中间文件和分块拼接结果只在任务内部使用，写完即被封装进成品。
+Workspace 为每个任务创建独立目录（不同任务的中间文件互不覆盖）：
+- 默认放在 tmpfs（/dev/shm）中，中间文件不经过磁盘；按任务估算的中间文件大小在容量内预留额度，
+  额度或 tmpfs 剩余空间不足时退回磁盘目录
+- 任务结束（完成、失败或取消）时删除目录并释放额度；进程异常退出留下的目录在下次创建工作目录时清理
+- 成品通过输出存储发布（本地存储先写临时文件再改名，跨文件系统时同样原子替换）
+
+- AUTOVLOG_WORKSPACE_DIR: tmpfs 工作目录（默认 /dev/shm/autovlog）
+- AUTOVLOG_WORKSPACE_DISK_DIR: 退回的磁盘工作目录（默认 /tmp/autovlog_jobs）
+- AUTOVLOG_WORKSPACE_TMPFS_MB: tmpfs 中所有任务的中间文件容量（默认 2048；0 表示只使用磁盘）
+"""
+
+import os
+import uuid
+import shutil
+import threading
+from pathlib import Path
+from typing import Optional
+
+
+WORKSPACE_DIR = Path(os.getenv("AUTOVLOG_WORKSPACE_DIR", "/dev/shm/autovlog"))
+WORKSPACE_DISK_DIR = Path(
+    os.getenv("AUTOVLOG_WORKSPACE_DISK_DIR", "/tmp/autovlog_jobs")
+)
+WORKSPACE_TMPFS_MB = float(os.getenv("AUTOVLOG_WORKSPACE_TMPFS_MB", "2048"))
+
+# 中间文件大小估算的余量（码率控制的波动、容器开销）
+SIZE_MARGIN = 1.5
+
+# 没有码率参数（如 CPU 无损编码）时按每像素字节数估算
+LOSSLESS_BYTES_PER_PIXEL = 0.75
+
+
+def parse_bitrate(value) -> Optional[float]:
+    """ffmpeg 码率（如 15M、6000k）转换为 bit/s，无法解析时返回 None"""
+    if value is None:
+        return None
+    text = str(value).strip().lower()
+    scale = {"k": 1e3, "m": 1e6, "g": 1e9}.get(text[-1:], 1)
+    try:
+        return float(text.rstrip("kmg")) * scale
+    except ValueError:
+        return None
+
+
+def intermediate_mb(
+    encoder_options: dict, renditions, seconds: float, width: int, height: int, fps: float
+) -> float:
+    """估算一次渲染的中间文件大小（MB）：主输出和各附加规格按码率 × 时长"""
+    bitrate = parse_bitrate(encoder_options.get("bitrate"))
+    if bitrate is None:
+        size = width * height * LOSSLESS_BYTES_PER_PIXEL * fps * seconds
+    else:
+        size = bitrate / 8 * seconds
+    for rendition in renditions:
+        size += (parse_bitrate(rendition.bitrate) or 0) / 8 * seconds
+    return size * SIZE_MARGIN / 1024 / 1024
+
+
+class Workspace:
+    """单个任务的工作目录"""
+
+    _lock = threading.Lock()
+    _reserved_mb = 0.0  # tmpfs 中已预留的额度
+    _active = 0
+    _swept = False
+    disk_fallbacks = 0
+
+    def __init__(self, path: Path, tmpfs: bool, reserved_mb: float):
+        self.path = path
+        self.tmpfs = tmpfs
+        self.reserved_mb = reserved_mb
+        self._closed = False
+
+    @staticmethod
+    def open(prefix: str, size_mb: float = 0.0) -> "Workspace":
+        """
+        创建工作目录（可用作上下文管理器，退出时删除）
+
+        Args:
+            prefix: 目录名前缀（任务类型）
+            size_mb: 中间文件估算大小，tmpfs 额度不足时使用磁盘目录
+        """
+        Workspace._sweep()
+        tmpfs = Workspace._reserve(size_mb)
+        root = WORKSPACE_DIR if tmpfs else WORKSPACE_DISK_DIR
+        # 目录名包含进程号，进程退出后留下的目录可被识别和清理
+        path = root / f"{os.getpid()}_{prefix}_{uuid.uuid4().hex[:12]}"
+        try:
+            path.mkdir(parents=True)
+        except OSError:
+            if not tmpfs:
+                raise
+            # tmpfs 目录不可用（未挂载、无权限）
+            Workspace._release(size_mb)
+            tmpfs, size_mb = False, 0.0
+            path = WORKSPACE_DISK_DIR / path.name
+            path.mkdir(parents=True)
+        if not tmpfs:
+            with Workspace._lock:
+                Workspace.disk_fallbacks += 1
+        with Workspace._lock:
+            Workspace._active += 1
+        return Workspace(path, tmpfs, size_mb if tmpfs else 0.0)
+
+    def file(self, name: str) -> str:
+        """工作目录中的文件路径"""
+        return str(self.path / name)
+
+    def close(self):
+        """删除工作目录并释放额度（可重复调用）"""
+        if self._closed:
+            return
+        self._closed = True
+        shutil.rmtree(self.path, ignore_errors=True)
+        if self.tmpfs:
+            Workspace._release(self.reserved_mb)
+        with Workspace._lock:
+            Workspace._active -= 1
+
+    def __enter__(self) -> "Workspace":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------- 额度 ----------
+
+    @staticmethod
+    def _reserve(size_mb: float) -> bool:
+        """在 tmpfs 中预留额度，不足时返回 False（使用磁盘）"""
+        if WORKSPACE_TMPFS_MB <= 0:
+            return False
+        try:
+            # 其它工作进程也在使用同一 tmpfs，按实际剩余空间再检查一次
+            free_mb = shutil.disk_usage(WORKSPACE_DIR.parent).free / 1024 / 1024
+        except OSError:
+            return False
+        with Workspace._lock:
+            if (
+                Workspace._reserved_mb + size_mb > WORKSPACE_TMPFS_MB
+                or size_mb > free_mb
+            ):
+                return False
+            Workspace._reserved_mb += size_mb
+        return True
+
+    @staticmethod
+    def _release(size_mb: float):
+        with Workspace._lock:
+            Workspace._reserved_mb = max(Workspace._reserved_mb - size_mb, 0.0)
+
+    @staticmethod
+    def _sweep():
+        """清理已退出进程留下的工作目录（每个进程首次创建工作目录时执行一次）"""
+        with Workspace._lock:
+            if Workspace._swept:
+                return
+            Workspace._swept = True
+        for root in (WORKSPACE_DIR, WORKSPACE_DISK_DIR):
+            if not root.is_dir():
+                continue
+            for path in root.iterdir():
+                pid = path.name.split("_", 1)[0]
+                if pid.isdigit() and not _process_alive(int(pid)):
+                    shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def status() -> dict:
+        """工作目录用量（/api/load）"""
+        with Workspace._lock:
+            return {
+                "tmpfs_dir": str(WORKSPACE_DIR) if WORKSPACE_TMPFS_MB > 0 else None,
+                "tmpfs_capacity_mb": WORKSPACE_TMPFS_MB,
+                "tmpfs_reserved_mb": round(Workspace._reserved_mb, 1),
+                "active": Workspace._active,
+                "disk_fallbacks": Workspace.disk_fallbacks,
+            }
+
+
+def _process_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
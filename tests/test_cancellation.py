@@ -0,0 +1,86 @@
+"""
+协作式取消：取消令牌、截止时间、取消回调和任务登记
+"""
+
+import time
+
+import pytest
+
+from src.cancellation import CancelRegistry, CancelToken, RenderCancelled
+
+
+def test_cancel_token():
+    token = CancelToken()
+    assert not token.cancelled
+    token.raise_if_cancelled()
+
+    token.cancel("客户端断开")
+    token.cancel("重复取消")
+    assert token.cancelled
+    assert token.reason == "客户端断开"
+    with pytest.raises(RenderCancelled) as exc:
+        token.raise_if_cancelled()
+    assert exc.value.reason == "客户端断开"
+
+
+def test_cancel_token_deadline():
+    token = CancelToken(timeout=0.01)
+    time.sleep(0.02)
+    assert token.cancelled
+    assert token.timed_out
+    assert token.reason == "超过截止时间"
+
+
+def test_on_cancel_runs_callback_during_scope():
+    token = CancelToken()
+    calls = []
+    with token.on_cancel(lambda: calls.append("encoder")):
+        token.cancel()
+    assert calls == ["encoder"]
+
+
+def test_on_cancel_unregisters_after_scope():
+    token = CancelToken()
+    calls = []
+    with token.on_cancel(lambda: calls.append("encoder")):
+        pass
+    token.cancel()
+    assert calls == []
+
+
+def test_on_cancel_when_already_cancelled():
+    token = CancelToken()
+    token.cancel()
+    calls = []
+    with token.on_cancel(lambda: calls.append("encoder")):
+        assert calls == ["encoder"]
+
+
+def test_failing_callback_does_not_block_others():
+    token = CancelToken()
+    calls = []
+
+    def fail():
+        raise RuntimeError("进程已退出")
+
+    with token.on_cancel(fail), token.on_cancel(lambda: calls.append("decoder")):
+        token.cancel()
+    assert calls == ["decoder"]
+    assert token.cancelled
+
+
+def test_registry_cancels_all_tokens_of_job():
+    first, second = CancelToken(job_id="job"), CancelToken(job_id="job")
+    with CancelRegistry.scope(first), CancelRegistry.scope(second):
+        assert "job" in CancelRegistry.active()
+        assert CancelRegistry.cancel("job", "用户取消")
+    assert first.reason == second.reason == "用户取消"
+    # 任务结束后注销
+    assert "job" not in CancelRegistry.active()
+    assert not CancelRegistry.cancel("job")
+
+
+def test_registry_ignores_tokens_without_job_id():
+    token = CancelToken()
+    with CancelRegistry.scope(token):
+        assert CancelRegistry.active() == []
@@ -0,0 +1,75 @@
+"""
+分块缓存：内容哈希、缓存键和分块统计
+"""
+
+import hashlib
+import os
+
+import src.segment_cache as segment_cache
+from src.segment_cache import Piece, PieceStats, cache_key, content_hash
+
+
+def test_content_hash_matches_file_content(tmp_path):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"frames")
+    assert content_hash(str(path)) == hashlib.sha1(b"frames").hexdigest()
+
+
+def test_content_hash_missing_file(tmp_path):
+    assert content_hash(str(tmp_path / "missing.mp4")) is None
+
+
+def test_content_hash_cached_until_file_changes(monkeypatch, tmp_path):
+    calls = []
+    real_hash = segment_cache.hash_file
+    monkeypatch.setattr(
+        segment_cache, "hash_file", lambda path: calls.append(path) or real_hash(path)
+    )
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"first")
+
+    first = content_hash(str(path))
+    assert content_hash(str(path)) == first
+    assert len(calls) == 1
+
+    # 内容和修改时间变化后重新计算
+    path.write_bytes(b"second")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert content_hash(str(path)) == hashlib.sha1(b"second").hexdigest()
+    assert len(calls) == 2
+
+
+def test_cache_key_is_deterministic():
+    assert cache_key([1, 2], {"b": 1, "a": 2}) == cache_key([1, 2], {"a": 2, "b": 1})
+    assert cache_key("clip", [1]) != cache_key("clip", [2])
+
+
+def test_cache_key_includes_version(monkeypatch):
+    key = cache_key("clip")
+    monkeypatch.setattr(segment_cache, "CACHE_VERSION", segment_cache.CACHE_VERSION + 1)
+    assert cache_key("clip") != key
+
+
+def make_piece(kind, frames, cached, tmp_path):
+    span = type("Span", (), {"frames": frames})()
+    return Piece(kind, [span], "key", tmp_path, cached=cached)
+
+
+def test_piece_stats(tmp_path):
+    stats = PieceStats()
+    stats.add(make_piece("clip", 20, True, tmp_path))
+    stats.add(make_piece("clip", 30, False, tmp_path))
+    stats.add(make_piece("transition", 10, False, tmp_path))
+
+    other = PieceStats()
+    other.add(make_piece("transition", 10, True, tmp_path))
+    stats.merge(other)
+
+    assert stats.to_dict() == {
+        "pieces": 4,
+        "hits": 2,
+        "frames_reused": 30,
+        "frames_rendered": 40,
+        "kinds": {"clip": [1, 2], "transition": [1, 2]},
+    }
@@ -0,0 +1,220 @@
+"""
+分块缓存与编码器：
+- 分块缓存关闭时（默认）一次渲染只使用一个编码器，整段连续编码
+- plan_pieces 的分块划分和缓存键（内容变化、素材仍在上传、缺少图片键）
+
+使用测试目录中的模板配置（字体、转场文件为占位文件），不依赖仓库中的素材。
+"""
+
+import importlib
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+import src.segment_cache as segment_cache
+import src.api_renderer as api_renderer
+from src.api_renderer import ApiVlogRenderer
+from src.segment_cache import SegmentCache
+from src.upload_manager import UploadManager
+
+
+FIXTURE_CONFIG = """
+global:
+  width: 64
+  height: 36
+  fps: 10
+  image_duration: 2.0
+  video_duration: 3.0
+  transition_duration: 1.0
+templates:
+  fixture:
+    name: "Fixture"
+    border:
+      image_path: "border.png"
+    bgm:
+      path: "bgm.mp3"
+    transitions:
+      - "transitions/fade.glsl"
+      - "transitions/wipe.glsl"
+    font:
+      path: "font.otf"
+      size: 12
+      color: [255, 255, 255, 255]
+      outline_color: [0, 0, 0, 200]
+      outline_width: 1
+    subtitle:
+      template: "{year}-{month}-{day}"
+      typewriter_speed: 3
+      duration: 1.0
+"""
+
+
+@pytest.fixture
+def fixture_dir(monkeypatch, tmp_path):
+    """写入测试模板配置并切换到该目录（TemplateConfig 读取当前目录的 config.yaml）"""
+    (tmp_path / "config.yaml").write_text(FIXTURE_CONFIG, encoding="utf-8")
+    (tmp_path / "font.otf").write_bytes(b"")  # 只检查字体文件是否存在
+    (tmp_path / "transitions").mkdir()
+    for name in ("fade", "wipe"):
+        (tmp_path / "transitions" / f"{name}.glsl").write_text(f"// {name}\n")
+    for name in ("cover.jpg", "v1.mp4", "v2.mp4"):
+        (tmp_path / name).write_bytes(name.encode())
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def renderer(fixture_dir):
+    renderer = ApiVlogRenderer(
+        "fixture",
+        str(fixture_dir / "cover.jpg"),
+        [str(fixture_dir / "v1.mp4"), str(fixture_dir / "v2.mp4")],
+        output_file=str(fixture_dir / "out.mp4"),
+    )
+    # 分块缓存键只使用边框快照，不加载边框图片和字体
+    renderer.image_border_renderer = SimpleNamespace(
+        snapshot="image-border",
+        composite_image_on_border=lambda path, position: b"",
+        composite_key=lambda path, position: "image",
+    )
+    renderer.video_border_renderer = SimpleNamespace(snapshot="video-border")
+    return renderer
+
+
+def compile_fixture_plan(renderer, transitions):
+    return api_renderer.compile_plan(
+        renderer.build_timeline(transitions, renderer.image_path, renderer.video_paths)
+    )
+
+
+def test_segment_cache_disabled_by_default(monkeypatch):
+    monkeypatch.delenv("AUTOVLOG_SEGMENT_CACHE_MB", raising=False)
+    module = importlib.reload(segment_cache)
+    try:
+        assert module.SEGMENT_CACHE_MB == 0
+        assert not module.SegmentCache.enabled()
+    finally:
+        importlib.reload(segment_cache)
+
+
+def test_uncached_render_uses_single_encoder(monkeypatch, renderer):
+    encoders = []
+
+    def create_encoder(width, height, fps, output, options, outputs=()):
+        encoder = SimpleNamespace(
+            pid=os.getpid(),
+            stdin=SimpleNamespace(close=lambda: None),
+            wait=lambda: 0,
+            returncode=0,
+            output=output,
+        )
+        encoders.append(encoder)
+        return encoder
+
+    monkeypatch.setattr(api_renderer, "create_encoder", create_encoder)
+    monkeypatch.setattr(
+        api_renderer, "merge_audio", lambda video, bgm, key, store: store.url(key)
+    )
+    assert not renderer.segment_cache
+
+    executed = []
+    renderer.ctx = object()  # 跳过 GPU 初始化
+    renderer.start_preview = lambda offset=0: None
+
+    def execute_plan(plan, transitions, encoder, **kwargs):
+        executed.append((plan, encoder))
+
+    def render_segments(*args, **kwargs):
+        raise AssertionError("分块缓存关闭时不应按分块渲染")
+
+    renderer.execute_plan = execute_plan
+    renderer.render_segments = render_segments
+    renderer.render()
+
+    assert len(encoders) == 1
+    assert len(executed) == 1
+    plan, encoder = executed[0]
+    assert encoder is encoders[0]
+    # 整个执行计划（图片开场、所有转场和片段主体）送入同一个编码器
+    assert plan.total_frames == sum(span.frames for span in plan.spans)
+    assert len(plan.spans) > 1
+
+
+@pytest.fixture
+def transitions(fixture_dir):
+    return api_renderer.load_transitions(
+        ["transitions/fade.glsl", "transitions/wipe.glsl"]
+    )
+
+
+def test_plan_pieces_groups_image_spans(renderer, transitions, tmp_path):
+    plan = compile_fixture_plan(renderer, transitions)
+    pieces = renderer.plan_pieces(
+        plan, transitions, tmp_path / "pieces", image_key="image", probe=True
+    )
+
+    # 字幕和静态尾部合为一个图片分块，其余每个区间一个分块
+    assert [piece.kind for piece in pieces] == [
+        "image",
+        "transition",
+        "clip",
+        "transition",
+        "clip",
+    ]
+    assert sum(piece.frames for piece in pieces) == plan.total_frames
+    assert all(piece.key is not None for piece in pieces)
+    assert len({piece.key for piece in pieces}) == len(pieces)
+    assert not any(piece.cached for piece in pieces)
+
+
+def test_plan_pieces_keys_follow_clip_content(renderer, transitions, tmp_path):
+    plan = compile_fixture_plan(renderer, transitions)
+    before = renderer.plan_pieces(
+        plan, transitions, tmp_path / "a", image_key="image", probe=True
+    )
+
+    # 修改第二个片段：读取它的分块（入场转场和主体）键变化，其余不变
+    second = Path(renderer.video_paths[1])
+    second.write_bytes(b"changed")
+    stat = second.stat()
+    os.utime(second, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    after = renderer.plan_pieces(
+        plan, transitions, tmp_path / "b", image_key="image", probe=True
+    )
+
+    changed = [a.key != b.key for a, b in zip(before, after)]
+    assert changed == [False, False, False, True, True]
+
+
+def test_plan_pieces_skip_uncacheable(monkeypatch, renderer, transitions, tmp_path):
+    receiving = renderer.video_paths[0]
+    monkeypatch.setattr(
+        UploadManager, "is_receiving", staticmethod(lambda path: path == receiving)
+    )
+    plan = compile_fixture_plan(renderer, transitions)
+    pieces = renderer.plan_pieces(plan, transitions, tmp_path / "pieces", probe=True)
+
+    # 没有图片键：图片分块和图片出发的转场不缓存；第一个片段仍在上传：读取它的分块不缓存
+    assert [piece.key is None for piece in pieces] == [True, True, True, True, False]
+
+
+def test_plan_pieces_probe_does_not_fetch(monkeypatch, renderer, transitions, tmp_path):
+    fetched, probed = [], []
+    monkeypatch.setattr(
+        SegmentCache, "fetch", staticmethod(lambda key, *args: fetched.append(key))
+    )
+    monkeypatch.setattr(
+        SegmentCache,
+        "contains",
+        staticmethod(lambda key, *args: probed.append(key) or True),
+    )
+    plan = compile_fixture_plan(renderer, transitions)
+    pieces = renderer.plan_pieces(
+        plan, transitions, tmp_path / "pieces", image_key="image", probe=True
+    )
+
+    assert not fetched
+    assert probed == [piece.key for piece in pieces]
+    assert all(piece.cached for piece in pieces)
@@ -0,0 +1,70 @@
+"""
+会话导入：拒绝会话ID不是规范 UUID 的会话包（防止写出会话存储根目录）
+"""
+
+import io
+import json
+import tarfile
+import uuid
+
+import pytest
+
+from src.session_manager import SessionManager, SessionMetadata
+from src.session_store import LocalSessionStore
+
+
+def make_archive(path, session_id, members=None):
+    metadata = SessionMetadata(
+        session_id=session_id,
+        template_name="classic",
+        created_at=0.0,
+        total_frames=0,
+        segments=[],
+        status="initialized",
+    )
+    files = {"metadata.json": json.dumps(metadata.to_dict()).encode("utf-8")}
+    files.update(members or {})
+    with tarfile.open(path, "w") as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    store = LocalSessionStore(tmp_path / "sessions")
+    monkeypatch.setattr(SessionManager, "store", staticmethod(lambda: store))
+    return store
+
+
+@pytest.mark.parametrize(
+    "session_id",
+    [
+        "../../escaped",
+        "../" + str(uuid.uuid4()),
+        str(uuid.uuid4()).upper(),
+        str(uuid.uuid4()).replace("-", ""),
+        "",
+    ],
+)
+def test_import_rejects_non_uuid_session_id(store, tmp_path, session_id):
+    archive = tmp_path / "session.tar"
+    make_archive(archive, session_id, {"segments/segment_0.h264": b"payload"})
+
+    with pytest.raises(ValueError):
+        SessionManager.import_session(archive)
+
+    # 会话存储根目录之外没有写入任何文件
+    written = {path.name for path in tmp_path.rglob("*") if path.is_file()}
+    assert written == {"session.tar"}
+
+
+def test_import_accepts_canonical_uuid(store, tmp_path):
+    session_id = str(uuid.uuid4())
+    archive = tmp_path / "session.tar"
+    make_archive(archive, session_id, {"segments/segment_0.h264": b"payload"})
+
+    assert SessionManager.import_session(archive) == session_id
+    assert (tmp_path / "sessions" / session_id / "metadata.json").exists()
+    assert (tmp_path / "sessions" / session_id / "segments" / "segment_0.h264").exists()
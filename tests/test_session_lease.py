@@ -0,0 +1,56 @@
+"""
+会话租约：续期失败时取消渲染，段落不再提交到会话
+"""
+
+import threading
+from types import SimpleNamespace
+
+import src.session_manager as session_manager
+from src.cancellation import CancelToken
+from src.session_manager import SessionManager
+
+
+class FlakyStore:
+    """首次获取租约成功，之后的续期失败"""
+
+    shared = True
+
+    def __init__(self):
+        self.acquired = 0
+        self.released = threading.Event()
+        self.renew_failed = threading.Event()
+
+    def acquire_lease(self, session_id):
+        self.acquired += 1
+        if self.acquired > 1:
+            self.renew_failed.set()
+            raise OSError("存储不可用")
+        return SimpleNamespace(session_id=session_id)
+
+    def release_lease(self, session_id):
+        self.released.set()
+
+
+def test_renew_failure_cancels_token(monkeypatch):
+    store = FlakyStore()
+    monkeypatch.setattr(SessionManager, "store", staticmethod(lambda: store))
+    monkeypatch.setattr(session_manager, "LEASE_TTL", 0.03)
+
+    token = CancelToken()
+    with SessionManager.lease("session", token):
+        assert store.renew_failed.wait(2)
+    # 退出时等待续期线程结束
+    assert token.cancelled
+    assert token.reason == "会话租约续期失败"
+    assert store.acquired == 2  # 续期失败后不再重试
+    assert store.released.is_set()
+
+
+def test_local_store_needs_no_lease(monkeypatch):
+    store = SimpleNamespace(shared=False)
+    monkeypatch.setattr(SessionManager, "store", staticmethod(lambda: store))
+
+    token = CancelToken()
+    with SessionManager.lease("session", token):
+        pass
+    assert not token.cancelled
@@ -0,0 +1,110 @@
+"""
+时间线编译：帧数规则、转场顺序和片段读取范围
+"""
+
+from src.timeline import Timeline, compile_plan
+
+
+def make_timeline(**kwargs):
+    params = dict(
+        image_path="cover.jpg",
+        clip_paths=["v1.mp4", "v2.mp4"],
+        transitions=["fade", "wipe", "zoom"],
+        fps=10,
+        image_frames=20,
+        video_frames=30,
+        trans_frames=10,
+        subtitle_frames=8,
+    )
+    params.update(kwargs)
+    return Timeline(**params)
+
+
+def test_compile_plan_frame_rules():
+    plan = compile_plan(make_timeline())
+
+    assert [(span.kind, span.frames) for span in plan.spans] == [
+        ("image", 8),
+        ("image", 12),
+        ("transition", 10),
+        ("clip", 20),
+        ("transition", 10),
+        ("clip", 20),
+    ]
+    # 区间首尾相接
+    assert [span.start for span in plan.spans] == [0, 8, 20, 30, 50, 60]
+    assert plan.total_frames == 20 + 2 * 30
+    assert plan.duration == 8.0
+    assert plan.frame_counts() == {
+        "image": 20,
+        "transition": 20,
+        "clip": 40,
+        "static": 12,
+        "total": 80,
+    }
+    assert [span.subtitle_frames for span in plan.static_spans()] == [0]
+
+
+def test_compile_plan_transition_sources():
+    plan = compile_plan(make_timeline())
+    transitions = [span for span in plan.spans if span.kind == "transition"]
+
+    assert [(s.from_kind, s.from_clip, s.clip) for s in transitions] == [
+        ("image", None, 0),
+        ("clip", 0, 1),
+    ]
+    # 前一个片段在下一个转场结束后才能关闭
+    assert transitions[1].release_clips == [0]
+    # 非最后一个片段多读取一个转场的帧
+    assert [clip.read_frames for clip in plan.clips] == [40, 30]
+
+
+def test_compile_plan_transition_offset_cycles():
+    plan = compile_plan(
+        make_timeline(clip_paths=["v1.mp4", "v2.mp4", "v3.mp4"], transition_offset=2)
+    )
+    transitions = [span for span in plan.spans if span.kind == "transition"]
+    assert [(s.transition_index, s.transition) for s in transitions] == [
+        (2, "zoom"),
+        (0, "fade"),
+        (1, "wipe"),
+    ]
+
+
+def test_compile_plan_without_image():
+    # 一次性渲染没有图片时，第一个片段没有入场转场，完整播放
+    plan = compile_plan(make_timeline(image_path=None))
+    assert [(span.kind, span.frames) for span in plan.spans] == [
+        ("clip", 30),
+        ("transition", 10),
+        ("clip", 20),
+    ]
+
+
+def test_compile_plan_still_from():
+    # 增量模式：第一个转场从上一段的最后一帧出发
+    plan = compile_plan(
+        make_timeline(image_path=None, clip_paths=["v3.mp4"], still_from=True)
+    )
+    assert [(span.kind, span.from_kind) for span in plan.spans] == [
+        ("transition", "still"),
+        ("clip", None),
+    ]
+    assert plan.total_frames == 30
+
+
+def test_clip_reads_and_subset():
+    plan = compile_plan(make_timeline())
+    reads = plan.clip_reads()
+    # 第二个转场同时读取前一个片段的尾部和下一个片段的开头
+    assert reads[4] == [(0, 30, 10), (1, 0, 10)]
+    assert reads[5] == [(1, 10, 20)]
+
+    # 只保留第二个片段的主体：新建从第 10 帧开始读取的片段源
+    subset = plan.subset([5])
+    assert [span.index for span in subset.spans] == [5]
+    assert len(subset.clips) == 1
+    clip = subset.clips[0]
+    assert (clip.path, clip.start_frame, clip.read_frames) == ("v2.mp4", 10, 20)
+    assert subset.spans[0].clip == 0
+    assert subset.spans[0].release_clips == [0]
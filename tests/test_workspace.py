@@ -0,0 +1,86 @@
+"""
+任务工作目录：中间文件大小估算、tmpfs 额度和退回磁盘
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+import src.workspace as workspace
+from src.workspace import Workspace, intermediate_mb, parse_bitrate
+
+
+MB = 1024 * 1024
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("15M", 15e6), ("6000k", 6e6), ("1.5m", 1.5e6), (800000, 8e5), (None, None), ("auto", None)],
+)
+def test_parse_bitrate(value, expected):
+    assert parse_bitrate(value) == expected
+
+
+def test_intermediate_mb_from_bitrate():
+    size = intermediate_mb({"bitrate": "8M"}, [], 10, 1920, 1080, 25)
+    assert size == pytest.approx(8e6 / 8 * 10 * workspace.SIZE_MARGIN / MB)
+
+
+def test_intermediate_mb_adds_renditions():
+    renditions = [SimpleNamespace(bitrate="2M"), SimpleNamespace(bitrate=None)]
+    base = intermediate_mb({"bitrate": "8M"}, [], 10, 1920, 1080, 25)
+    size = intermediate_mb({"bitrate": "8M"}, renditions, 10, 1920, 1080, 25)
+    assert size - base == pytest.approx(2e6 / 8 * 10 * workspace.SIZE_MARGIN / MB)
+
+
+def test_intermediate_mb_without_bitrate():
+    # 没有码率参数（CPU 无损编码）时按像素估算
+    size = intermediate_mb({}, [], 2, 640, 360, 10)
+    expected = 640 * 360 * workspace.LOSSLESS_BYTES_PER_PIXEL * 10 * 2
+    assert size == pytest.approx(expected * workspace.SIZE_MARGIN / MB)
+
+
+@pytest.fixture
+def roots(monkeypatch, tmp_path):
+    tmpfs, disk = tmp_path / "shm", tmp_path / "disk"
+    monkeypatch.setattr(workspace, "WORKSPACE_DIR", tmpfs)
+    monkeypatch.setattr(workspace, "WORKSPACE_DISK_DIR", disk)
+    monkeypatch.setattr(workspace, "WORKSPACE_TMPFS_MB", 100.0)
+    monkeypatch.setattr(Workspace, "_reserved_mb", 0.0)
+    monkeypatch.setattr(Workspace, "_active", 0)
+    monkeypatch.setattr(Workspace, "_swept", True)
+    monkeypatch.setattr(Workspace, "disk_fallbacks", 0)
+    return tmpfs, disk
+
+
+def test_workspace_reserves_tmpfs(roots):
+    tmpfs, _ = roots
+    with Workspace.open("render", 60) as first:
+        assert first.tmpfs
+        assert first.path.parent == tmpfs
+        assert Workspace.status()["tmpfs_reserved_mb"] == 60
+        assert Workspace.status()["active"] == 1
+        path = first.path
+    # 退出时删除目录并释放额度
+    assert not path.exists()
+    assert Workspace.status()["tmpfs_reserved_mb"] == 0
+    assert Workspace.status()["active"] == 0
+
+
+def test_workspace_falls_back_to_disk(roots):
+    _, disk = roots
+    with Workspace.open("render", 60), Workspace.open("append", 60) as second:
+        # 额度不足时使用磁盘目录，不占用额度
+        assert not second.tmpfs
+        assert second.path.parent == disk
+        assert second.reserved_mb == 0
+        assert Workspace.status()["tmpfs_reserved_mb"] == 60
+        assert Workspace.disk_fallbacks == 1
+
+
+def test_workspace_close_is_idempotent(roots):
+    space = Workspace.open("render", 10)
+    space.close()
+    space.close()
+    assert Workspace.status()["active"] == 0
+    assert Workspace.status()["tmpfs_reserved_mb"] == 0